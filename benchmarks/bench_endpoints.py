@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Time taken to check a search's arguments and build its query string,
+by the compiled Endpoint of Places 1.2 search() and by the code it
+replaced.
+
+Run with: python benchmarks/bench_endpoints.py [number of calls]
+"""
+
+import sys
+import timeit
+from decimal import Decimal as D
+
+from simplegeo.places.places_12 import _SEARCH
+from simplegeo.util import _assert_valid_lat, _assert_valid_lon, is_numeric
+
+
+def inline(lat, lon, radius=None, query=None, category=None, limit=None, start=None):
+    """search()'s checks as they were written out in it."""
+    _assert_valid_lat(lat)
+    _assert_valid_lon(lon)
+    if (radius and not is_numeric(radius)):
+        raise ValueError("Radius must be numeric.")
+    if (query and not isinstance(query, basestring)):
+        raise ValueError("Query must be a string.")
+    if (category and not isinstance(category, basestring)):
+        raise ValueError("Category must be a string.")
+    if (limit and not is_numeric(limit)):
+        raise ValueError("Limit parameter must be numeric.")
+    if (start and not is_numeric(start)):
+        raise ValueError("Start parameter must be numeric.")
+
+    if isinstance(query, unicode):
+        query = query.encode('utf-8')
+    if isinstance(category, unicode):
+        category = category.encode('utf-8')
+
+    kwargs = { }
+    if radius:
+        kwargs['radius'] = radius
+    if query:
+        kwargs['q'] = query
+    if category:
+        kwargs['category'] = category
+    if limit:
+        kwargs['limit'] = limit
+    if start:
+        kwargs['start'] = start
+    return dict(lat=lat, lon=lon), kwargs
+
+def compiled(lat, lon, radius=None, query=None, category=None, limit=None, start=None):
+    return _SEARCH.build((lat, lon), (radius, query, category, limit, start))
+
+
+def main(n=200000, repeat=5):
+    cases = [('Decimal point', (D('37.8'), D('-122.4')), {}),
+             ('float point', (37.8, -122.4), {}),
+             ('all arguments', (37.8, -122.4),
+              dict(radius=2, query=u'caf\xe9', category='Food', limit=25, start=50))]
+    for label, args, kwargs in cases:
+        assert inline(*args, **kwargs) == compiled(*args, **kwargs)
+        for func in (inline, compiled):
+            best = min(timeit.Timer(lambda: func(*args, **kwargs)).repeat(repeat=repeat, number=n))
+            print "%-14s %-9s %6.2f us per call" % (label, func.__name__, best / n * 1e6)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
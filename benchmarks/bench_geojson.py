@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Encoding Records and Features with json.dumps(obj.to_dict()), as
+to_json() used to, next to the direct encoder in simplegeo.geojson.
+
+Run with: python benchmarks/bench_geojson.py [number of objects]
+"""
+
+import sys
+import random
+import timeit
+
+import simplegeo.json as json
+from simplegeo import geojson
+from simplegeo.models import Feature, Record
+
+
+def make_objects(n):
+    random.seed(0)
+    records = [Record('com.example.layer', 'record-%d' % i,
+                      random.uniform(-90, 90), random.uniform(-180, 180),
+                      created=1300000000, name='Record %d' % i, kind='test')
+               for i in xrange(n)]
+    points = [Feature((random.uniform(-90, 90), random.uniform(-180, 180)),
+                      simplegeohandle='SG_%022d_37.000000_-122.000000' % i,
+                      properties={'name': 'Place %d' % i, 'tags': ['coffee', 'wifi']})
+              for i in xrange(n)]
+    polygons = []
+    for i in xrange(n / 10):
+        lat, lon = random.uniform(-80, 80), random.uniform(-170, 170)
+        ring = [(lat + random.uniform(-1, 1), lon + random.uniform(-1, 1))
+                for _ in xrange(50)]
+        ring.append(ring[0])
+        polygons.append(Feature([ring], geomtype='Polygon',
+                                properties={'name': 'Area %d' % i}))
+    return records, points, polygons
+
+
+def report(label, n, func, repeat):
+    best = min(timeit.Timer(func).repeat(repeat=repeat, number=1))
+    print "%-32s %8.2f ms  %10.0f objects/s" % (label, best * 1000, n / best)
+
+
+def main(n=20000, repeat=5):
+    records, points, polygons = make_objects(n)
+    for label, objects in (('records', records), ('point features', points),
+                           ('polygon features', polygons)):
+        report(label + " via to_dict", len(objects),
+               lambda: [json.dumps(o.to_dict()) for o in objects], repeat)
+        report(label + " direct", len(objects),
+               lambda: [o.to_json() for o in objects], repeat)
+    report("collection via to_dict", n,
+           lambda: json.dumps({'type': 'FeatureCollection',
+                               'features': [r.to_dict() for r in records]}), repeat)
+    report("collection direct", n,
+           lambda: geojson.dumps_feature_collection(records), repeat)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
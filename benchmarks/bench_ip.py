@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Time taken to check an IP address, by is_valid_ip() and by the
+ipaddr.IPAddress() check it replaced.
+
+Run with: python benchmarks/bench_ip.py [number of calls]
+"""
+
+import sys
+import timeit
+
+import ipaddr
+
+from simplegeo.util import is_valid_ip
+
+
+def with_ipaddr(ip):
+    """is_valid_ip() as it was."""
+    try:
+        ipaddr.IPAddress(ip)
+    except ValueError:
+        return False
+    else:
+        return True
+
+
+def main(n=100000, repeat=5):
+    cases = [('IPv4', '66.249.66.1'),
+             ('IPv6', '2001:db8:85a3::8a2e:370:7334'),
+             ('not an IP', 'i am not an ip address at all')]
+    for label, ip in cases:
+        assert with_ipaddr(ip) == is_valid_ip(ip)
+        for func in (with_ipaddr, is_valid_ip):
+            best = min(timeit.Timer(lambda: func(ip)).repeat(repeat=repeat, number=n))
+            print "%-10s %-12s %6.2f us per call" % (label, func.__name__, best / n * 1e6)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
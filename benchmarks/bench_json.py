@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Throughput of every registered simplegeo.json codec, decoding in
+both the DECIMAL and FLOAT modes and encoding.
+
+Run with: python benchmarks/bench_json.py [number of features]
+"""
+
+import sys
+import random
+import timeit
+
+import simplegeo.json as json
+from simplegeo.util import json_decode
+
+
+def make_payload(n):
+    """A Places-style FeatureCollection with n points and n/10 polygons."""
+    random.seed(0)
+    features = []
+    for i in xrange(n):
+        features.append({
+            'type': 'Feature',
+            'id': 'SG_%022d' % i,
+            'geometry': {'type': 'Point',
+                         'coordinates': [random.uniform(-180, 180),
+                                         random.uniform(-90, 90)]},
+            'properties': {'name': 'Place %d' % i,
+                           'rating': random.uniform(0, 5),
+                           'tags': ['coffee', 'wifi']}})
+    for i in xrange(n / 10):
+        lon, lat = random.uniform(-170, 170), random.uniform(-80, 80)
+        ring = [[lon + random.uniform(-1, 1), lat + random.uniform(-1, 1)]
+                for _ in xrange(50)]
+        ring.append(ring[0])
+        features.append({
+            'type': 'Feature',
+            'id': 'SG_%022d' % (n + i),
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {'name': 'Area %d' % i}})
+    return json.dumps({'type': 'FeatureCollection', 'features': features})
+
+
+def report(label, size, func, repeat):
+    best = min(timeit.Timer(func).repeat(repeat=repeat, number=1))
+    print "%-28s %8.2f ms  %8.2f MB/s" % (label, best * 1000, size / best)
+
+
+def main(n=1000, repeat=5):
+    payload = make_payload(n)
+    size = len(payload) / 1024.0 / 1024.0
+    decoded = json.loads(payload)
+    print "payload: %d features, %.2f MB" % (n + n / 10, size)
+    try:
+        for codec in json.codecs():
+            json.use_codec(codec.name)
+            for numeric in json.NUMERIC_MODES:
+                report("%s decode (%s)" % (codec.name, numeric), size,
+                       lambda: json_decode(payload, numeric=numeric), repeat)
+            report("%s encode" % (codec.name,), size,
+                   lambda: json.dumps(decoded), repeat)
+    finally:
+        json.use_codec()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Memory use and speed of simplegeo.models.Record, next to the old
+Record which kept its properties in its __dict__.
+
+Run with: python benchmarks/bench_record.py [number of records]
+"""
+
+import sys
+import time
+import timeit
+
+from simplegeo.models import Record
+
+
+class DictRecord(object):
+
+    """Record as it was before it had __slots__."""
+
+    def __init__(self, layer, id, lat, lon, created=None, **kwargs):
+        self.layer = layer
+        self.id = id
+        self.lon = lon
+        self.lat = lat
+        if created is None:
+            self.created = int(time.time())
+        else:
+            self.created = created
+        self.__dict__.update(kwargs)
+
+    def to_dict(self):
+        return {
+            'type': 'Feature',
+            'id': self.id,
+            'created': self.created,
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [self.lon, self.lat],
+            },
+            'properties': dict((k, v) for k, v in self.__dict__.iteritems()
+                                        if k not in ('lon', 'lat', 'id', 'created')),
+        }
+
+
+def make_records(cls, n):
+    return [cls('com.example.layer', 'record-%d' % i, 37.0 + i * 1e-6,
+                -122.0 - i * 1e-6, created=1300000000, name='Record %d' % i,
+                kind='test') for i in xrange(n)]
+
+def size_of(record):
+    """The bytes taken by the record itself and its dicts, not
+    counting the values, which both kinds share."""
+    size = sys.getsizeof(record)
+    if hasattr(record, '__dict__'):
+        size += sys.getsizeof(record.__dict__)
+    if hasattr(record, 'properties') and isinstance(record.properties, dict):
+        size += sys.getsizeof(record.properties)
+    return size
+
+
+def report(label, n, func, repeat):
+    best = min(timeit.Timer(func).repeat(repeat=repeat, number=1))
+    print "%-28s %8.2f ms  %10.0f records/s" % (label, best * 1000, n / best)
+
+
+def main(n=100000, repeat=5):
+    print "%d records" % (n,)
+    for cls in (DictRecord, Record):
+        records = make_records(cls, n)
+        print "%-28s %8d bytes per record" % (cls.__name__ + " size",
+                                              size_of(records[0]))
+        report(cls.__name__ + " construct", n, lambda: make_records(cls, n), repeat)
+        report(cls.__name__ + " to_dict", n,
+               lambda: [r.to_dict() for r in records], repeat)
+        report(cls.__name__ + " attribute read", n,
+               lambda: [r.name for r in records], repeat)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -2,19 +2,32 @@ from _version import __version__
 
 from urlparse import urljoin
 import urllib
-from httplib2 import Http
 import oauth2 as oauth
 import simplegeo.json as json
+import threading
 import warnings
 
 from simplegeo.models import Feature
-from simplegeo.util import json_decode, APIError, SIMPLEGEOHANDLE_RSTR, is_simplegeohandle, to_unicode
+from simplegeo.streaming import ChunkedBody, Http, request_body
+from simplegeo.util import json_decode, APIError, SIMPLEGEOHANDLE_RSTR, is_simplegeohandle, to_unicode, VALIDATE_STRICT, check_validation_policy
 
 # For backwards compatibility with other codebases.
 from simplegeo.util import APIError, DecodeError
 from simplegeo.models import Record
 
 
+def _annotations_body(annotations, private):
+    """Yield the JSON body of an annotate() request, a piece for each
+    type of annotation."""
+    yield '{"annotations": {'
+    first = True
+    for annotation_type, values in annotations.iteritems():
+        piece = '%s: %s' % (json.dumps(annotation_type), json.dumps(values))
+        yield first and piece or ', ' + piece
+        first = False
+    yield '}, "private": %s}' % (json.dumps(private),)
+
+
 # This is arbitrary for now.  Storage URLs are still /0.1/.  Left this in the constructors for future use.
 API_VERSION = '1.0'
 
@@ -24,7 +37,25 @@ class Client(object):
     _use_oauth = True
     realm = "http://api.simplegeo.com"
 
-    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, timeout=None):
+    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, timeout=None, validation=VALIDATE_STRICT, numeric=json.DECIMAL, rate_limiter=None, journal=None):
+        """
+        validation is the policy (see simplegeo.util) applied to
+        Features decoded from API responses. Use VALIDATE_TRUSTED to
+        skip re-checking data which the server has already checked.
+
+        numeric says whether numbers in API responses are decoded as
+        Decimal (json.DECIMAL, the default) or float (json.FLOAT),
+        which is much faster.
+
+        rate_limiter, a simplegeo.concurrency.RateLimiter, if given,
+        holds every request back to the rate it allows. It is shared
+        with the subclients.
+
+        journal, a simplegeo.journal.Journal, if given, has the storage
+        and places writes written to it before they are sent, so that
+        they can be sent again if they don't go through. It is shared
+        with the subclients.
+        """
         self.endpoints = {
             # Shared
             'feature': '1.0/features/%(simplegeohandle)s.json',
@@ -40,17 +71,24 @@ class Client(object):
             self.signature = oauth.SignatureMethod_HMAC_SHA1()
         self.uri = "http://%s:%s" % (host, port)
         self.req_headers = {}
+        self.timeout = timeout
         self.http = Http(timeout=timeout)
         self.headers = {}
+        self._thread = threading.current_thread()
+        self._local = threading.local()
+        self.validation = check_validation_policy(validation)
+        self.numeric = json.check_numeric_mode(numeric)
+        self.rate_limiter = rate_limiter
+        self.journal = journal
 
         # Do not create recursive subclients.
         # Only create subclients if we are running __init__() from Client.
         if not isinstance(self, (ContextClient, PlacesClient,
                                  Places12Client, StorageClient)):
-            self.context = ContextClient(key, secret, host=host, port=port)
-            self.places = PlacesClient(key, secret, host=host, port=port)
-            self.places12 = Places12Client(key, secret, host=host, port=port)
-            self.storage = StorageClient(key, secret, host=host, port=port)
+            self.context = ContextClient(key, secret, host=host, port=port, validation=validation, numeric=numeric, rate_limiter=rate_limiter, journal=journal)
+            self.places = PlacesClient(key, secret, host=host, port=port, validation=validation, numeric=numeric, rate_limiter=rate_limiter, journal=journal)
+            self.places12 = Places12Client(key, secret, host=host, port=port, validation=validation, numeric=numeric, rate_limiter=rate_limiter, journal=journal)
+            self.storage = StorageClient(key, secret, host=host, port=port, validation=validation, numeric=numeric, rate_limiter=rate_limiter, journal=journal)
 
     # For backwards compatibility with the old Storage client.
     def __getattr__(self, name):
@@ -64,6 +102,40 @@ class Client(object):
                       'calling get_most_recent_http_headers().', DeprecationWarning)
         return self.headers
 
+    def _thread_client(self):
+        """
+        Not used directly. Return a client for the calling thread to
+        make requests with. httplib2 connections can't be shared
+        between threads, so every thread but the one which created
+        this client gets a copy of it with an Http of its own. The
+        copy's headers attribute is its own too.
+        """
+        if threading.current_thread() is self._thread:
+            return self
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = object.__new__(self.__class__)
+            client.__dict__.update(self.__dict__)
+            if isinstance(self.http, Http):
+                client.http = Http(timeout=self.timeout)
+            client.headers = {}
+            self._local.client = client
+        return client
+
+    def _journaled(self, op, args, send):
+        """
+        Not used directly. Return send(), having written the write op
+        with args to self.journal first, if there is one, and marked it
+        done there afterwards. A write which raises an exception stays
+        in the journal to be replayed.
+        """
+        if self.journal is None:
+            return send()
+        seq = self.journal.append(op, args)
+        result = send()
+        self.journal.ack(seq)
+        return result
+
     def _endpoint(self, name, **kwargs):
         """Not used directly. Finds and formats the endpoints as needed for any type of request."""
         try:
@@ -87,13 +159,14 @@ class Client(object):
                 raise AssertionError("Zoom must be in the range 1..20")
             kwargs['zoom'] = zoom
         endpoint = self._endpoint('feature', simplegeohandle=simplegeohandle)
-        return Feature.from_json(self._request(endpoint, 'GET', data=kwargs)[1])
+        return Feature.from_json(self._request(endpoint, 'GET', data=kwargs)[1],
+                                 validation=self.validation, numeric=self.numeric)
 
     def get_annotations(self, simplegeohandle):
         if not is_simplegeohandle(simplegeohandle):
             raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
         endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
-        return json_decode(self._request(endpoint, 'GET')[1])
+        return json_decode(self._request(endpoint, 'GET')[1], numeric=self.numeric)
 
     def annotate(self, simplegeohandle, annotations, private):
         if not isinstance(annotations, dict):
@@ -106,13 +179,11 @@ class Client(object):
         if not isinstance(private, bool):
             raise TypeError('private must be of type bool')
 
-        data = {'annotations': annotations,
-                'private': private}
-
         endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
         return json_decode(self._request(endpoint,
                                         'POST',
-                                        data=json.dumps(data))[1])
+                                        data=lambda: _annotations_body(annotations, private))[1],
+                           numeric=self.numeric)
 
     def _request(self, endpoint, method, data=None):
         """
@@ -120,6 +191,12 @@ class Client(object):
         actual request against the API, including passing the
         credentials with oauth.  Returns a tuple of (headers as dict,
         body as string).
+
+        data is a dict of parameters, or the body of the request: a
+        string, an iterable of strings or a file-like object, or a
+        function returning one, which is streamed if it is big (see
+        simplegeo.streaming). Pass a function rather than an iterable
+        so that the body can be sent again if httplib2 retries.
         """
 
         """
@@ -148,7 +225,7 @@ class Client(object):
             if isinstance(data, dict):
                 body = urllib.urlencode(data)
             else:
-                body = data
+                body = request_body(data)
 
         if self._use_oauth:
             request = oauth.Request.from_consumer_and_token(self.consumer,
@@ -162,6 +239,11 @@ class Client(object):
         headers.update(self.req_headers)
         headers['User-Agent'] = 'SimpleGeo Python Client v%s' % (
             __version__)
+        if isinstance(body, ChunkedBody):
+            headers['Transfer-Encoding'] = 'chunked'
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
 
         (self.headers, content) = self.http.request(
             endpoint, method, body=body, headers=headers)
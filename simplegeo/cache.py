@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""Client-side caches for API results.
+
+None of the clients cache anything unless you give them a cache.
+"""
+
+import math
+import time
+import cPickle as pickle
+import threading
+
+from simplegeo import geohash
+from simplegeo.util import KM_PER_DEGREE, ip_network, OrderedDict
+
+# Passed as a ttl, means "the cache's own ttl".
+DEFAULT_TTL = object()
+
+
+class Cache(object):
+
+    """A thread-safe, in-memory cache.
+
+    Entries expire ttl seconds after they are set (never, if ttl is
+    None), and once there are max_entries of them the least recently
+    used ones are dropped. hits, misses and evictions count what
+    happened to lookups and entries.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= self.clock():
+                self.misses += 1
+                return default
+            self._entries[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get(), but doesn't count as a hit or miss or mark the
+        entry as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] <= self.clock()):
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        """Store value under key. ttl, if given, overrides the
+        cache's own; None means the entry never expires."""
+        if ttl is DEFAULT_TTL:
+            ttl = self.ttl
+        expires = ttl is not None and self.clock() + ttl or None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            self._evict()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def dump(self, fp):
+        """Write the entries which haven't expired to the file fp, so
+        that another process can load() them."""
+        now = self.clock()
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._entries.iteritems()
+                       if entry[0] is None or entry[0] > now]
+        pickle.dump(entries, fp, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, fp):
+        """
+        Add the entries written to the file fp by dump(), keeping
+        their expiry times, and return how many there were. Entries
+        which have expired since are skipped. The file is a pickle, so
+        only load ones you wrote yourself.
+        """
+        entries = pickle.load(fp)
+        now = self.clock()
+        n = 0
+        with self._lock:
+            for key, entry in entries:
+                if entry[0] is None or entry[0] > now:
+                    self._entries.pop(key, None)
+                    self._entries[key] = entry
+                    n += 1
+            self._evict()
+        return n
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[0] is None or entry[0] > self.clock())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class GeohashCache(Cache):
+
+    """A cache for Places 1.2 proximity searches.
+
+    Set a Places12Client's search_cache to one of these, and search()
+    will answer queries with a radius from the places in the geohash
+    cells, precision characters long, which the search circle
+    overlaps, fetching (with search_bbox(), up to concurrency at a
+    time) only the cells which aren't cached yet. A cell holding
+    cell_limit places or more (or as many as the server returns for
+    one request, if that's fewer) is assumed to have been truncated by
+    the server, and can't be cached; neither can a search covering more
+    than max_cells cells. Either of those goes to the network instead.
+    """
+
+    def __init__(self, precision=6, cell_limit=100, max_cells=16,
+                 concurrency=4, ttl=3600, max_entries=None,
+                 clock=time.time):
+        Cache.__init__(self, ttl=ttl, max_entries=max_entries, clock=clock)
+        self.precision = precision
+        self.cell_limit = cell_limit
+        self.max_cells = max_cells
+        self.concurrency = concurrency
+
+    def cells(self, lat, lon, radius):
+        """
+        Return the geohashes of the cells overlapping the circle of
+        radius kilometers around lat, lon, or None if there are more
+        than max_cells of them.
+        """
+        lat, lon, radius = float(lat), float(lon), float(radius)
+        dlat = radius / KM_PER_DEGREE
+        coslat = math.cos(math.radians(lat))
+        if abs(lat) + dlat >= 90 or coslat <= 0:
+            return None
+        dlon = dlat / coslat
+        if lon - dlon < -180 or lon + dlon > 180:
+            # Cells on both sides of the antimeridian; not worth it.
+            return None
+        cells = geohash.covering(lat - dlat, lon - dlon, lat + dlat,
+                                 lon + dlon, self.precision)
+        if len(cells) > self.max_cells:
+            return None
+        return cells
+
+    def key(self, cell, query, category):
+        return (cell, query, category)
+
+
+
+class ContextCache(Cache):
+
+    """A cache for Context lookups.
+
+    Set a ContextClient's context_cache to one of these, and
+    get_context() will treat every point which rounds to the same
+    precision decimal places (3 is about 100 meters) as the same
+    point, as long as the filter and context_args are the same too.
+
+    Each top level section of a response (features, weather,
+    demographics, ...) expires ttl seconds after it was fetched, or
+    after section_ttls[section] seconds if that's given. When only
+    some sections have expired, and those can be asked for with
+    filter, only they are fetched again.
+
+    The responses handed out share their sections with the cache, so
+    don't modify them.
+    """
+
+    def __init__(self, precision=3, ttl=86400, section_ttls=None,
+                 max_entries=None, clock=time.time):
+        Cache.__init__(self, ttl=ttl, max_entries=max_entries, clock=clock)
+        self.precision = precision
+        self.section_ttls = section_ttls or {}
+        self.stale = 0
+
+    def quantize(self, lat, lon):
+        return (round(float(lat), self.precision),
+                round(float(lon), self.precision))
+
+    def key(self, lat, lon, filter=None, context_args=None):
+        return self.quantize(lat, lon) + (
+            filter or None, tuple(sorted((context_args or {}).items())))
+
+    def lookup(self, key):
+        """
+        Return (response, stale), where stale lists the sections of
+        the cached response which have expired and response is the
+        rest of it. A response which isn't cached at all gives (None,
+        None).
+        """
+        with self._lock:
+            sections = self.get(key)
+            if sections is None:
+                return None, None
+            now = self.clock()
+            response = {}
+            stale = []
+            for name, (expires, value) in sections.iteritems():
+                if expires is not None and expires <= now:
+                    stale.append(name)
+                else:
+                    response[name] = value
+            if stale:
+                self.stale += 1
+            return response, stale
+
+    def store(self, key, response):
+        """Cache the sections of response, adding them to any which
+        are already cached for key."""
+        now = self.clock()
+        with self._lock:
+            sections = dict(self.peek(key) or {})
+            for name, value in response.iteritems():
+                ttl = self.section_ttls.get(name, self.ttl)
+                sections[name] = (ttl is not None and now + ttl or None, value)
+            ttls = [self.section_ttls.get(name, self.ttl) for name in sections]
+            if None in ttls:
+                ttl = None
+            else:
+                ttl = max(ttls)
+            self.set(key, sections, ttl=ttl)
+
+    def stats(self):
+        stats = Cache.stats(self)
+        stats['stale'] = self.stale
+        return stats
+
+
+class LayerCache(Cache):
+
+    """A cache for storage layer metadata.
+
+    Set a StorageClient's layer_cache to one of these, and get_layer()
+    and get_layers() will answer from it until the layers expire, ttl
+    seconds after they were fetched. Each layer in a get_layers()
+    listing is cached for get_layer() too. create_layer(),
+    update_layer() and delete_layer() on the same client drop the
+    layer, and every cached listing, as they change them; changes made
+    anywhere else only show once the entries expire.
+
+    The layers handed out are shared with the cache, so don't modify
+    them.
+    """
+
+    def __init__(self, ttl=300, max_entries=None, clock=time.time):
+        Cache.__init__(self, ttl=ttl, max_entries=max_entries, clock=clock)
+        self.invalidations = 0
+
+    def listing_key(self, kwargs):
+        return ('layers',) + tuple(sorted(kwargs.items()))
+
+    def store_listing(self, key, response):
+        with self._lock:
+            self.set(key, response)
+            for layer in response.get('layers') or []:
+                if isinstance(layer, dict) and layer.get('name'):
+                    self.set(layer['name'], layer)
+
+    def invalidate(self, name):
+        """Drop the layer called name and all the listings."""
+        with self._lock:
+            self._entries.pop(name, None)
+            for key in [key for key in self._entries if isinstance(key, tuple)]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        stats = Cache.stats(self)
+        stats['invalidations'] = self.invalidations
+        return stats
+
+
+class IPCache(Cache):
+
+    """A cache for lookups by IP address.
+
+    Set a ContextClient's or Places12Client's ip_cache to one of
+    these, and get_context_by_ip() and search_by_ip() will treat every
+    address in the same network as the same address, as long as the
+    other arguments are the same too. A network is the first
+    v4_prefix bits of an IPv4 address (24 is a /24, like 10.1.2.x)
+    and the first v6_prefix bits of an IPv6 one. Both clients can
+    share one.
+
+    The responses handed out are shared with the cache, so don't
+    modify them.
+    """
+
+    def __init__(self, v4_prefix=24, v6_prefix=48, ttl=86400,
+                 max_entries=100000, clock=time.time):
+        Cache.__init__(self, ttl=ttl, max_entries=max_entries, clock=clock)
+        self.v4_prefix = v4_prefix
+        self.v6_prefix = v6_prefix
+
+    def network(self, ip):
+        """Return the network of ip, raising a ValueError if it isn't
+        an IP address."""
+        return ip_network(ip, self.v4_prefix, self.v6_prefix)
+
+    def key(self, ip, name, *args):
+        """The key for the lookup name of ip with the other arguments
+        args, which must be hashable."""
+        return (name, self.network(ip)) + args
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""Thread helpers for running API requests concurrently.
+
+The requests themselves spend nearly all their time waiting on the
+network, so plain threads are enough. Clients are not thread-safe;
+code running in a worker thread should use client._thread_client().
+"""
+
+import sys
+import time
+import threading
+import Queue
+from collections import deque
+
+from simplegeo.util import split_bbox
+
+
+class Task(object):
+
+    """The eventual result of a call submitted to a Pool."""
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._done = threading.Event()
+        self._value = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            self._value = self.func(*self.args, **self.kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self):
+        """Wait for the call to finish, and return its result or
+        re-raise its exception."""
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+
+class Pool(object):
+
+    """A fixed number of daemon threads running submitted calls in
+    the order they were submitted."""
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1, not %r" % (size,))
+        self.size = size
+        self._tasks = Queue.Queue()
+        self._threads = []
+        for i in range(size):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            task.run()
+
+    def submit(self, func, *args, **kwargs):
+        task = Task(func, args, kwargs)
+        self._tasks.put(task)
+        return task
+
+    def close(self):
+        """Let the threads exit once the calls already submitted are
+        done. Doesn't wait for them."""
+        for thread in self._threads:
+            self._tasks.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RateLimiter(object):
+
+    """
+    Spaces calls out to rate per second on average, letting up to
+    burst of them through at once after a quiet spell. Give one to a
+    client as its rate_limiter and every request it makes, from any
+    thread, waits its turn.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.time, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive, not %r" % (rate,))
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a call may be made. Returns the seconds waited."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Taking the token even if it isn't there yet queues the
+            # callers up behind each other.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            self.sleep(wait)
+            return wait
+        return 0
+
+
+def imap(func, iterable, concurrency=1):
+    """
+    Like itertools.imap(), but calls func in up to concurrency threads
+    at once. Results are yielded in the order of iterable, and
+    iterable is consumed lazily: no more than concurrency calls are
+    ever waiting for their results to be taken, so it may be a
+    generator of any length. An exception from func is raised when its
+    result's turn comes.
+    """
+    if concurrency <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    pending = deque()
+    pool = Pool(concurrency)
+    try:
+        for item in iterable:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.close()
+
+
+def imap_distinct(func, items, key=None, concurrency=1):
+    """
+    Like imap(), but calls func only once for each distinct key(item)
+    (the item itself if key is None), with the first item which has
+    it; items with the same key get the same result object, or the
+    same exception. items is consumed lazily, but the result for each
+    distinct key is kept until the end.
+    """
+    tasks = {}
+    pending = deque()
+    pool = None
+    if concurrency > 1:
+        pool = Pool(concurrency)
+    try:
+        for item in items:
+            k = item if key is None else key(item)
+            task = tasks.get(k)
+            if task is None:
+                if pool is None:
+                    task = Task(func, (item,), {})
+                    task.run()
+                else:
+                    task = pool.submit(func, item)
+                tasks[k] = task
+            pending.append(task)
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def fetch_tiles(fetch, bbox, rows=2, cols=2, concurrency=1, is_dense=None,
+                max_depth=0):
+    """
+    Split bbox, a (sw_lat, sw_lon, ne_lat, ne_lon) tuple, into a grid
+    of rows x cols tiles and call fetch(*tile) for each of them, in up
+    to concurrency threads. Yields (tile, result) pairs as they come
+    in. A tile for which is_dense(result) is true is split into four
+    and each quarter fetched too, down to max_depth levels below the
+    grid; the dense tile's own result is still yielded.
+    """
+    pending = deque()
+    pool = Pool(max(concurrency, 1))
+    def submit(tiles, depth):
+        for tile in tiles:
+            pending.append((tile, depth, pool.submit(fetch, *tile)))
+    try:
+        submit(split_bbox(*bbox, rows=rows, cols=cols), 0)
+        while pending:
+            tile, depth, task = pending.popleft()
+            result = task.result()
+            if depth < max_depth and is_dense is not None and is_dense(result):
+                submit(split_bbox(*tile), depth + 1)
+            yield tile, result
+    finally:
+        pool.close()
@@ -2,8 +2,25 @@ import urllib
 
 from simplegeo.util import (json_decode, is_valid_lat, is_valid_lon,
                             _assert_valid_lat, _assert_valid_lon,
-                            is_valid_ip)
+                            merge_features, ip_network)
 from simplegeo import Client as ParentClient
+from simplegeo import geohash
+from simplegeo.concurrency import imap, imap_distinct, fetch_tiles
+from simplegeo import endpoints
+from simplegeo.endpoints import Endpoint, Param, FILTER, CONTEXT_ADDRESS
+
+
+# The sections of a context response which can be asked for by name
+# with the filter argument.
+FILTERABLE_SECTIONS = ('features', 'weather', 'demographics',
+                       'intersections', 'address')
+
+_CONTEXT = Endpoint('context', [endpoints.lat('lat'), endpoints.lon('lon')], [FILTER])
+_CONTEXT_BY_IP = Endpoint('context_by_ip', [endpoints.ip('ip')], [FILTER])
+_CONTEXT_BY_MY_IP = Endpoint('context_by_my_ip', [], [FILTER])
+_CONTEXT_BY_ADDRESS = Endpoint('context_by_address', [], [CONTEXT_ADDRESS, FILTER])
+_CONTEXT_FROM_BBOX = Endpoint('context_from_bbox', [Param('sw_lat'), Param('sw_lon'),
+                                                    Param('ne_lat'), Param('ne_lon')])
 
 
 class Client(ParentClient):
@@ -21,47 +38,142 @@ class Client(ParentClient):
 
         self.endpoints.update(map(lambda x: (x[0], api_version+x[1]), context_endpoints))
 
-    def _prepare_kwargs(self, **kwargs):
-        if 'context_args' in kwargs and kwargs['context_args']:
-            context_args = kwargs['context_args']
-            del kwargs['context_args']
-            kwargs.update(context_args)
-        # Filter out entries with empty values.
-        kwargs = dict((k, v) for k, v in kwargs.iteritems() if v)
-        return kwargs
+        # Set this to a simplegeo.cache.ContextCache to have
+        # get_context() reuse answers for nearby points.
+        self.context_cache = None
+        # Set this to a simplegeo.cache.IPCache to have
+        # get_context_by_ip() reuse answers for addresses in the same
+        # network.
+        self.ip_cache = None
 
     def get_context(self, lat, lon, filter=None, context_args=None):
-        _assert_valid_lat(lat)
-        _assert_valid_lon(lon)
+        if self.context_cache is not None:
+            # Only for the checks.
+            _CONTEXT.build((lat, lon), (filter,))
+            return self._cached_context(lat, lon, filter, context_args)
 
-        if (filter and not isinstance(filter, basestring)):
-            raise ValueError("Query must be a string.")
+        result = _CONTEXT.request(self, (lat, lon), (filter,), context_args)[1]
+        return json_decode(result, numeric=self.numeric)
 
-        kwargs = self._prepare_kwargs(
-            filter=filter,
-            context_args=context_args)
-
-        endpoint = self._endpoint('context', lat=lat, lon=lon)
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-        return json_decode(result)
+    def _cached_context(self, lat, lon, filter, context_args):
+        """
+        Not used directly. get_context() by way of self.context_cache,
+        fetching only the sections which aren't cached, if that can be
+        done with a filter.
+        """
+        cache = self.context_cache
+        key = cache.key(lat, lon, filter, context_args)
+        response, stale = cache.lookup(key)
+        if response is not None and not stale:
+            return response
+
+        fetch_filter = filter
+        if stale and all(section in FILTERABLE_SECTIONS for section in stale):
+            fetch_filter = ','.join(stale)
+        result = _CONTEXT.request(self, (lat, lon), (fetch_filter,), context_args)[1]
+        fresh = json_decode(result, numeric=self.numeric)
+        cache.store(key, fresh)
+        if response is None:
+            return fresh
+        response.update(fresh)
+        return response
+
+    def get_context_many(self, points, filter=None, context_args=None,
+                         concurrency=4, precision=None, raise_on_error=True):
+        """
+        Return a list of get_context() results, one for each of the
+        (lat, lon) pairs in points, in the same order. Each distinct
+        point is only looked up once; if precision is given, points
+        which round to the same precision decimal places count as the
+        same point too, and get the same result object. The lookups
+        run up to concurrency at a time, in geohash order, so that
+        nearby points are looked up together.
+
+        A point whose lookup fails has the exception in its place. If
+        raise_on_error is true, the first of those is raised once all
+        the lookups are done instead, with the list as its results
+        attribute.
+        """
+        points = list(points)
+        keys = []
+        for lat, lon in points:
+            _assert_valid_lat(lat)
+            _assert_valid_lon(lon)
+            if precision is None:
+                keys.append((lat, lon))
+            else:
+                keys.append((round(float(lat), precision),
+                             round(float(lon), precision)))
+
+        unique = {}
+        for key, point in zip(keys, points):
+            unique.setdefault(key, point)
+        ordered = sorted(unique, key=lambda key: geohash.encode(key[0], key[1], 12))
+
+        def fetch(key):
+            lat, lon = unique[key]
+            try:
+                return self._thread_client().get_context(
+                    lat, lon, filter=filter, context_args=context_args)
+            except Exception, e:
+                return e
+
+        results = dict(zip(ordered, imap(fetch, ordered, concurrency)))
+        results = [results[key] for key in keys]
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    result.results = results
+                    raise result
+        return results
 
     def get_context_by_ip(self, ipaddr, filter=None, context_args=None):
         """ The server uses guesses the latitude and longitude from
         the ipaddr and then does the same thing as get_context(),
         using that guessed latitude and longitude."""
-
-        if not is_valid_ip(ipaddr):
-            raise ValueError("Address %s is not a valid IP" % ipaddr)
-        if (filter and not isinstance(filter, basestring)):
-            raise ValueError("Query must be a string.")
-
-        kwargs = self._prepare_kwargs(
-            filter=filter,
-            context_args=context_args)
-
-        endpoint = self._endpoint('context_by_ip', ip=ipaddr)
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-        return json_decode(result)
+        cache = self.ip_cache
+        if cache is not None:
+            # Only for the checks.
+            _CONTEXT_BY_IP.build((ipaddr,), (filter,))
+            key = cache.key(ipaddr, 'context', filter or None,
+                            tuple(sorted((context_args or {}).items())))
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+        result = _CONTEXT_BY_IP.request(self, (ipaddr,), (filter,), context_args)[1]
+        response = json_decode(result, numeric=self.numeric)
+        if cache is not None:
+            cache.set(key, response)
+        return response
+
+    def get_context_by_ip_many(self, ips, filter=None, context_args=None,
+                               concurrency=4):
+        """
+        Yield a get_context_by_ip() result for each of the addresses in
+        ips, in the same order, or the exception the lookup raised.
+        Each distinct address is only looked up once, or with an
+        ip_cache, each distinct network; addresses looked up together
+        get the same result object. The lookups run up to concurrency
+        at a time.
+        """
+        if self.ip_cache is None:
+            to_network = ip_network
+        else:
+            to_network = self.ip_cache.network
+        def network(ip):
+            try:
+                return to_network(ip)
+            except ValueError:
+                # Looked up on its own, to fail with its own error.
+                return ip
+        def fetch(ip):
+            try:
+                return self._thread_client().get_context_by_ip(
+                    ip, filter=filter, context_args=context_args)
+            except Exception, e:
+                return e
+        return imap_distinct(fetch, ips, key=network, concurrency=concurrency)
 
     def get_context_by_my_ip(self, filter=None, context_args=None):
         """ The server gets the IP address from the HTTP connection
@@ -69,17 +181,8 @@ class Client(ParentClient):
         NAT, or HTTP proxy device between you and the server), and
         then does the same thing as get_context_by_ip(), using that IP
         address."""
-
-        if (filter and not isinstance(filter, basestring)):
-            raise ValueError("Query must be a string.")
-
-        kwargs = self._prepare_kwargs(
-            filter=filter,
-            context_args=context_args)
-
-        endpoint = self._endpoint('context_by_my_ip')
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-        return json_decode(result)
+        result = _CONTEXT_BY_MY_IP.request(self, (), (filter,), context_args)[1]
+        return json_decode(result, numeric=self.numeric)
 
     def get_context_by_address(self, address, filter=None, context_args=None):
         """
@@ -87,20 +190,8 @@ class Client(ParentClient):
         street address and then does the same thing as get_context(),
         using that deduced latitude and longitude.
         """
-
-        if not isinstance(address, basestring):
-            raise ValueError("Address must be a string.")
-        if (filter and not isinstance(filter, basestring)):
-            raise ValueError("Query must be a string.")
-
-        kwargs = self._prepare_kwargs(
-            address=address,
-            filter=filter,
-            context_args=context_args)
-
-        endpoint = self._endpoint('context_by_address')
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-        return json_decode(result)
+        result = _CONTEXT_BY_ADDRESS.request(self, (), (address, filter), context_args)[1]
+        return json_decode(result, numeric=self.numeric)
 
     def get_context_from_bbox(self, sw_lat, sw_lon, ne_lat, ne_lon, **kwargs):
         """
@@ -114,11 +205,35 @@ class Client(ParentClient):
         responses, so the order here is (minlat, minlon, maxlat, maxlon).
         """
 
-        kwargs = self._prepare_kwargs(
-            context_args=kwargs)
+        result = _CONTEXT_FROM_BBOX.request(
+            self, (sw_lat, sw_lon, ne_lat, ne_lon), (), kwargs)[1]
+        return json_decode(result, numeric=self.numeric)
 
-        endpoint = self._endpoint('context_from_bbox',
-                                  sw_lat=sw_lat, sw_lon=sw_lon,
-                                  ne_lat=ne_lat, ne_lon=ne_lon)
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-        return json_decode(result)
+    def get_context_from_bbox_tiled(self, sw_lat, sw_lon, ne_lat, ne_lon,
+                                    rows=2, cols=2, tile_limit=None,
+                                    max_depth=2, concurrency=4, **kwargs):
+        """
+        Like get_context_from_bbox(), but for boxes too big for one
+        request. The box is split into a grid of rows x cols tiles
+        which are fetched concurrently. If tile_limit is given, any
+        tile which comes back with at least that many features (so was
+        probably truncated) is split into four and fetched again, down
+        to max_depth levels. Returns a dict whose 'features' are those
+        of all the tiles, deduped.
+        """
+        _assert_valid_lat(sw_lat)
+        _assert_valid_lat(ne_lat)
+        _assert_valid_lon(sw_lon)
+        _assert_valid_lon(ne_lon)
+
+        def fetch(*tile):
+            return self._thread_client().get_context_from_bbox(*tile, **kwargs)
+        def is_dense(result):
+            return len(result.get('features') or []) >= tile_limit
+
+        tiles = fetch_tiles(fetch, (sw_lat, sw_lon, ne_lat, ne_lon),
+                            rows=rows, cols=cols, concurrency=concurrency,
+                            is_dense=tile_limit and is_dense or None,
+                            max_depth=max_depth)
+        return {'features': merge_features(result.get('features') or []
+                                           for tile, result in tiles)}
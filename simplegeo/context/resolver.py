@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""Answering Context questions locally.
+
+A LocalContext holds the polygon features of a region, fetched once
+with get_context_from_bbox(), and works out which of them contain a
+point without asking the server. Features whose outline isn't known
+(the bbox endpoint usually only returns their bounds) can't be
+answered for; they are kept in unresolved, and listed in every answer
+whose point is within their bounds, so you can tell when an answer may
+be missing something.
+"""
+
+from simplegeo.util import (APIError, is_simplegeohandle,
+                            _assert_valid_lat, _assert_valid_lon)
+from simplegeo.concurrency import imap
+
+POLYGON_TYPES = ('Polygon', 'MultiPolygon')
+
+
+def _float_rings(geometry):
+    """Return the geometry's polygons as lists of rings of (lon, lat)
+    float pairs."""
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    else:
+        polygons = geometry['coordinates']
+    return [[[(float(lon), float(lat)) for lon, lat in ring] for ring in polygon]
+            for polygon in polygons]
+
+def _bounds(polygons):
+    lons = [lon for polygon in polygons for lon, lat in polygon[0]]
+    lats = [lat for polygon in polygons for lon, lat in polygon[0]]
+    return (min(lons), min(lats), max(lons), max(lats))
+
+def point_in_polygons(lon, lat, polygons):
+    """
+    Return whether lon, lat is inside any of polygons, each a list of
+    rings as given by GeoJSON: the outline first, then any holes.
+    Points exactly on an edge may go either way.
+    """
+    for polygon in polygons:
+        inside = False
+        for ring in polygon:
+            x1, y1 = ring[-1]
+            for x2, y2 in ring:
+                if (y1 > lat) != (y2 > lat) and \
+                   lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+                x1, y1 = x2, y2
+        if inside:
+            return True
+    return False
+
+
+class GridIndex(object):
+
+    """
+    Finds the items whose bounds (min_lon, min_lat, max_lon, max_lat)
+    might contain a point, by filing them under every cell of a grid of
+    size x size cells over bbox which their bounds overlap.
+    """
+
+    def __init__(self, bbox, size=64):
+        self.sw_lat, self.sw_lon, self.ne_lat, self.ne_lon = map(float, bbox)
+        self.size = size
+        self._cell_height = (self.ne_lat - self.sw_lat) / size or 1.0
+        self._cell_width = (self.ne_lon - self.sw_lon) / size or 1.0
+        self._cells = {}
+
+    def _row(self, lat):
+        return min(max(int((lat - self.sw_lat) / self._cell_height), 0), self.size - 1)
+
+    def _col(self, lon):
+        return min(max(int((lon - self.sw_lon) / self._cell_width), 0), self.size - 1)
+
+    def insert(self, bounds, item):
+        min_lon, min_lat, max_lon, max_lat = bounds
+        if max_lat < self.sw_lat or min_lat > self.ne_lat or \
+           max_lon < self.sw_lon or min_lon > self.ne_lon:
+            return
+        for row in range(self._row(min_lat), self._row(max_lat) + 1):
+            for col in range(self._col(min_lon), self._col(max_lon) + 1):
+                self._cells.setdefault((row, col), []).append((bounds, item))
+
+    def query(self, lat, lon):
+        """Return the items whose bounds contain lat, lon."""
+        return [item for (min_lon, min_lat, max_lon, max_lat), item
+                in self._cells.get((self._row(lat), self._col(lon)), ())
+                if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat]
+
+
+class LocalContext(object):
+
+    """
+    Answers get_context() for points in bbox, a (sw_lat, sw_lon,
+    ne_lat, ne_lon) tuple, from features, a list of context features
+    covering it. A feature with a Polygon or MultiPolygon 'geometry'
+    (in GeoJSON order) is resolved: it's in an answer whenever the
+    point is inside it. Any other feature goes in unresolved.
+    """
+
+    def __init__(self, features, bbox, grid_size=64):
+        for lat in bbox[0::2]:
+            _assert_valid_lat(lat)
+        for lon in bbox[1::2]:
+            _assert_valid_lon(lon)
+        self.bbox = bbox
+        self.resolved = []
+        self.unresolved = []
+        self._polygons = GridIndex(bbox, grid_size)
+        self._bounds = GridIndex(bbox, grid_size)
+        for feature in features:
+            geometry = feature.get('geometry')
+            if geometry and geometry.get('type') in POLYGON_TYPES:
+                polygons = _float_rings(geometry)
+                self._polygons.insert(_bounds(polygons), (feature, polygons))
+                self.resolved.append(feature)
+            else:
+                self.unresolved.append(feature)
+                if feature.get('bounds'):
+                    self._bounds.insert(map(float, feature['bounds']), feature)
+
+    @classmethod
+    def prefetch(cls, client, sw_lat, sw_lon, ne_lat, ne_lon,
+                 fetch_geometry=True, concurrency=4, grid_size=64, **kwargs):
+        """
+        Fetch the features in the box with the ContextClient client's
+        get_context_from_bbox_tiled() (kwargs are passed on to it) and
+        return a LocalContext for them. If fetch_geometry is true, the
+        outline of each feature which comes without one but has a
+        handle is fetched with get_feature(), concurrency at a time;
+        features whose outline can't be fetched stay unresolved.
+        """
+        features = client.get_context_from_bbox_tiled(
+            sw_lat, sw_lon, ne_lat, ne_lon, concurrency=concurrency,
+            **kwargs)['features']
+        if fetch_geometry:
+            def fetch(feature):
+                handle = feature.get('handle')
+                if feature.get('geometry') or not is_simplegeohandle(handle or ''):
+                    return feature
+                try:
+                    geometry = client._thread_client().get_feature(handle).to_dict()['geometry']
+                except APIError:
+                    return feature
+                return dict(feature, geometry=geometry)
+            features = list(imap(fetch, features, concurrency))
+        return cls(features, (sw_lat, sw_lon, ne_lat, ne_lon), grid_size=grid_size)
+
+    def contains(self, lat, lon):
+        """Return whether lat, lon is inside the prefetched region."""
+        sw_lat, sw_lon, ne_lat, ne_lon = self.bbox
+        return sw_lat <= lat <= ne_lat and sw_lon <= lon <= ne_lon
+
+    def features_at(self, lat, lon):
+        """Return the resolved features containing lat, lon."""
+        lat, lon = float(lat), float(lon)
+        return [feature for feature, polygons in self._polygons.query(lat, lon)
+                if point_in_polygons(lon, lat, polygons)]
+
+    def unresolved_at(self, lat, lon):
+        """Return the unresolved features whose bounds contain lat,
+        lon, any of which might contain it too."""
+        return self._bounds.query(float(lat), float(lon))
+
+    def get_context(self, lat, lon):
+        """
+        Return a dict like the 'features' part of a get_context()
+        response for lat, lon, with the unresolved features which
+        might also contain the point under 'unresolved'. Raises
+        ValueError if the point is outside the prefetched region.
+        """
+        _assert_valid_lat(lat)
+        _assert_valid_lon(lon)
+        if not self.contains(lat, lon):
+            raise ValueError("%s,%s is outside the prefetched region %s" % (lat, lon, ','.join(map(str, self.bbox))))
+        return {'query': {'latitude': lat, 'longitude': lon},
+                'features': self.features_at(lat, lon),
+                'unresolved': self.unresolved_at(lat, lon)}
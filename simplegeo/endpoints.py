@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""Declarations of the arguments API endpoints take.
+
+Each search method used to check and encode its own arguments, in a
+block of code much the same as every other one's. Now an Endpoint
+lists the parameters in its URL path and its query string, and
+builds a request's URL and query string out of a call's arguments:
+
+    SEARCH = Endpoint('search', [endpoints.lat('lat'), endpoints.lon('lon')],
+                      [RADIUS, QUERY, CATEGORY, LIMIT, START])
+    ...
+    headers, body = SEARCH.request(client, (lat, lon),
+                                   (radius, query, category, limit, start))
+
+Each Endpoint compiles a build() function of its own out of its
+Params when it is made (see Endpoint._compile()), so a call costs no
+more than the checks written out by hand did, and latitudes and
+longitudes are checked in a way that is much quicker for Decimals.
+"""
+
+from decimal import Decimal
+
+from simplegeo.util import is_valid_ip, is_numeric, _NUMERIC_TYPES
+
+
+def _between(low, high):
+    """
+    Return a check which does what is_valid_lat() and is_valid_lon()
+    do, for the range [low..high], but quicker for Decimals: comparing
+    a Decimal is slow, so it is turned into a float first, and only
+    compared exactly if that lands on or outside the edge.
+    """
+    def check(value):
+        kind = type(value)
+        if kind is float or kind is int:
+            return low <= value <= high
+        if kind is Decimal and low < float(value) < high:
+            return True
+        return isinstance(value, _NUMERIC_TYPES) and low <= value <= high
+    return check
+
+def _is_string(value):
+    return isinstance(value, basestring)
+
+def _is_nonempty_string(value):
+    return isinstance(value, basestring) and bool(value.strip())
+
+
+class Param(object):
+
+    """
+    A parameter of an endpoint, called key in its URL or query
+    string. A value for which check(value) is false raises a
+    ValueError of message % {'value': value}. In a query string, a
+    false value (None, '', 0) is left out, and only checked if it is
+    required; utf8 says whether unicode values are encoded as UTF-8.
+    """
+
+    def __init__(self, key, check=None, message=None, utf8=False,
+                 required=False):
+        self.key = key
+        self.check = check
+        self.message = message
+        self.utf8 = utf8
+        self.required = required
+
+    def __repr__(self):
+        return "Param(%r)" % (self.key,)
+
+
+def lat(key):
+    return Param(key, _between(-90, 90), "not a valid lat: %(value)s")
+
+def lon(key):
+    return Param(key, _between(-360, 360), "not a valid lon (strict=False): %(value)s")
+
+def ip(key):
+    return Param(key, is_valid_ip, "Address %(value)s is not a valid IP")
+
+RADIUS = Param('radius', is_numeric, "Radius must be numeric.")
+QUERY = Param('q', _is_string, "Query must be a string.", utf8=True)
+CATEGORY = Param('category', _is_string, "Category must be a string.", utf8=True)
+LIMIT = Param('limit', is_numeric, "Limit parameter must be numeric.")
+START = Param('start', is_numeric, "Start parameter must be numeric.")
+NUM = Param('num', is_numeric, "Num parameter must be numeric.")
+ADDRESS = Param('address', _is_nonempty_string, "Address must be a non-empty string.",
+                utf8=True, required=True)
+# Context lookups have always taken a filter and an address with
+# checks of their own.
+FILTER = Param('filter', _is_string, "Query must be a string.")
+CONTEXT_ADDRESS = Param('address', _is_string, "Address must be a string.",
+                        required=True)
+
+
+class Endpoint(object):
+
+    """
+    The endpoint called name in a client's endpoints, with the Params
+    filled into its URL, path, and those sent in its query string,
+    query. Values for them are passed in the same order.
+    """
+
+    def __init__(self, name, path=(), query=()):
+        self.name = name
+        self.path = tuple(path)
+        self.query = tuple(query)
+        self.build = self._compile()
+
+    def _compile(self):
+        """
+        Return build(path_values=(), query_values=(), extra=None),
+        which checks path_values and query_values and returns a dict
+        of the path parameters and one of the query string. extra, a
+        dict, is added to the query string last, and then any false
+        values in it are left out.
+
+        build() is written out as Python source for this endpoint's
+        Params and compiled, the way collections.namedtuple() makes
+        its classes, so that a call runs straight through the checks
+        with no looping over Params or looking up their settings.
+        """
+        namespace = {}
+        lines = ['def build(path_values=(), query_values=(), extra=None):',
+                 '    path = {}']
+        if self.path:
+            lines.append('    %s, = path_values' % (
+                    ', '.join('p%d' % i for i in range(len(self.path))),))
+        for i, param in enumerate(self.path):
+            if param.check is not None:
+                namespace['p%d_check' % i] = param.check
+                namespace['p%d_message' % i] = param.message
+                lines.append('    if not p%d_check(p%d): '
+                             'raise ValueError(p%d_message %% {"value": p%d})' % (i, i, i, i))
+            lines.append('    path[%r] = p%d' % (param.key, i))
+        lines.append('    query = {}')
+        if self.query:
+            lines.append('    %s, = query_values' % (
+                    ', '.join('q%d' % i for i in range(len(self.query))),))
+        for i, param in enumerate(self.query):
+            if param.check is not None:
+                namespace['q%d_check' % i] = param.check
+                namespace['q%d_message' % i] = param.message
+                check = ('if not q%d_check(q%d): '
+                         'raise ValueError(q%d_message %% {"value": q%d})' % (i, i, i, i))
+                if param.required:
+                    lines.append('    ' + check)
+            lines.append('    if q%d:' % (i,))
+            if param.check is not None and not param.required:
+                lines.append('        ' + check)
+            if param.utf8:
+                lines.append('        if isinstance(q%d, unicode): '
+                             'q%d = q%d.encode("utf-8")' % (i, i, i))
+            lines.append('        query[%r] = q%d' % (param.key, i))
+        lines.extend(['    if extra:',
+                      '        query.update(extra)',
+                      '        query = dict((k, v) for k, v in query.iteritems() if v)',
+                      '    return path, query'])
+        exec '\n'.join(lines) in namespace
+        return namespace['build']
+
+    def request(self, client, path_values=(), query_values=(), extra=None,
+                method='GET'):
+        """Check the arguments and make the request with client.
+        Returns a tuple of (headers as dict, body as string)."""
+        path, query = self.build(path_values, query_values, extra)
+        return client._request(client._endpoint(self.name, **path), method,
+                               data=query)
+
+    def __repr__(self):
+        return "Endpoint(%r)" % (self.name,)
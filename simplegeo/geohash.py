@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Geohash encoding.
+
+A geohash names a cell of a grid laid over the world; each extra
+character splits the cell 32 ways, so nearby points share a prefix.
+See http://en.wikipedia.org/wiki/Geohash
+"""
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_BASE32_INDEX = dict((c, i) for i, c in enumerate(_BASE32))
+
+def encode(lat, lon, precision=6):
+    """Return the geohash, precision characters long, of the cell
+    containing lat, lon."""
+    lat, lon = float(lat), float(lon)
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    n = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            value, interval = lon, lon_range
+        else:
+            value, interval = lat, lat_range
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            interval[0] = mid
+        else:
+            bits = bits << 1
+            interval[1] = mid
+        even = not even
+        n += 1
+        if n == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            n = 0
+    return ''.join(chars)
+
+def bbox(geohash):
+    """Return the cell named by geohash as (sw_lat, sw_lon, ne_lat,
+    ne_lon)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        try:
+            value = _BASE32_INDEX[c]
+        except KeyError:
+            raise ValueError("not a valid geohash: %r" % (geohash,))
+        for shift in (4, 3, 2, 1, 0):
+            interval = even and lon_range or lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return (lat_range[0], lon_range[0], lat_range[1], lon_range[1])
+
+def cell_size(precision):
+    """Return the (height, width) in degrees of cells with geohashes
+    precision characters long."""
+    lon_bits = (5 * precision + 1) / 2
+    lat_bits = 5 * precision / 2
+    return (180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits))
+
+def covering(sw_lat, sw_lon, ne_lat, ne_lon, precision=6):
+    """Return the geohashes of all the cells which overlap a box."""
+    height, width = cell_size(precision)
+    sw_lat, sw_lon = max(float(sw_lat), -90.0), max(float(sw_lon), -180.0)
+    ne_lat, ne_lon = min(float(ne_lat), 90.0), min(float(ne_lon), 180.0)
+    # Walk the centres of the cells, starting from the one the south
+    # west corner is in.
+    first = bbox(encode(sw_lat, sw_lon, precision))
+    cells = []
+    lat = first[0] + height / 2
+    while lat - height / 2 <= ne_lat and lat < 90.0:
+        lon = first[1] + width / 2
+        while lon - width / 2 <= ne_lon and lon < 180.0:
+            cells.append(encode(lat, lon, precision))
+            lon += width
+        lat += height
+    return cells
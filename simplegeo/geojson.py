@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""Writing GeoJSON for Records and Features directly.
+
+json.dumps(obj.to_dict()) builds a whole tree of dicts and lists first
+(deep copying a Feature's properties and swapping every one of its
+coordinate pairs on the way) only to throw it away again. The
+functions here write exactly the same bytes straight from the objects:
+the fixed parts of each document come from templates, and the rest is
+written as it is read, with json.dumps() only called on values it
+can't write itself.
+"""
+
+from decimal import Decimal
+import copy
+import re
+
+import simplegeo.json as json
+from simplegeo.util import _NUMERIC_TYPES
+
+_INFINITY = float('inf')
+# Strings which json.dumps() would write out unchanged between quotes.
+_plain = re.compile(r'[\x20\x21\x23-\x5b\x5d-\x7e]*\Z').match
+
+
+def _template(fields):
+    """
+    Return a %-format string for a JSON object with the given
+    (name, value) fields, which puts them in the order json.dumps()
+    would for a dict built by inserting them in that order.
+    """
+    values = dict(fields)
+    return '{%s}' % ', '.join('"%s": %s' % (name, values[name]) for name in values)
+
+_RECORD = _template([('type', '"Feature"'), ('id', '%(id)s'),
+                     ('created', '%(created)s'), ('geometry', '%(geometry)s'),
+                     ('properties', '%(properties)s')])
+_POINT = _template([('type', '"Point"'), ('coordinates', '[%(lon)s, %(lat)s]')])
+_FEATURE = _template([('type', '"Feature"'), ('geometry', '%(geometry)s'),
+                      ('properties', '%(properties)s')])
+_FEATURE_WITH_ID = _template([('type', '"Feature"'), ('geometry', '%(geometry)s'),
+                              ('properties', '%(properties)s'), ('id', '%(id)s')])
+_GEOMETRY = _template([('type', '%(type)s'), ('coordinates', '%(coordinates)s')])
+_COLLECTION = _template([('type', '"FeatureCollection"'), ('features', '[%(features)s]')])
+_COLLECTION_HEAD, _COLLECTION_TAIL = _COLLECTION.split('%(features)s')
+
+
+def encode_string(value):
+    if isinstance(value, basestring) and _plain(value):
+        return '"%s"' % (str(value),)
+    return json.dumps(value)
+
+# Object keys repeat from one record to the next, so their encodings
+# are kept.
+_MAX_KEYS = 10000
+_keys = {}
+
+def _key(key):
+    """Return key encoded, with the ': ' after it."""
+    encoded = _keys.get(key)
+    if encoded is None:
+        if type(key) is not str and type(key) is not unicode:
+            return None
+        encoded = encode_string(key) + ': '
+        if len(_keys) < _MAX_KEYS:
+            _keys[key] = encoded
+    return encoded
+
+def _number_encoder():
+    """Return a function writing numbers as the current JSON encoder
+    would."""
+    encoder = json.get_encoder()
+    if encoder.name not in ('simplejson', 'json'):
+        return json.dumps
+    exact_decimal = encoder.exact_decimal
+    def encode_number(value):
+        kind = type(value)
+        if kind is float:
+            if value != value or value == _INFINITY or value == -_INFINITY:
+                return json.dumps(value)
+            return repr(value)
+        if kind is int or kind is long:
+            return str(value)
+        if kind is Decimal and exact_decimal:
+            return str(value)
+        return json.dumps(value)
+    return encode_number
+
+def _value(value, number, copied=False):
+    """
+    Write any JSON value, falling back on json.dumps() for anything
+    which isn't plain. If copied is true, the members of objects are
+    written in the order they would have after copy.deepcopy(), which
+    to_dict() uses on a Feature's properties; that can be different.
+    """
+    kind = type(value)
+    if kind is str or kind is unicode:
+        if _plain(value):
+            return '"%s"' % (str(value),)
+        return json.dumps(value)
+    if value is None:
+        return 'null'
+    if kind is bool:
+        return value and 'true' or 'false'
+    if kind is dict:
+        if copied:
+            # Inserting the keys one at a time, as deepcopy() does,
+            # lays them out the same way; the values needn't be copied.
+            keys = dict.fromkeys(iter(value))
+        else:
+            keys = value
+        items = []
+        for k in keys:
+            key = _key(k)
+            if key is None:
+                if copied:
+                    value = copy.deepcopy(value)
+                return json.dumps(value)
+            v = value[k]
+            if type(v) is str and _plain(v):
+                items.append('%s"%s"' % (key, v))
+            else:
+                items.append(key + _value(v, number, copied))
+        return '{%s}' % ', '.join(items)
+    if kind is list or kind is tuple:
+        return '[%s]' % ', '.join([_value(item, number, copied) for item in value])
+    return number(value)
+
+def _pair(pair, number, swap):
+    if len(pair) != 2:
+        raise ValueError("Strucs must be (val, val)")
+    first, second = pair
+    if not isinstance(second, _NUMERIC_TYPES):
+        raise ValueError("Strucs must contain numerics.")
+    if swap:
+        first, second = second, first
+    # Most coordinates are floats; skip the call for those.
+    if type(first) is float and type(second) is float and \
+       -_INFINITY < first < _INFINITY and -_INFINITY < second < _INFINITY:
+        return '[%r, %r]' % (first, second)
+    return '[%s, %s]' % (number(first), number(second))
+
+def _coordinates(coordinates, number, swap):
+    """Write GeoJSON coordinates, swapping each pair if swap is true,
+    as util.deep_swap() does."""
+    if isinstance(coordinates[0], _NUMERIC_TYPES):
+        return _pair(coordinates, number, swap)
+    if isinstance(coordinates[0][0], _NUMERIC_TYPES):
+        return '[%s]' % ', '.join([_pair(pair, number, swap) for pair in coordinates])
+    return '[%s]' % ', '.join([_coordinates(sub, number, swap) for sub in coordinates])
+
+
+def dumps_record(record):
+    """Return the same JSON as json.dumps(record.to_dict())."""
+    number = _number_encoder()
+    created = record.created
+    return _RECORD % {
+        'id': encode_string(record.id),
+        'created': _value(created, number),
+        'geometry': _POINT % {'lon': number(record.lon), 'lat': number(record.lat)},
+        'properties': _value(dict(record.properties, layer=record.layer), number),
+        }
+
+def _feature(feature, number, coordinates):
+    values = {
+        'geometry': _GEOMETRY % {
+            'type': encode_string(feature.geomtype),
+            'coordinates': coordinates},
+        'properties': _value(feature.properties, number, True),
+        }
+    if hasattr(feature, 'id'):
+        values['id'] = encode_string(feature.id)
+        return _FEATURE_WITH_ID % values
+    return _FEATURE % values
+
+def dumps_feature(feature):
+    """Return the same JSON as json.dumps(feature.to_dict())."""
+    number = _number_encoder()
+    return _feature(feature, number, _coordinates(feature.coordinates, number, True))
+
+def iter_feature(feature):
+    """
+    Yield the same JSON as dumps_feature(feature) in pieces, one for
+    each ring or polygon of its coordinates, so that a big outline
+    needn't be written out all at once.
+    """
+    number = _number_encoder()
+    # JSON strings can't hold a raw NUL, so it can only be this one.
+    head, tail = _feature(feature, number, '\0').split('\0')
+    coordinates = feature.coordinates
+    if isinstance(coordinates[0], _NUMERIC_TYPES):
+        yield head + _pair(coordinates, number, True) + tail
+        return
+    yield head + '['
+    first = True
+    for sub in coordinates:
+        if isinstance(sub[0], _NUMERIC_TYPES):
+            piece = _pair(sub, number, True)
+        else:
+            piece = _coordinates(sub, number, True)
+        yield first and piece or ', ' + piece
+        first = False
+    yield ']' + tail
+
+def iter_feature_collection(encoded):
+    """Yield the pieces of a FeatureCollection of encoded, an iterable
+    of features already encoded as JSON."""
+    yield _COLLECTION_HEAD
+    first = True
+    for feature in encoded:
+        yield first and feature or ', ' + feature
+        first = False
+    yield _COLLECTION_TAIL
+
+def dumps_feature_collection(items):
+    """
+    Return the same JSON as json.dumps() of a FeatureCollection dict of
+    the to_dict()s of items, which are Records and Features.
+    """
+    return ''.join(iter_feature_collection(item.to_json() for item in items))
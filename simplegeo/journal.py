@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""A write-ahead journal for storage and places writes.
+
+Give a Client a Journal, and add_records() (each batch of it),
+delete_record(), add_feature() and update_feature() write what they
+are about to do to the journal before they send it, and mark it done
+once the server has taken it. If the process dies in between, or the
+request fails, the write is still in the journal, and replay() sends
+it again:
+
+    journal = Journal('writes.journal')
+    client = Client(key, secret, journal=journal)
+    journal.replay(client)  # whatever an earlier run didn't finish
+
+The journal is a file of JSON lines which is only ever appended to:
+an entry for each write and an acknowledgement for each one done.
+Every line is handed to the operating system as it is written, so a
+crash of the process loses nothing, but the file is only fsynced
+every sync_every entries or sync_interval seconds, so a crash of the
+whole machine can lose the writes of that last stretch. Once
+compact_after writes have been acknowledged the file is rewritten
+with only the ones which haven't.
+
+Replaying a write sends it again, and the server may have taken it
+the first time. That is harmless for everything but add_feature(),
+which can create the feature twice. A write which the server turns
+down as it is, with a 4xx status, would only fail again, so replay()
+moves it to the file at path + '.rejected' instead.
+"""
+
+import os
+import time
+import threading
+
+import simplegeo.json as json
+from simplegeo.models import Feature
+from simplegeo.util import APIError, OrderedDict
+
+# How to send each kind of write again, with a top level Client. The
+# client methods these call don't write to the journal.
+_REPLAY = {
+    'add_records': lambda client, args: client.storage._post_records(
+        args['layer'], [json.dumps(feature) for feature in args['features']]),
+    'delete_record': lambda client, args: client.storage._delete_record(
+        args['layer'], args['id']),
+    'add_feature': lambda client, args: client.places._add_feature(
+        Feature.from_dict(args['feature'], validation=client.places.validation)),
+    'update_feature': lambda client, args: client.places._update_feature(
+        Feature.from_dict(args['feature'], validation=client.places.validation)),
+    }
+
+def rejected(error):
+    """Whether the server turned a write down for good, rather than
+    for now (timeouts, rate limiting, 5xx errors)."""
+    return (isinstance(error, APIError) and error.code is not None and
+            400 <= error.code < 500 and error.code not in (408, 429))
+
+
+class Journal(object):
+
+    """An append-only journal of writes in the file at path, which is
+    created if it doesn't exist. It can be shared between threads."""
+
+    def __init__(self, path, sync_every=100, sync_interval=1.0,
+                 compact_after=10000, clock=time.time):
+        self.path = path
+        self.rejected_path = path + '.rejected'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._pending = OrderedDict()
+        self._seq = 0
+        self._acked = 0
+        self._unsynced = 0
+        self._synced_at = clock()
+        self._read()
+        self._fp = open(path, 'ab')
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return
+        fp = open(self.path, 'rb')
+        end = 0
+        try:
+            for line in fp:
+                if not line.endswith('\n'):
+                    # The start of a line which was being written when
+                    # the process died; it's cut off below, so that
+                    # the next entry starts on a line of its own.
+                    break
+                end += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'ack' in entry:
+                    if self._pending.pop(entry['ack'], None) is not None:
+                        self._acked += 1
+                else:
+                    self._pending[entry['seq']] = line.rstrip('\n')
+                    self._seq = max(self._seq, entry['seq'])
+        finally:
+            fp.close()
+        if end < os.path.getsize(self.path):
+            fp = open(self.path, 'r+b')
+            try:
+                fp.truncate(end)
+            finally:
+                fp.close()
+
+    def _write(self, line):
+        self._fp.write(line + '\n')
+        self._fp.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or \
+           self.clock() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """fsync everything written so far."""
+        with self._lock:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._unsynced = 0
+            self._synced_at = self.clock()
+
+    def append(self, op, args):
+        """
+        Write an entry for the write op, with args, a dict or a string
+        of JSON, and return its sequence number, which ack() takes
+        once the write is done.
+        """
+        if not isinstance(args, basestring):
+            args = json.dumps(args)
+        with self._lock:
+            self._seq += 1
+            line = '{"seq": %d, "op": %s, "args": %s}' % (self._seq, json.dumps(op), args)
+            self._write(line)
+            self._pending[self._seq] = line
+            return self._seq
+
+    def ack(self, seq):
+        """Mark the write seq as done."""
+        with self._lock:
+            if self._pending.pop(seq, None) is None:
+                return
+            self._write('{"ack": %d}' % (seq,))
+            self._acked += 1
+            if self._acked >= self.compact_after and self._acked > len(self._pending):
+                self.compact()
+
+    def pending(self):
+        """Return the writes which haven't been acknowledged, as a
+        list of (seq, op, args)."""
+        with self._lock:
+            lines = self._pending.values()
+        entries = [json.loads(line) for line in lines]
+        return [(entry['seq'], entry['op'], entry['args']) for entry in entries]
+
+    def replay(self, client):
+        """
+        Send the writes which haven't been acknowledged again, in the
+        order they were made, with the Client client, and acknowledge
+        the ones which go through. Ones which the server rejects with
+        a 4xx status are written to rejected_path, with the status,
+        and acknowledged too. Returns a dict of the numbers
+        'replayed', 'rejected' and 'failed'.
+        """
+        summary = {'replayed': 0, 'rejected': 0, 'failed': 0}
+        for seq, op, args in self.pending():
+            try:
+                _REPLAY[op](client, args)
+            except (APIError, EnvironmentError), e:
+                if rejected(e):
+                    self.reject(seq, e.code)
+                    summary['rejected'] += 1
+                else:
+                    summary['failed'] += 1
+                continue
+            self.ack(seq)
+            summary['replayed'] += 1
+        return summary
+
+    def reject(self, seq, code):
+        """Write the entry seq to rejected_path, with the status code
+        the server turned it down with, and acknowledge it."""
+        with self._lock:
+            line = self._pending.get(seq)
+            if line is None:
+                return
+            fp = open(self.rejected_path, 'ab')
+            try:
+                fp.write('{"code": %d, "entry": %s}\n' % (code, line))
+                fp.flush()
+                os.fsync(fp.fileno())
+            finally:
+                fp.close()
+            self.ack(seq)
+
+    def compact(self):
+        """Rewrite the file with only the writes which haven't been
+        acknowledged."""
+        with self._lock:
+            tmp = self.path + '.tmp'
+            fp = open(tmp, 'wb')
+            try:
+                for line in self._pending.itervalues():
+                    fp.write(line + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+            finally:
+                fp.close()
+            self._fp.close()
+            os.rename(tmp, self.path)
+            self._fp = open(self.path, 'ab')
+            self._acked = 0
+            self._unsynced = 0
+            self._synced_at = self.clock()
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            self._fp.close()
+
+    def __len__(self):
+        return len(self._pending)
@@ -4,13 +4,430 @@
 # Author: Ian Eure <ian@simplegeo.com>
 #
 
-"""JSON helper."""
+"""JSON helper.
 
-from functools import partial
+Numbers are decoded as Decimal by default, so that coordinates survive
+a round trip exactly. Pass numeric=FLOAT to decode them as floats
+instead, which is considerably faster to parse and to do math on.
 
-import simplejson
+The actual encoding and decoding is done by a Codec. Every backend
+which can be imported is registered at import time, and the fastest
+one is used for encoding and for decoding unless you pick one yourself
+with use_codec(). Other backends can be added with register_codec().
+"""
 
-loads = partial(simplejson.loads, use_decimal=True)
-load = partial(simplejson.load, use_decimal=True)
-dumps = partial(simplejson.dumps, use_decimal=True)
-dump = partial(simplejson.dump, use_decimal=True)
+from __future__ import absolute_import
+
+import re
+from decimal import Decimal
+
+DECIMAL = 'decimal'
+FLOAT = 'float'
+NUMERIC_MODES = (DECIMAL, FLOAT)
+
+def check_numeric_mode(numeric):
+    if numeric not in NUMERIC_MODES:
+        raise ValueError("numeric is required to be one of %s, not: %r" % (', '.join(NUMERIC_MODES), numeric))
+    return numeric
+
+
+class Codec(object):
+
+    """A JSON backend.
+
+    loads(s, use_decimal, **kwargs) and dumps(obj, **kwargs) do the
+    work. Decimals passed to dumps() must be written out exactly as
+    they are, unless exact_decimal is False, in which case the codec
+    is only used for encoding when nothing better is available.
+    accelerated says whether the backend has its C speedups, and
+    priority breaks ties between otherwise equal codecs.
+    """
+
+    def __init__(self, name, loads, dumps, accelerated=False,
+                 exact_decimal=True, priority=0):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.accelerated = accelerated
+        self.exact_decimal = exact_decimal
+        self.priority = priority
+
+    def __repr__(self):
+        return "Codec(name=%s, accelerated=%s)" % (self.name, self.accelerated)
+
+
+_codecs = {}
+_choice = {'encoder': None, 'decoder': None}
+_encoder = None
+_decoder = None
+
+def register_codec(codec):
+    _codecs[codec.name] = codec
+    _select()
+
+def get_codec(name):
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError('No JSON codec named "%s"; registered codecs are: %s' % (name, ', '.join(sorted(_codecs))))
+
+def codecs():
+    """Return the registered codecs, fastest first."""
+    return sorted(_codecs.values(), reverse=True,
+                  key=lambda c: (c.accelerated, c.priority))
+
+def use_codec(name=None, encoder=None, decoder=None):
+    """
+    Select the codecs used by loads() and dumps(). name sets both;
+    encoder and decoder set one each. Anything left as None goes back
+    to the fastest registered codec.
+    """
+    encoder = encoder or name
+    decoder = decoder or name
+    for n in (encoder, decoder):
+        if n is not None:
+            get_codec(n)
+    _choice.update(encoder=encoder, decoder=decoder)
+    _select()
+
+def _select():
+    global _encoder, _decoder
+    ranked = codecs()
+    if _choice['encoder']:
+        _encoder = _codecs[_choice['encoder']]
+    else:
+        _encoder = sorted(ranked, reverse=True, key=lambda c: c.exact_decimal)[0]
+    if _choice['decoder']:
+        _decoder = _codecs[_choice['decoder']]
+    else:
+        _decoder = ranked[0]
+
+def get_encoder():
+    return _encoder
+
+def get_decoder():
+    return _decoder
+
+
+def loads(s, numeric=DECIMAL, **kwargs):
+    return _decoder.loads(s, check_numeric_mode(numeric) == DECIMAL, **kwargs)
+
+def load(fp, numeric=DECIMAL, **kwargs):
+    return loads(fp.read(), numeric=numeric, **kwargs)
+
+def dumps(obj, **kwargs):
+    return _encoder.dumps(obj, **kwargs)
+
+def dump(obj, fp, **kwargs):
+    fp.write(dumps(obj, **kwargs))
+
+
+"""Selective decoding.
+
+select() picks values out of a JSON document without decoding the rest
+of it: everything off the path is skipped over by scanning for its
+end, and only the values at the end of the path are decoded.
+"""
+
+_MISSING = object()
+_WS_R = re.compile(r'\s*')
+_STRING_R = re.compile(r'"(?:[^"\\]|\\.)*"')
+_SCALAR_R = re.compile(r'[^,\]}\s]+')
+_TOKEN_R = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+_PATH_R = re.compile(r'[^.\[\]]+')
+
+def parse_path(path):
+    """
+    Turn 'features[*].id' or 'features.*.id' into ['features', '*',
+    'id']. Sequences are returned as lists unchanged.
+    """
+    if isinstance(path, basestring):
+        return _PATH_R.findall(path)
+    return list(path)
+
+def _skip_ws(s, i):
+    return _WS_R.match(s, i).end()
+
+def _value_end(s, i):
+    """Return the index just past the JSON value which starts at s[i]."""
+    c = s[i:i+1]
+    if c == '"':
+        m = _STRING_R.match(s, i)
+    elif c == '[' or c == '{':
+        depth = 0
+        for m in _TOKEN_R.finditer(s, i):
+            t = m.group()[0]
+            if t == '[' or t == '{':
+                depth += 1
+            elif t == ']' or t == '}':
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        m = None
+    else:
+        m = _SCALAR_R.match(s, i)
+    if m is None:
+        raise ValueError("Malformed JSON value at char %d" % (i,))
+    return m.end()
+
+def _expect(s, i, chars):
+    """Skip whitespace and one of chars, returning (char, next index)."""
+    i = _skip_ws(s, i)
+    c = s[i:i+1]
+    if not c or c not in chars:
+        raise ValueError("Expected one of %r at char %d" % (chars, i))
+    return c, _skip_ws(s, i + 1)
+
+def _scan(s, i, path, numeric):
+    """
+    Return (selection, end) for the value starting at s[i], where end
+    is the index just past that value.
+    """
+    start = i = _skip_ws(s, i)
+    c = s[i:i+1]
+    if not path or c not in ('{', '['):
+        end = _value_end(s, i)
+        if path:
+            return _MISSING, end
+        return loads(s[i:end], numeric=numeric), end
+    key, rest = path[0], path[1:]
+    close = '}' if c == '{' else ']'
+    if key != '*':
+        result = _MISSING
+    elif c == '{':
+        result = {}
+    else:
+        result = []
+    i = _skip_ws(s, i + 1)
+    if s[i] == close:
+        return result, i + 1
+    n = 0
+    while True:
+        if c == '{':
+            kend = _value_end(s, i)
+            k = loads(s[i:kend])
+            i = _expect(s, kend, ':')[1]
+        else:
+            k = n
+        if key == '*' or k == key or (c == '[' and str(k) == key):
+            value, i = _scan(s, i, rest, numeric)
+            if value is not _MISSING:
+                if key != '*':
+                    # Found it; the rest of this container doesn't matter.
+                    return value, _value_end(s, start)
+                elif c == '{':
+                    result[k] = value
+                else:
+                    result.append(value)
+        else:
+            i = _value_end(s, i)
+        n += 1
+        sep, i = _expect(s, i, ',' + close)
+        if sep == close:
+            return result, i
+
+def select(s, path, numeric=DECIMAL):
+    """
+    Decode only the parts of the JSON document s that are on path,
+    for example select(body, 'features[*].id') returns the list of
+    feature ids. '*' matches every element of an array (giving a list)
+    or every member of an object (giving a dict); elements which don't
+    have the rest of the path are left out. Raises KeyError if nothing
+    matches and ValueError if s is not valid JSON.
+    """
+    check_numeric_mode(numeric)
+    path = parse_path(path)
+    try:
+        value = _scan(s, 0, path, numeric)[0]
+    except IndexError:
+        raise ValueError("Unexpected end of JSON document")
+    if value is _MISSING:
+        raise KeyError('.'.join(path))
+    return value
+
+
+"""Streaming decoding.
+
+A StreamReader walks a document in a file which is too big to read
+whole, such as a FeatureCollection with millions of features, a value
+at a time.
+"""
+
+_STRING_BODY_R = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+_STRUCTURE_R = re.compile(r'["\[\]{}]')
+
+class StreamReader(object):
+
+    """
+    Reads the JSON document in the file fp a value at a time, with
+    peek(), expect(), skip() and read(). The file is read read_size
+    bytes at a time and each byte of it is only scanned once; no more
+    than a value read() (which may be no longer than max_bytes, if
+    that's given) and one piece of the file are held at once.
+    """
+
+    def __init__(self, fp, read_size=64 * 1024, max_bytes=None, numeric=DECIMAL):
+        self.fp = fp
+        self.read_size = read_size
+        self.max_bytes = max_bytes
+        self.numeric = check_numeric_mode(numeric)
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _more(self):
+        """Read the next piece of the file onto the buffer, dropping
+        what has been consumed. Returns how many bytes that dropped,
+        or None at the end of the file."""
+        if not self._eof:
+            chunk = self.fp.read(self.read_size)
+            if chunk:
+                shift = self._pos
+                self._buf = self._buf[shift:] + chunk
+                self._pos = 0
+                if self.max_bytes is not None and len(self._buf) > self.max_bytes + self.read_size:
+                    raise ValueError("A JSON value is longer than %d bytes, or malformed." % (self.max_bytes,))
+                return shift
+            self._eof = True
+        return None
+
+    def peek(self):
+        """Return the next character which isn't whitespace, without
+        consuming it, or '' at the end of the file."""
+        while True:
+            self._pos = _skip_ws(self._buf, self._pos)
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._more() is None:
+                return ''
+
+    def expect(self, chars):
+        """Consume and return the next character which isn't
+        whitespace. Raises ValueError if it isn't one of chars."""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected one of %r, not %r" % (chars, c or 'the end of the file'))
+        self._pos += 1
+        return c
+
+    def _end(self, keep):
+        """
+        Return the index in the buffer just past the next value,
+        reading more of the file until it has all been read. Unless
+        keep is true, what has been scanned is dropped as it goes.
+        """
+        if not self.peek():
+            raise ValueError("Expected a JSON value, not the end of the file")
+        i = self._pos
+        depth = 0
+        in_string = False
+        while True:
+            buf = self._buf
+            if in_string:
+                # Stops at the closing quote, or at a backslash whose
+                # escape hasn't been read yet.
+                i = _STRING_BODY_R.match(buf, i).end()
+                if i < len(buf) and buf[i] == '"':
+                    i += 1
+                    in_string = False
+                    if depth == 0:
+                        return i
+                    continue
+            elif depth == 0 and buf[i] not in '"[{':
+                m = _SCALAR_R.match(buf, i)
+                if m is None:
+                    raise ValueError("Malformed JSON value at %r" % (buf[i:i+20],))
+                if m.end() < len(buf) or self._eof:
+                    return m.end()
+            else:
+                m = _STRUCTURE_R.search(buf, i)
+                if m is not None:
+                    i = m.end()
+                    c = m.group()
+                    if c == '"':
+                        in_string = True
+                    elif c == '[' or c == '{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return i
+                    continue
+                i = len(buf)
+            if not keep:
+                self._pos = i
+            shift = self._more()
+            if shift is None:
+                raise ValueError("The file ends in the middle of a JSON value")
+            i -= shift
+
+    def skip(self):
+        """Skip over the next value without decoding it."""
+        self._pos = self._end(False)
+
+    def read(self):
+        """Decode and return the next value."""
+        end = self._end(True)
+        value = loads(self._buf[self._pos:end], numeric=self.numeric)
+        self._pos = end
+        return value
+
+
+def _simplejson_codec():
+    import simplejson
+    import simplejson.decoder
+    import simplejson.encoder
+
+    def _loads(s, use_decimal, **kwargs):
+        return simplejson.loads(s, use_decimal=use_decimal, **kwargs)
+
+    # simplejson.dumps() only reuses its encoder when called with no
+    # arguments at all, and use_decimal is one.
+    encoder = simplejson.JSONEncoder(use_decimal=True)
+
+    def _dumps(obj, **kwargs):
+        if not kwargs:
+            return encoder.encode(obj)
+        return simplejson.dumps(obj, use_decimal=True, **kwargs)
+
+    accelerated = (simplejson.decoder.c_scanstring is not None and
+                   simplejson.encoder.c_make_encoder is not None)
+    return Codec('simplejson', _loads, _dumps, accelerated=accelerated,
+                 priority=10)
+
+def _stdlib_codec():
+    import json
+    import json.decoder
+    import json.encoder
+
+    def _loads(s, use_decimal, **kwargs):
+        if use_decimal:
+            kwargs.setdefault('parse_float', Decimal)
+        return json.loads(s, **kwargs)
+
+    def _default(obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        raise TypeError("%r is not JSON serializable" % (obj,))
+
+    encoder = json.JSONEncoder(default=_default)
+
+    def _dumps(obj, **kwargs):
+        if not kwargs:
+            return encoder.encode(obj)
+        kwargs.setdefault('default', _default)
+        return json.dumps(obj, **kwargs)
+
+    # Python 2.6's json has no c_make_encoder at all.
+    accelerated = (getattr(json.decoder, 'c_scanstring', None) is not None and
+                   getattr(json.encoder, 'c_make_encoder', None) is not None)
+    # The stdlib can only write Decimals by way of float, which drops
+    # trailing zeroes and may round.
+    return Codec('json', _loads, _dumps, accelerated=accelerated,
+                 exact_decimal=False)
+
+for _factory in (_simplejson_codec, _stdlib_codec):
+    try:
+        register_codec(_factory())
+    except ImportError:
+        pass
@@ -1,10 +1,19 @@
 import time
 import copy
 import simplegeo.json as json
-from util import json_decode, deep_swap, deep_validate_lat_lon, is_simplegeohandle, SIMPLEGEOHANDLE_RSTR
+from simplegeo import geojson
+from util import (json_decode, deep_swap, deep_validate_lat_lon,
+                  is_simplegeohandle, SIMPLEGEOHANDLE_RSTR,
+                  _assert_valid_lat, _assert_valid_lon,
+                  VALIDATE_STRICT, VALIDATE_TRUSTED, VALIDATE_OFF,
+                  check_validation_policy)
+
+def _assert_valid_simplegeohandle(simplegeohandle):
+    if not (simplegeohandle is None or is_simplegeohandle(simplegeohandle)):
+        raise TypeError("The third argument, 'simplegeohandle' is required to be None or to match this regex: %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
 
 class Feature:
-    def __init__(self, coordinates, geomtype='Point', simplegeohandle=None, properties=None, strict_lon_validation=False):
+    def __init__(self, coordinates, geomtype='Point', simplegeohandle=None, properties=None, strict_lon_validation=False, validation=VALIDATE_STRICT):
         """
         The simplegeohandle and the record_id are both optional -- you
         can have one or the other or both or neither.
@@ -51,21 +60,28 @@ class Feature:
 
         For the meaning of strict_lon_validation, please see the
         function is_valid_lon().
-        """
-        try:
-            deep_validate_lat_lon(coordinates, strict_lon_validation=strict_lon_validation)
-        except ValueError, le:
-            raise TypeError("The first argument, 'coordinates' is required to be a 2-element sequence of lon, lat for a point (or a more complicated set of coordinates for polygons or multipolygons), but it was %s :: %r. The error that was raised from validating this was: %s" % (type(coordinates), coordinates, le))
 
-        if not (simplegeohandle is None or is_simplegeohandle(simplegeohandle)):
-            raise TypeError("The third argument, 'simplegeohandle' is required to be None or to match this regex: %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
-
-        record_id = properties and properties.get('record_id') or None
-        if not (record_id is None or isinstance(record_id, basestring)):
-            raise TypeError("record_id is required to be None or a string, but it was: %r :: %s." % (type(record_id), record_id))
+        validation is one of the policies described in
+        simplegeo.util. Features decoded from API responses are
+        usually built with VALIDATE_TRUSTED, since the server has
+        already checked their coordinates and handle.
+        """
+        check_validation_policy(validation)
+        if validation == VALIDATE_STRICT:
+            try:
+                deep_validate_lat_lon(coordinates, strict_lon_validation=strict_lon_validation)
+            except ValueError, le:
+                raise TypeError("The first argument, 'coordinates' is required to be a 2-element sequence of lon, lat for a point (or a more complicated set of coordinates for polygons or multipolygons), but it was %s :: %r. The error that was raised from validating this was: %s" % (type(coordinates), coordinates, le))
+
+            _assert_valid_simplegeohandle(simplegeohandle)
+
+        if validation != VALIDATE_OFF:
+            record_id = properties and properties.get('record_id') or None
+            if not (record_id is None or isinstance(record_id, basestring)):
+                raise TypeError("record_id is required to be None or a string, but it was: %r :: %s." % (type(record_id), record_id))
+            if not coordinates:
+                raise ValueError("Coordinates may not be empty.")
         self.strict_lon_validation = strict_lon_validation
-        if not coordinates:
-            raise ValueError("Coordinates may not be empty.")
         if simplegeohandle is not None:
             self.id = simplegeohandle
         self.coordinates = coordinates
@@ -75,23 +91,31 @@ class Feature:
             self.properties.update(properties)
 
     @classmethod
-    def from_dict(cls, data, strict_lon_validation=False):
+    def from_dict(cls, data, strict_lon_validation=False, validation=VALIDATE_STRICT):
         """
         data is a GeoJSON standard data structure, including that the
         coordinates are in GeoJSON order (lon, lat) instead of
         SimpleGeo order (lat, lon)
         """
+        check_validation_policy(validation)
         assert isinstance(data, dict), (type(data), repr(data))
         coordinates = deep_swap(data['geometry']['coordinates'])
-        try:
-            deep_validate_lat_lon(coordinates, strict_lon_validation=strict_lon_validation)
-        except TypeError, le:
-            raise TypeError("The 'coordinates' value is required to be a 2-element sequence of lon, lat for a point (or a more complicated set of coordinates for polygons or multipolygons), but it was %s :: %r. The error that was raised from validating this was: %s" % (type(coordinates), coordinates, le))
+        simplegeohandle = data.get('id')
+        if validation == VALIDATE_STRICT:
+            try:
+                deep_validate_lat_lon(coordinates, strict_lon_validation=strict_lon_validation)
+            except TypeError, le:
+                raise TypeError("The 'coordinates' value is required to be a 2-element sequence of lon, lat for a point (or a more complicated set of coordinates for polygons or multipolygons), but it was %s :: %r. The error that was raised from validating this was: %s" % (type(coordinates), coordinates, le))
+            _assert_valid_simplegeohandle(simplegeohandle)
+            # Everything the constructor would check again has been
+            # checked now, so don't pay for it twice.
+            validation = VALIDATE_TRUSTED
         feature = cls(
-            simplegeohandle = data.get('id'),
+            simplegeohandle = simplegeohandle,
             coordinates = coordinates,
             geomtype = data['geometry']['type'],
-            properties = data.get('properties')
+            properties = data.get('properties'),
+            validation = validation
             )
 
         return feature
@@ -117,36 +141,102 @@ class Feature:
         return d
 
     @classmethod
-    def from_json(cls, jsonstr):
-        return cls.from_dict(json_decode(jsonstr))
+    def from_json(cls, jsonstr, validation=VALIDATE_STRICT, numeric=json.DECIMAL):
+        return cls.from_dict(json_decode(jsonstr, numeric=numeric), validation=validation)
 
     def to_json(self):
-        return json.dumps(self.to_dict())
+        return geojson.dumps_feature(self)
 
 
 class Record(object):
+
+    """A record in a storage layer.
+
+    layer, id, lat, lon and created are fixed attributes. Any other
+    keyword arguments are kept in the properties dict, and can still
+    be read and set as attributes of the record as well. There can't
+    be a keyword argument named properties; set
+    record.properties['properties'] instead.
+    """
+
+    __slots__ = ('layer', 'id', 'lat', 'lon', 'created', 'properties')
+
     def __init__(self, layer, id, lat, lon, created=None, **kwargs):
-        self.layer = layer
-        self.id = id
-        self.lon = lon
-        self.lat = lat
+        if 'properties' in kwargs:
+            raise TypeError("Record() can't take a property named 'properties' as a keyword argument")
+        # Skip the __setattr__ below; these are all fixed attributes.
+        set_field = object.__setattr__
+        set_field(self, 'layer', layer)
+        set_field(self, 'id', id)
+        set_field(self, 'lon', lon)
+        set_field(self, 'lat', lat)
         if created is None:
-            self.created = int(time.time())
+            created = int(time.time())
+        set_field(self, 'created', created)
+        set_field(self, 'properties', kwargs)
+
+    def __getattr__(self, name):
+        # Only called for names which aren't fixed attributes.
+        if name == 'properties':
+            raise AttributeError(name)
+        try:
+            return self.properties[name]
+        except KeyError:
+            raise AttributeError("'Record' object has no attribute '%s'" % (name,))
+
+    def __setattr__(self, name, value):
+        if name in Record.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self.properties[name] = value
+
+    def __delattr__(self, name):
+        if name in Record.__slots__:
+            object.__delattr__(self, name)
         else:
-            self.created = created
-        self.__dict__.update(kwargs)
+            try:
+                del self.properties[name]
+            except KeyError:
+                raise AttributeError(name)
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name)) for name in Record.__slots__)
+        # So that a copy.copy() doesn't share the properties dict.
+        state['properties'] = dict(self.properties)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            object.__setattr__(self, name, value)
 
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, validation=VALIDATE_OFF):
+        """
+        Only VALIDATE_STRICT checks anything here: it requires the
+        coordinates to be a valid lon, lat pair. Records have no cheap
+        checks, so VALIDATE_TRUSTED behaves like VALIDATE_OFF.
+
+        The default is VALIDATE_OFF, since records are mostly parsed
+        from what the server sent; pass VALIDATE_STRICT for input
+        which came from anywhere else.
+        """
+        check_validation_policy(validation)
         if not data:
             return None
         coord = data['geometry']['coordinates']
+        if validation == VALIDATE_STRICT:
+            _assert_valid_lat(coord[1])
+            _assert_valid_lon(coord[0])
         record = cls(data['properties']['layer'], data['id'], lat=coord[1], lon=coord[0])
         record.created = data.get('created', record.created)
-        record.__dict__.update(dict((k, v) for k, v in data['properties'].iteritems()
-                                    if k not in ('layer', 'created')))
+        record.properties.update((k, v) for k, v in data['properties'].iteritems()
+                                 if k not in ('layer', 'created'))
         return record
 
+    @classmethod
+    def from_json(cls, jsonstr, validation=VALIDATE_OFF, numeric=json.DECIMAL):
+        return cls.from_dict(json_decode(jsonstr, numeric=numeric), validation=validation)
+
     def to_dict(self):
         return {
             'type': 'Feature',
@@ -156,12 +246,11 @@ class Record(object):
                 'type': 'Point',
                 'coordinates': [self.lon, self.lat],
             },
-            'properties': dict((k, v) for k, v in self.__dict__.iteritems()
-                                        if k not in ('lon', 'lat', 'id', 'created')),
+            'properties': dict(self.properties, layer=self.layer),
         }
 
     def to_json(self):
-        return json.dumps(self.to_dict())
+        return geojson.dumps_record(self)
 
     def __str__(self):
         return self.to_json()
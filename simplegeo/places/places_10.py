@@ -6,12 +6,28 @@
 
 """Places 1.0 client."""
 
+import time
+
 from simplegeo.util import (json_decode, APIError, SIMPLEGEOHANDLE_RSTR,
-                            is_valid_lat, is_valid_lon,
-                            _assert_valid_lat, _assert_valid_lon,
-                            is_valid_ip, is_numeric, is_simplegeohandle)
+                            is_valid_lat, is_valid_lon, is_simplegeohandle,
+                            VALIDATE_STRICT)
 from simplegeo import Client as ParentClient
+from simplegeo import geojson
 from simplegeo.models import Feature
+from simplegeo.concurrency import imap
+from simplegeo.journal import rejected
+from simplegeo import endpoints
+from simplegeo.endpoints import (Endpoint, RADIUS, QUERY, CATEGORY, NUM,
+                                 ADDRESS)
+
+_SEARCH = Endpoint('search', [endpoints.lat('lat'), endpoints.lon('lon')],
+                   [RADIUS, QUERY, CATEGORY, NUM])
+_SEARCH_BY_IP = Endpoint('search_by_ip', [endpoints.ip('ipaddr')],
+                         [RADIUS, QUERY, CATEGORY, NUM])
+_SEARCH_BY_MY_IP = Endpoint('search_by_my_ip', [], [RADIUS, QUERY, CATEGORY, NUM])
+_SEARCH_BY_ADDRESS = Endpoint('search_by_address', [],
+                              [ADDRESS, RADIUS, QUERY, CATEGORY, NUM])
+
 
 class Client(ParentClient):
 
@@ -30,26 +46,109 @@ class Client(ParentClient):
 
     def add_feature(self, feature):
         """Create a new feature, returns the simplegeohandle. """
-        endpoint = self._endpoint('create')
+        self._check_new_feature(feature)
+        return self._journaled('add_feature', self._journal_args(feature),
+                               lambda: self._add_feature(feature))
+
+    def _check_new_feature(self, feature):
         if hasattr(feature, 'id'):
             # only simplegeohandles or None should be stored in self.id
-            assert is_simplegeohandle(feature.id)
+            if self.validation == VALIDATE_STRICT:
+                assert is_simplegeohandle(feature.id)
             raise ValueError('A feature cannot be added to the Places database when it already has a simplegeohandle: %s' % (feature.id,))
-        jsonrec = feature.to_json()
-        resp, content = self._request(endpoint, "POST", jsonrec)
+
+    def _journal_args(self, feature):
+        if self.journal is None:
+            return None
+        return '{"feature": %s}' % (feature.to_json(),)
+
+    def _add_feature(self, feature):
+        endpoint = self._endpoint('create')
+        resp, content = self._request(endpoint, "POST", lambda: geojson.iter_feature(feature))
         if resp['status'] != "202":
             raise APIError(int(resp['status']), content, resp)
-        contentobj = json_decode(content)
+        contentobj = json_decode(content, numeric=self.numeric)
         if not contentobj.has_key('id'):
             raise APIError(int(resp['status']), content, resp)
         handle = contentobj['id']
-        assert is_simplegeohandle(handle)
+        if self.validation == VALIDATE_STRICT:
+            assert is_simplegeohandle(handle)
         return handle
 
+    def add_features(self, features, concurrency=4, retries=2, backoff=1.0,
+                     sleep=time.sleep):
+        """
+        Add features, any iterable of Features without simplegeohandles,
+        up to concurrency at a time. A feature which fails with a 5xx
+        status or a network error is tried again up to retries times,
+        waiting backoff seconds and then twice as long each time; the
+        server may have created it anyway, so that can add it twice.
+        With a journal, each feature is written to it once, before its
+        first attempt, and marked done once it has succeeded. One the
+        server rejects with a 4xx status is moved to the journal's
+        rejected file; one which failed any other way stays in the
+        journal to be replayed.
+
+        Returns a dict with the number of 'features' tried, the
+        'handles' of those with a record_id property by their
+        record_id, the number 'failed', and their 'results' in the
+        order they came in: a dict each of the 'record_id', the new
+        'handle' (or None), the 'error' it failed with (or None) and
+        the 'attempts' made.
+        """
+        def add(feature):
+            client = self._thread_client()
+            try:
+                client._check_new_feature(feature)
+            except (ValueError, AssertionError), e:
+                return feature, None, e, 1
+            seq = None
+            if client.journal is not None:
+                seq = client.journal.append('add_feature', client._journal_args(feature))
+            handle, error, attempts = send(client, feature)
+            if seq is not None:
+                if error is None:
+                    client.journal.ack(seq)
+                elif rejected(error):
+                    client.journal.reject(seq, error.code)
+            return feature, handle, error, attempts
+
+        def send(client, feature):
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    return client._add_feature(feature), None, attempts
+                except (APIError, EnvironmentError), e:
+                    transient = not isinstance(e, APIError) or e.code >= 500
+                    if not transient or attempts > retries:
+                        return None, e, attempts
+                    sleep(backoff * 2 ** (attempts - 1))
+                except Exception, e:
+                    # So that one feature's error doesn't lose the
+                    # summary of the rest.
+                    return None, e, attempts
+
+        summary = {'features': 0, 'handles': {}, 'failed': 0, 'results': []}
+        for feature, handle, error, attempts in imap(add, features, concurrency):
+            record_id = feature.properties.get('record_id')
+            summary['features'] += 1
+            summary['results'].append({'record_id': record_id, 'handle': handle,
+                                       'error': error, 'attempts': attempts})
+            if error is not None:
+                summary['failed'] += 1
+            elif record_id is not None:
+                summary['handles'][record_id] = handle
+        return summary
+
     def update_feature(self, feature):
         """Update a Places feature."""
+        return self._journaled('update_feature', self._journal_args(feature),
+                               lambda: self._update_feature(feature))
+
+    def _update_feature(self, feature):
         endpoint = self._endpoint('feature', simplegeohandle=feature.id)
-        return self._request(endpoint, 'POST', feature.to_json())[1]
+        return self._request(endpoint, 'POST', lambda: geojson.iter_feature(feature))[1]
 
     def delete_feature(self, simplegeohandle):
         """Delete a Places feature."""
@@ -61,38 +160,12 @@ class Client(ParentClient):
 
     def search(self, lat, lon, radius=None, query=None, category=None, num=None):
         """Search for places near a lat/lon, within a radius (in kilometers)."""
-        _assert_valid_lat(lat)
-        _assert_valid_lon(lon)
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (num and not is_numeric(num)):
-            raise ValueError("Num parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if num:
-            kwargs['num'] = num
-
-        endpoint = self._endpoint('search', lat=lat, lon=lon)
-
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        return self._search(_SEARCH, (lat, lon), (radius, query, category, num))
+
+    def _search(self, endpoint, path_values, query_values):
+        result = endpoint.request(self, path_values, query_values)[1]
+        fc = json_decode(result, numeric=self.numeric)
+        return [Feature.from_dict(f, validation=self.validation) for f in fc['features']]
 
     def search_by_ip(self, ipaddr, radius=None, query=None, category=None, num=None):
         """
@@ -103,38 +176,7 @@ class Client(ParentClient):
         ipaddr and then does the same thing as search(), using that
         guessed latitude and longitude.
         """
-        if not is_valid_ip(ipaddr):
-            raise ValueError("Address %s is not a valid IP" % ipaddr)
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (num and not is_numeric(num)):
-            raise ValueError("Num parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if num:
-            kwargs['num'] = num
-
-        endpoint = self._endpoint('search_by_ip', ipaddr=ipaddr)
-
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        return self._search(_SEARCH_BY_IP, (ipaddr,), (radius, query, category, num))
 
     def search_by_my_ip(self, radius=None, query=None, category=None, num=None):
         """
@@ -146,36 +188,7 @@ class Client(ParentClient):
         HTTP proxy device between you and the server), and then does
         the same thing as search_by_ip(), using that IP address.
         """
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (num and not is_numeric(num)):
-            raise ValueError("Num parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if num:
-            kwargs['num'] = num
-
-        endpoint = self._endpoint('search_by_my_ip')
-
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        return self._search(_SEARCH_BY_MY_IP, (), (radius, query, category, num))
 
     def search_by_address(self, address, radius=None, query=None, category=None, num=None):
         """
@@ -186,37 +199,4 @@ class Client(ParentClient):
         street address and then does the same thing as search(), using
         that deduced latitude and longitude.
         """
-        if not isinstance(address, basestring) or not address.strip():
-            raise ValueError("Address must be a non-empty string.")
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (num and not is_numeric(num)):
-            raise ValueError("Num parameter must be numeric.")
-
-        if isinstance(address, unicode):
-            address = address.encode('utf-8')
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { 'address': address }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if num:
-            kwargs['num'] = num
-
-        endpoint = self._endpoint('search_by_address')
-
-        result = self._request(endpoint, 'GET', data=kwargs)[1]
-
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        return self._search(_SEARCH_BY_ADDRESS, (), (address, radius, query, category, num))
@@ -6,26 +6,187 @@
 
 """Places 1.2 client."""
 
-import simplejson as json
+import copy
+import threading
 
+import simplegeo.json as json
+from simplegeo import geohash
+from simplegeo.json import DECIMAL
 from simplegeo.util import (json_decode, APIError, DecodeError,
                             SIMPLEGEOHANDLE_RSTR, is_valid_lat, is_valid_lon,
                             _assert_valid_lat, _assert_valid_lon,
-                            is_valid_ip, is_numeric, is_simplegeohandle)
+                            is_numeric, is_simplegeohandle,
+                            merge_features, distance, ip_network)
 from simplegeo import Client as ParentClient
+from simplegeo.concurrency import Pool, imap, imap_distinct, fetch_tiles
+from simplegeo import endpoints
+from simplegeo.endpoints import (Endpoint, RADIUS, QUERY, CATEGORY, LIMIT,
+                                 START, ADDRESS)
+
+# The number of results asked for per request by the iter_* methods.
+DEFAULT_PAGE_SIZE = 25
+# The most results the server returns for one request, whatever limit
+# it is asked for.
+MAX_PAGE_SIZE = 100
+
+_SEARCH = Endpoint('search', [endpoints.lat('lat'), endpoints.lon('lon')],
+                   [RADIUS, QUERY, CATEGORY, LIMIT, START])
+_SEARCH_TEXT = Endpoint('search_text', [], [QUERY, CATEGORY, LIMIT, START])
+_SEARCH_BBOX = Endpoint('search_bbox',
+                        [endpoints.lat('lat_sw'), endpoints.lon('lon_sw'),
+                         endpoints.lat('lat_ne'), endpoints.lon('lon_ne')],
+                        [QUERY, CATEGORY, LIMIT, START])
+_SEARCH_BY_IP = Endpoint('search_by_ip', [endpoints.ip('ipaddr')],
+                         [RADIUS, QUERY, CATEGORY, LIMIT, START])
+_SEARCH_BY_MY_IP = Endpoint('search_by_my_ip', [],
+                            [RADIUS, QUERY, CATEGORY, LIMIT, START])
+_SEARCH_BY_ADDRESS = Endpoint('search_by_address', [],
+                              [ADDRESS, RADIUS, QUERY, CATEGORY, LIMIT, START])
 
 
 class Response(dict):
 
-    """A response object which encapsulates headers & body."""
-
-    def __init__(self, body, headers):
-        try:
-            body = json_decode(body)
-        except DecodeError:
-            body = {}
-        dict.__init__(self, body)
+    """A response object which encapsulates headers & body.
+
+    The body is also kept as the raw string the server sent, in
+    .body. A body which isn't valid JSON decodes to an empty mapping,
+    and the DecodeError is kept in .decode_error.
+
+    If lazy is true, the body is only decoded the first time the
+    response is used as a mapping, so a proxy which just passes .body
+    along, or code which only select()s parts of it, never pays for
+    decoding all of it. Code which reads dicts at the C level without
+    calling any of their methods, such as dict(response),
+    json.dumps(response) or f(**response), sees an empty dict until
+    decode() has been called, so only ask for lazy responses where
+    none of that happens.
+    """
+
+    def __init__(self, body, headers, numeric=DECIMAL, lazy=False):
+        dict.__init__(self)
+        self._body = body
         self.headers = headers
+        self.numeric = numeric
+        self.decoded = False
+        self.decode_error = None
+        self._lock = threading.Lock()
+        if not lazy:
+            self.decode()
+
+    @classmethod
+    def from_dict(cls, data, headers=None, numeric=DECIMAL):
+        """Make a Response for a body which is already decoded, such
+        as one put together from a cache. Its .body is only encoded if
+        something asks for it."""
+        response = cls(None, headers or {}, numeric=numeric, lazy=True)
+        response.decoded = True
+        dict.update(response, data)
+        return response
+
+    def __reduce__(self):
+        # The default pickling of a dict subclass would put the items
+        # back with __setitem__() before the attributes it needs are
+        # there, and would lose the items of a lazy response.
+        self.decode()
+        if self.decode_error is None:
+            data = dict(self)
+        else:
+            # DecodeErrors can't be pickled; decoding again makes the
+            # same one.
+            data = None
+        return (_unpickle_response,
+                (self.__class__, self._body, self.headers, self.numeric, data))
+
+    @property
+    def body(self):
+        if self._body is None and self.decoded and self.decode_error is None:
+            self._body = json.dumps(dict(self))
+        return self._body
+
+    def decode(self):
+        """Decode the body, unless that's already been done. Other
+        threads using the response meanwhile wait for it."""
+        if not self.decoded:
+            with self._lock:
+                if not self.decoded:
+                    try:
+                        dict.update(self, json_decode(self._body, numeric=self.numeric))
+                    except DecodeError, e:
+                        self.decode_error = e
+                    # Only now, so that no thread sees it half done,
+                    # and any other error leaves it to be tried again.
+                    self.decoded = True
+        return self
+
+    def select(self, path):
+        """
+        Return only the parts of the body on path, for example
+        response.select('features[*].id'). Unless the whole body has
+        already been decoded, nothing off the path is decoded. See
+        simplegeo.json.select() for the path syntax.
+        """
+        if self.decoded:
+            return _walk(self, json.parse_path(path))
+        try:
+            return json.select(self.body, path, numeric=self.numeric)
+        except ValueError, le:
+            raise DecodeError(self.body, le)
+
+
+def _unpickle_response(cls, body, headers, numeric, data):
+    if data is None:
+        return cls(body, headers, numeric=numeric)
+    response = cls.from_dict(data, headers, numeric=numeric)
+    response._body = body
+    return response
+
+def _decoding(name):
+    method = getattr(dict, name)
+    def decoding_method(self, *args, **kwargs):
+        self.decode()
+        return method(self, *args, **kwargs)
+    decoding_method.__name__ = name
+    decoding_method.__doc__ = method.__doc__
+    return decoding_method
+
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__contains__',
+              '__iter__', '__len__', '__eq__', '__ne__', '__cmp__',
+              '__repr__', 'get', 'has_key', 'keys', 'values', 'items',
+              'iterkeys', 'itervalues', 'iteritems', 'viewkeys',
+              'viewvalues', 'viewitems', 'copy', 'pop', 'popitem',
+              'setdefault', 'update', 'clear'):
+    setattr(Response, _name, _decoding(_name))
+
+def _walk(value, path):
+    """json.select() for data which has already been decoded."""
+    if not path:
+        return value
+    key, rest = path[0], path[1:]
+    if isinstance(value, dict):
+        items = value.iteritems()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        raise KeyError(key)
+    if key != '*':
+        for k, v in items:
+            if k == key or (isinstance(value, list) and str(k) == key):
+                return _walk(v, rest)
+        raise KeyError(key)
+    if isinstance(value, dict):
+        result = {}
+    else:
+        result = []
+    for k, v in items:
+        try:
+            v = _walk(v, rest)
+        except KeyError:
+            continue
+        if isinstance(result, dict):
+            result[k] = v
+        else:
+            result.append(v)
+    return result
 
 
 class Client(ParentClient):
@@ -42,9 +203,20 @@ class Client(ParentClient):
             search_by_my_ip='1.2/places/ip.json',
             search_by_address='1.2/places/address.json')
 
+        # Set this to a simplegeo.cache.GeohashCache to have search()
+        # answer what it can from cached geohash cells.
+        self.search_cache = None
+        # Set this to True to have responses decoded only when they
+        # are used; see Response.
+        self.lazy_responses = False
+        # Set this to a simplegeo.cache.IPCache to have search_by_ip()
+        # reuse answers for addresses in the same network.
+        self.ip_cache = None
+
     def _respond(self, headers, response):
         """Return the correct structure for this response."""
-        return Response(response, headers)
+        return Response(response, headers, numeric=self.numeric,
+                        lazy=self.lazy_responses)
 
     def get_feature(self, place_id):
         """Return the GeoJSON representation of a feature."""
@@ -55,103 +227,118 @@ class Client(ParentClient):
     def search(self, lat, lon, radius=None, query=None, category=None,
                limit=None, start=None):
         """Search for places near a lat/lon, within a radius (in kilometers)."""
-        _assert_valid_lat(lat)
-        _assert_valid_lon(lon)
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint(
-                    'search', lat=lat, lon=lon),
-                              'GET', data=kwargs))
+        path, kwargs = _SEARCH.build((lat, lon), (radius, query, category, limit, start))
+
+        if self.search_cache is not None and radius and not start:
+            response = self._search_cells(lat, lon, radius, kwargs.get('q'),
+                                          kwargs.get('category'),
+                                          limit or DEFAULT_PAGE_SIZE)
+            if response is not None:
+                return response
+
+        return self._respond(*self._request(self._endpoint('search', **path),
+                                            'GET', data=kwargs))
+
+    def _search_cells(self, lat, lon, radius, query, category, limit):
+        """
+        Not used directly. Answer search() from the places in the
+        geohash cells of self.search_cache which the search circle
+        overlaps, fetching any cells which aren't cached. Returns None
+        if the search can't be answered that way. The features are
+        copies, so that changing them doesn't change the cache.
+        """
+        cache = self.search_cache
+        cells = cache.cells(lat, lon, radius)
+        if cells is None:
+            return None
+
+        def fetch(cell):
+            return self._thread_client()._fetch_cell(cell, query, category)
+
+        contents = dict((cell, cache.get(cache.key(cell, query, category)))
+                        for cell in cells)
+        missing = [cell for cell in cells if contents[cell] is None]
+        for cell, features in zip(missing, imap(fetch, missing, cache.concurrency)):
+            if features is None:
+                return None
+            cache.set(cache.key(cell, query, category), features)
+            contents[cell] = features
+
+        nearby = []
+        for feature in merge_features(contents[cell] for cell in cells):
+            feature_lon, feature_lat = feature['geometry']['coordinates']
+            d = distance(lat, lon, feature_lat, feature_lon)
+            if d <= radius:
+                nearby.append((d, feature))
+        nearby.sort(key=lambda pair: pair[0])
+        return Response.from_dict(
+            {'type': 'FeatureCollection',
+             'features': [copy.deepcopy(feature) for _, feature in nearby[:limit]]},
+            numeric=self.numeric)
+
+    def _fetch_cell(self, cell, query, category):
+        """
+        Not used directly. Return the places in the geohash cell, as
+        self.search_cache would keep them, or None if they can't be
+        cached.
+        """
+        # The server returns no more than MAX_PAGE_SIZE places, so a
+        # cell with that many may have been cut short too.
+        limit = min(self.search_cache.cell_limit, MAX_PAGE_SIZE)
+        sw_lat, sw_lon, ne_lat, ne_lon = geohash.bbox(cell)
+        response = self.search_bbox(sw_lat, sw_lon, ne_lat, ne_lon,
+                                    query=query, category=category,
+                                    limit=limit)
+        features = response.get('features') or []
+        if len(features) >= limit:
+            return None
+        for feature in features:
+            if (feature.get('geometry') or {}).get('type') != 'Point':
+                return None
+        return features
 
     def search_text(self, query=None, category=None, limit=None, start=None):
         """Fulltext search for places."""
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint('search_text'),
-                                            'GET', data=kwargs))
+        return self._respond(*_SEARCH_TEXT.request(
+                self, (), (query, category, limit, start)))
 
     def search_bbox(self, lat_sw, lon_sw, lat_ne, lon_ne, query=None,
                     category=None, limit=None, start=None):
         """Return places inside a box of (lat_sw, lon_sw), (lat_ne, lon_ne)."""
+        return self._respond(*_SEARCH_BBOX.request(
+                self, (lat_sw, lon_sw, lat_ne, lon_ne),
+                (query, category, limit, start)))
+
+    def search_bbox_tiled(self, lat_sw, lon_sw, lat_ne, lon_ne, query=None,
+                          category=None, limit=DEFAULT_PAGE_SIZE, rows=2,
+                          cols=2, max_depth=2, concurrency=4):
+        """
+        Like search_bbox(), but for boxes too big for one request.
+        The box is split into a grid of rows x cols tiles which are
+        searched concurrently, and any tile which comes back with limit
+        places (so was probably truncated) is split into four and
+        searched again, down to max_depth levels. Returns a
+        FeatureCollection dict of the places found, deduped by id.
+        """
         _assert_valid_lat(lat_sw)
         _assert_valid_lat(lat_ne)
         _assert_valid_lon(lon_sw)
         _assert_valid_lon(lon_ne)
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint(
-                    'search_bbox', lat_sw=lat_sw, lon_sw=lon_sw,
-                    lat_ne=lat_ne, lon_ne=lon_ne), 'GET', data=kwargs))
+        if not (is_numeric(limit) and limit >= 1):
+            raise ValueError("Limit parameter must be a positive number.")
+
+        def fetch(*tile):
+            return self._thread_client().search_bbox(
+                *tile, query=query, category=category, limit=limit)
+        def is_dense(response):
+            return len(response.get('features') or []) >= limit
+
+        tiles = fetch_tiles(fetch, (lat_sw, lon_sw, lat_ne, lon_ne),
+                            rows=rows, cols=cols, concurrency=concurrency,
+                            is_dense=is_dense, max_depth=max_depth)
+        features = merge_features(response.get('features') or []
+                                  for tile, response in tiles)
+        return {'type': 'FeatureCollection', 'features': features}
 
     def search_by_ip(self, ipaddr, radius=None, query=None,
                      category=None, limit=None, start=None):
@@ -163,38 +350,49 @@ class Client(ParentClient):
         ipaddr and then does the same thing as search(), using that
         guessed latitude and longitude.
         """
-        if not is_valid_ip(ipaddr):
-            raise ValueError("Address %s is not a valid IP" % ipaddr)
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint(
-                    'search_by_ip', ipaddr=ipaddr), 'GET', data=kwargs))
+        args = (radius, query, category, limit, start)
+        cache = self.ip_cache
+        if cache is not None:
+            # Only for the checks.
+            _SEARCH_BY_IP.build((ipaddr,), args)
+            key = cache.key(ipaddr, 'search', *args)
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+        response = self._respond(*_SEARCH_BY_IP.request(self, (ipaddr,), args))
+        if cache is not None:
+            cache.set(key, response)
+        return response
+
+    def search_by_ip_many(self, ips, radius=None, query=None, category=None,
+                          limit=None, start=None, concurrency=4):
+        """
+        Yield a search_by_ip() result for each of the addresses in ips,
+        in the same order, or the exception the search raised. Each
+        distinct address is only searched once, or with an ip_cache,
+        each distinct network; addresses searched together get the
+        same result object. The searches run up to concurrency at a
+        time.
+        """
+        if self.ip_cache is None:
+            to_network = ip_network
+        else:
+            to_network = self.ip_cache.network
+        def network(ip):
+            try:
+                return to_network(ip)
+            except ValueError:
+                # Searched on its own, to fail with its own error.
+                return ip
+        def fetch(ip):
+            try:
+                return self._thread_client().search_by_ip(
+                    ip, radius=radius, query=query, category=category,
+                    limit=limit, start=start)
+            except Exception, e:
+                return e
+        return imap_distinct(fetch, ips, key=network, concurrency=concurrency)
 
     def search_by_my_ip(self, radius=None, query=None, category=None,
                         limit=None, start=None):
@@ -207,36 +405,8 @@ class Client(ParentClient):
         HTTP proxy device between you and the server), and then does
         the same thing as search_by_ip(), using that IP address.
         """
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint(
-                    'search_by_my_ip'), 'GET', data=kwargs))
+        return self._respond(*_SEARCH_BY_MY_IP.request(
+                self, (), (radius, query, category, limit, start)))
 
     def search_by_address(self, address, radius=None, query=None,
                           category=None, limit=None, start=None):
@@ -248,37 +418,109 @@ class Client(ParentClient):
         street address and then does the same thing as search(), using
         that deduced latitude and longitude.
         """
-        if not isinstance(address, basestring) or not address.strip():
-            raise ValueError("Address must be a non-empty string.")
-        if (radius and not is_numeric(radius)):
-            raise ValueError("Radius must be numeric.")
-        if (query and not isinstance(query, basestring)):
-            raise ValueError("Query must be a string.")
-        if (category and not isinstance(category, basestring)):
-            raise ValueError("Category must be a string.")
-        if (limit and not is_numeric(limit)):
-            raise ValueError("Limit parameter must be numeric.")
-
-        if isinstance(address, unicode):
-            address = address.encode('utf-8')
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-        if (start and not is_numeric(start)):
-            raise ValueError("Start parameter must be numeric.")
-
-        kwargs = { 'address': address }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        if limit:
-            kwargs['limit'] = limit
-        if start:
-            kwargs['start'] = start
-
-        return self._respond(*self._request(self._endpoint(
-                    'search_by_address'), 'GET', data=kwargs))
+        return self._respond(*_SEARCH_BY_ADDRESS.request(
+                self, (), (address, radius, query, category, limit, start)))
+
+    def _iter_pages(self, name, args, kwargs, page_size, max_results, start):
+        """
+        Not used directly. Yield the features of every page of results
+        from the search method called name, fetching each page in the
+        background while the one before it is being consumed.
+        Features which have already been yielded, going by their id,
+        are skipped, and iteration stops after max_results features,
+        after a page which isn't full, or after a page with nothing
+        new in it.
+        """
+        if not (is_numeric(page_size) and page_size >= 1):
+            raise ValueError("Page size must be a positive number.")
+        if max_results is not None and not is_numeric(max_results):
+            raise ValueError("Max results must be numeric.")
+
+        def fetch(start):
+            method = getattr(self._thread_client(), name)
+            return method(*args, limit=page_size, start=start, **kwargs)
+
+        seen = set()
+        count = 0
+        offset = start or 0
+        pool = Pool(1)
+        try:
+            task = pool.submit(fetch, start)
+            while task is not None:
+                features = task.result().get('features') or []
+                task = None
+                fresh = []
+                for feature in features:
+                    feature_id = feature.get('id')
+                    if feature_id is not None:
+                        if feature_id in seen:
+                            continue
+                        seen.add(feature_id)
+                    fresh.append(feature)
+                if max_results is not None:
+                    fresh = fresh[:max(max_results - count, 0)]
+                count += len(fresh)
+                offset += page_size
+                if (fresh and len(features) >= page_size and
+                    (max_results is None or count < max_results)):
+                    task = pool.submit(fetch, offset)
+                for feature in fresh:
+                    yield feature
+        finally:
+            pool.close()
+
+    def iter_search(self, lat, lon, radius=None, query=None, category=None,
+                    page_size=DEFAULT_PAGE_SIZE, max_results=None, start=None):
+        """
+        Like search(), but yields the features from every page of
+        results, fetching the next page while the current one is being
+        consumed. See _iter_pages() for when iteration stops.
+        """
+        return self._iter_pages(
+            'search', (lat, lon),
+            dict(radius=radius, query=query, category=category),
+            page_size, max_results, start)
+
+    def iter_search_text(self, query=None, category=None,
+                         page_size=DEFAULT_PAGE_SIZE, max_results=None,
+                         start=None):
+        """Like search_text(), but yields features from every page."""
+        return self._iter_pages(
+            'search_text', (), dict(query=query, category=category),
+            page_size, max_results, start)
+
+    def iter_search_bbox(self, lat_sw, lon_sw, lat_ne, lon_ne, query=None,
+                         category=None, page_size=DEFAULT_PAGE_SIZE,
+                         max_results=None, start=None):
+        """Like search_bbox(), but yields features from every page."""
+        return self._iter_pages(
+            'search_bbox', (lat_sw, lon_sw, lat_ne, lon_ne),
+            dict(query=query, category=category),
+            page_size, max_results, start)
+
+    def iter_search_by_ip(self, ipaddr, radius=None, query=None,
+                          category=None, page_size=DEFAULT_PAGE_SIZE,
+                          max_results=None, start=None):
+        """Like search_by_ip(), but yields features from every page."""
+        return self._iter_pages(
+            'search_by_ip', (ipaddr,),
+            dict(radius=radius, query=query, category=category),
+            page_size, max_results, start)
+
+    def iter_search_by_my_ip(self, radius=None, query=None, category=None,
+                             page_size=DEFAULT_PAGE_SIZE, max_results=None,
+                             start=None):
+        """Like search_by_my_ip(), but yields features from every page."""
+        return self._iter_pages(
+            'search_by_my_ip', (),
+            dict(radius=radius, query=query, category=category),
+            page_size, max_results, start)
+
+    def iter_search_by_address(self, address, radius=None, query=None,
+                               category=None, page_size=DEFAULT_PAGE_SIZE,
+                               max_results=None, start=None):
+        """Like search_by_address(), but yields features from every page."""
+        return self._iter_pages(
+            'search_by_address', (address,),
+            dict(radius=radius, query=query, category=category),
+            page_size, max_results, start)
@@ -1,9 +1,54 @@
+import httplib
 import urllib
 
+import httplib2
+
 import simplegeo.json as json
 
-from simplegeo.util import json_decode
+from simplegeo import geojson
+from simplegeo.util import json_decode, APIError, OrderedDict
 from simplegeo import Client as ParentClient
+from simplegeo.concurrency import imap, Pool
+
+# The most records, and the most bytes of JSON, which add_records()
+# sends in one request.
+MAX_BATCH_RECORDS = 100
+MAX_BATCH_BYTES = 512 * 1024
+
+# The longest URL get_records() asks for. Many servers and proxies
+# won't take much more than 2000 bytes.
+MAX_URL_BYTES = 2000
+
+
+class RecordList(list):
+
+    """The records get_records() found, with the ids it didn't find in
+    .missing."""
+
+    def __init__(self, records=(), missing=()):
+        list.__init__(self, records)
+        self.missing = list(missing)
+
+
+def _batches(records, max_records, max_bytes):
+    """
+    Group records into lists of (id, JSON) pairs, each list holding no
+    more than max_records records and max_bytes of JSON, unless a
+    single record is bigger than that.
+    """
+    batch = []
+    size = 0
+    for record in records:
+        encoded = record.to_json()
+        if batch and (len(batch) >= max_records or
+                      size + len(encoded) + 2 > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append((record.id, encoded))
+        size += len(encoded) + 2
+    if batch:
+        yield batch
 
 
 class Client(ParentClient):
@@ -23,41 +68,185 @@ class Client(ParentClient):
 
         self.endpoints.update(map(lambda x: (x[0], api_version+x[1]), storage_endpoints))
 
+        # Set this to a simplegeo.cache.LayerCache to have get_layer()
+        # and get_layers() answer from it.
+        self.layer_cache = None
+        # Set this to a simplegeo.storage.buffer.WriteBuffer to have
+        # add_record() buffer records and send them in batches.
+        self.write_buffer = None
+
     def add_record(self, record):
         if not hasattr(record, 'layer'):
             raise Exception("Record has no layer.")
 
+        if self.write_buffer is not None:
+            self.write_buffer.add(record)
+            return
+
         endpoint = self._endpoint('record', layer=record.layer, id=record.id)
         self._request(endpoint, "PUT", record.to_json())
 
-    def add_records(self, layer, records):
-        features = {
-            'type': 'FeatureCollection',
-            'features': [record.to_dict() for record in records],
-        }
+    def add_records(self, layer, records, max_records=MAX_BATCH_RECORDS,
+                    max_bytes=MAX_BATCH_BYTES, concurrency=1,
+                    raise_on_error=True):
+        """
+        Add records, which may be any iterable of Records (it is read
+        lazily, so a generator of any length will do), to layer. They
+        are sent in batches of no more than max_records records and
+        max_bytes bytes, up to concurrency batches at a time. A big
+        batch is streamed to the server a record at a time, rather than
+        joined up into one string first.
+
+        A batch which fails, with an APIError or with the connection
+        (an EnvironmentError, or one of httplib's or httplib2's own
+        errors), doesn't stop the others. Returns a dict
+        with the number of 'records' sent, a list of 'batches', each a
+        dict of the 'ids' of its records and the 'error' it failed
+        with (or None), in the order the records came in, and the
+        'failed_ids' of all the records in batches which failed.
+
+        If raise_on_error is true, once every batch has been sent, the
+        error of the first batch which failed, if any did, is raised
+        instead, with that dict in its summary attribute.
+        """
+        def upload(batch):
+            client = self._thread_client()
+            encoded = [encoded for id, encoded in batch]
+            args = None
+            if self.journal is not None:
+                args = '{"layer": %s, "features": [%s]}' % (json.dumps(layer), ', '.join(encoded))
+            try:
+                client._journaled('add_records', args,
+                                  lambda: client._post_records(layer, encoded))
+            except (APIError, EnvironmentError, httplib.HTTPException,
+                    httplib2.HttpLib2Error), e:
+                return batch, e
+            return batch, None
+
+        summary = {'records': 0, 'batches': [], 'failed_ids': []}
+        batches = _batches(records, max_records, max_bytes)
+        for batch, error in imap(upload, batches, concurrency):
+            ids = [id for id, encoded in batch]
+            summary['records'] += len(ids)
+            summary['batches'].append({'ids': ids, 'error': error})
+            if error is not None:
+                summary['failed_ids'].extend(ids)
+        if raise_on_error:
+            for batch in summary['batches']:
+                if batch['error'] is not None:
+                    batch['error'].summary = summary
+                    raise batch['error']
+        return summary
+
+    def _post_records(self, layer, encoded):
+        """Not used directly. Add the records encoded, a list of their
+        JSON, to layer in one request."""
         endpoint = self._endpoint('add_records', layer=layer)
-        self._request(endpoint, "POST", json.dumps(features))
+        self._request(endpoint, "POST", lambda: geojson.iter_feature_collection(encoded))
 
     def delete_record(self, layer, id):
+        self._journaled('delete_record', {'layer': layer, 'id': id},
+                        lambda: self._delete_record(layer, id))
+
+    def _delete_record(self, layer, id):
         endpoint = self._endpoint('record', layer=layer, id=id)
         self._request(endpoint, "DELETE")
 
     def get_record(self, layer, id):
         endpoint = self._endpoint('record', layer=layer, id=id)
-        return json_decode(self._request(endpoint, "GET")[1])
+        return json_decode(self._request(endpoint, "GET")[1], numeric=self.numeric)
+
+    def get_records(self, layer, ids, max_url_bytes=MAX_URL_BYTES,
+                    concurrency=4):
+        """
+        Return a RecordList of the records in layer with the given ids,
+        in the order of ids, with the ids which weren't found in its
+        missing attribute. Ids are asked for as many at a time as fit
+        in a URL of max_url_bytes, up to concurrency requests at a
+        time.
+        """
+        ids = list(OrderedDict.fromkeys(ids))
+        base = len(self._endpoint('records', layer=layer, ids=''))
+        chunks = []
+        length = 0
+        for id in ids:
+            size = len(id.encode('utf-8') if isinstance(id, unicode) else id)
+            if chunks and length + 1 + size <= max_url_bytes:
+                chunks[-1].append(id)
+                length += 1 + size
+            else:
+                chunks.append([id])
+                length = base + size
 
-    def get_records(self, layer, ids):
-        endpoint = self._endpoint('records', layer=layer, ids=','.join(ids))
-        features = json_decode(self._request(endpoint, "GET")[1])
-        return features.get('features') or []
+        def fetch(chunk):
+            client = self._thread_client()
+            endpoint = client._endpoint('records', layer=layer, ids=','.join(chunk))
+            features = json_decode(client._request(endpoint, "GET")[1], numeric=self.numeric)
+            return features.get('features') or []
+
+        found = {}
+        for features in imap(fetch, chunks, min(concurrency, len(chunks))):
+            for feature in features:
+                found.setdefault(feature.get('id'), feature)
+        return RecordList([found[id] for id in ids if id in found],
+                          [id for id in ids if id not in found])
 
     def get_history(self, layer, id, **kwargs):
         endpoint = self._endpoint('history', layer=layer, id=id)
-        return json_decode(self._request(endpoint, "GET", data=kwargs)[1])
+        return json_decode(self._request(endpoint, "GET", data=kwargs)[1], numeric=self.numeric)
 
     def get_nearby(self, layer, lat, lon, **kwargs):
         endpoint = self._endpoint('nearby', layer=layer, arg='%s,%s' % (lat, lon))
-        return json_decode(self._request(endpoint, "GET", data=kwargs)[1])
+        return json_decode(self._request(endpoint, "GET", data=kwargs)[1], numeric=self.numeric)
+
+    def _paginate(self, fetch, key, kwargs, prefetch):
+        """
+        Not used directly. Yield the items in the key list of each page
+        which fetch(client, **kwargs) returns, following the pages'
+        next_cursor. With prefetch, the next page is fetched in a
+        background thread while the items of the last are being taken.
+        """
+        kwargs = dict(kwargs)
+        cursor = kwargs.pop('cursor', None)
+        def get(cursor):
+            args = dict(kwargs)
+            if cursor:
+                args['cursor'] = cursor
+            return fetch(self._thread_client(), **args)
+
+        pool = prefetch and Pool(1) or None
+        try:
+            page = get(cursor)
+            while True:
+                items = page.get(key) or []
+                next_cursor = page.get('next_cursor')
+                more = bool(items and next_cursor and next_cursor != cursor)
+                if more and pool is not None:
+                    task = pool.submit(get, next_cursor)
+                for item in items:
+                    yield item
+                if not more:
+                    return
+                if pool is not None:
+                    page = task.result()
+                else:
+                    page = get(next_cursor)
+                cursor = next_cursor
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def iter_history(self, layer, id, prefetch=True, **kwargs):
+        """Yield each point in the history of the record id in layer,
+        fetching page after page of it with get_history()."""
+        fetch = lambda client, **args: client.get_history(layer, id, **args)
+        return self._paginate(fetch, 'geometries', kwargs, prefetch)
+
+    def iter_nearby(self, layer, lat, lon, prefetch=True, **kwargs):
+        """Yield each record near lat, lon in layer, fetching page
+        after page of them with get_nearby()."""
+        fetch = lambda client, **args: client.get_nearby(layer, lat, lon, **args)
+        return self._paginate(fetch, 'features', kwargs, prefetch)
 
     """ Waiting on Gate
     def get_nearby_ip_address(self, layer, ip_address, **kwargs):
@@ -69,19 +258,50 @@ class Client(ParentClient):
 
     def create_layer(self, layer):
         endpoint = self._endpoint('layer', layer=layer.name)
-        return json_decode(self._request(endpoint, "PUT", layer.to_json())[1])
+        try:
+            return json_decode(self._request(endpoint, "PUT", layer.to_json())[1], numeric=self.numeric)
+        finally:
+            if self.layer_cache is not None:
+                self.layer_cache.invalidate(layer.name)
 
     def update_layer(self, layer):
         return self.create_layer(layer)
 
     def delete_layer(self, name):
         endpoint = self._endpoint('layer', layer=name)
-        return json_decode(self._request(endpoint, "DELETE")[1])
+        try:
+            return json_decode(self._request(endpoint, "DELETE")[1], numeric=self.numeric)
+        finally:
+            if self.layer_cache is not None:
+                self.layer_cache.invalidate(name)
 
     def get_layer(self, name):
+        cache = self.layer_cache
+        if cache is not None:
+            layer = cache.get(name)
+            if layer is not None:
+                return layer
         endpoint = self._endpoint('layer', layer=name)
-        return json_decode(self._request(endpoint, "GET")[1])
+        layer = json_decode(self._request(endpoint, "GET")[1], numeric=self.numeric)
+        if cache is not None:
+            cache.set(name, layer)
+        return layer
 
     def get_layers(self, **kwargs):
+        cache = self.layer_cache
+        if cache is not None:
+            key = cache.listing_key(kwargs)
+            layers = cache.get(key)
+            if layers is not None:
+                return layers
         endpoint = self._endpoint('layers')
-        return json_decode(self._request(endpoint, "GET", data=kwargs)[1])
+        layers = json_decode(self._request(endpoint, "GET", data=kwargs)[1], numeric=self.numeric)
+        if cache is not None:
+            cache.store_listing(key, layers)
+        return layers
+
+    def iter_layers(self, prefetch=True, **kwargs):
+        """Yield each of your layers, fetching page after page of them
+        with get_layers()."""
+        fetch = lambda client, **args: client.get_layers(**args)
+        return self._paginate(fetch, 'layers', kwargs, prefetch)
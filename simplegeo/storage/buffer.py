@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""Write-behind buffering of single records.
+
+Set a StorageClient's write_buffer to a WriteBuffer, and add_record()
+stops sending a PUT for every record: the records are kept, a
+layer's worth at a time, and sent together with add_records() once a
+layer has max_records of them or its oldest is max_age seconds old.
+A record which is added again before it is sent only replaces the
+one waiting, so it is sent once.
+
+    client.storage.write_buffer = WriteBuffer(client.storage)
+
+Whatever is still waiting is sent when the program exits, or by
+flush() or close().
+"""
+
+import time
+import atexit
+import threading
+
+from simplegeo.storage import MAX_BATCH_RECORDS
+from simplegeo.util import OrderedDict
+
+
+class WriteBuffer(object):
+
+    """
+    Records waiting to be added to storage layers with the
+    StorageClient client.
+
+    Once max_pending records are waiting altogether, add() sends them
+    all before it returns, which holds back code that adds records
+    faster than they can be sent. Records in batches which fail are
+    kept in failed, a dict of them by (layer, id), to be retried or
+    given up on.
+    """
+
+    def __init__(self, client, max_records=MAX_BATCH_RECORDS, max_age=5.0,
+                 max_pending=10000, concurrency=1, flush_on_exit=True,
+                 clock=time.time):
+        self.client = client
+        self.max_records = max_records
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.clock = clock
+        self.closed = False
+        self.failed = {}
+        self.added = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.batches = 0
+        self._layers = {}
+        self._started = {}
+        self._pending = 0
+        self._lock = threading.Condition()
+        # Only one flush sends at a time, so that the records are sent
+        # in the order they were taken.
+        self._flush_lock = threading.Lock()
+        if max_age is not None:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    def add(self, record):
+        """Buffer record, replacing any waiting record with the same
+        layer and id."""
+        if self.closed:
+            raise ValueError("The WriteBuffer is closed.")
+        # The same (layer, id) as Record.__hash__() uses.
+        key = (record.layer, record.id)
+        with self._lock:
+            records = self._layers.get(record.layer)
+            if records is None:
+                records = self._layers[record.layer] = OrderedDict()
+                self._started[record.layer] = self.clock()
+                self._lock.notify()
+            if key in records:
+                self.coalesced += 1
+            else:
+                self._pending += 1
+            records[key] = record
+            self.added += 1
+            full = len(records) >= self.max_records
+            backed_up = self._pending >= self.max_pending
+        if backed_up:
+            self.flush()
+        elif full:
+            self._flush([record.layer])
+
+    def _take(self, layers):
+        with self._lock:
+            if layers is None:
+                layers = self._layers.keys()
+            taken = []
+            for layer in layers:
+                records = self._layers.pop(layer, None)
+                self._started.pop(layer, None)
+                if records:
+                    self._pending -= len(records)
+                    taken.append((layer, records))
+            return taken
+
+    def _flush(self, layers):
+        sent = 0
+        with self._flush_lock:
+            client = self.client._thread_client()
+            for layer, records in self._take(layers):
+                try:
+                    summary = client.add_records(layer, records.itervalues(),
+                                                 max_records=self.max_records,
+                                                 concurrency=self.concurrency,
+                                                 raise_on_error=False)
+                except Exception:
+                    # add_records() only keeps going past APIErrors and
+                    # EnvironmentErrors; anything else, such as
+                    # httplib.BadStatusLine, fails the whole layer.
+                    with self._lock:
+                        self.failed.update(records)
+                    continue
+                failed = set(summary['failed_ids'])
+                with self._lock:
+                    self.sent += summary['records'] - len(failed)
+                    self.batches += len(summary['batches'])
+                    for key, record in records.iteritems():
+                        if record.id in failed:
+                            self.failed[key] = record
+                        else:
+                            self.failed.pop(key, None)
+                sent += summary['records'] - len(failed)
+        return sent
+
+    def flush(self):
+        """Send every waiting record now. Returns how many were sent
+        without failing."""
+        return self._flush(None)
+
+    def flush_expired(self):
+        """Send the records of the layers whose oldest waiting record
+        is max_age seconds old. The buffer's thread calls this."""
+        now = self.clock()
+        with self._lock:
+            layers = [layer for layer, started in self._started.iteritems()
+                      if now - started >= self.max_age]
+        if layers:
+            return self._flush(layers)
+        return 0
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self.closed:
+                    return
+                if self._started:
+                    timeout = min(self._started.values()) + self.max_age - self.clock()
+                else:
+                    timeout = self.max_age
+                if timeout > 0:
+                    self._lock.wait(timeout)
+            try:
+                self.flush_expired()
+            except Exception:
+                # Records which couldn't be sent are already in
+                # failed; keep flushing the rest as they get old.
+                pass
+
+    def close(self):
+        """Send everything which is waiting and stop buffering."""
+        if self.closed:
+            return
+        with self._lock:
+            self.closed = True
+            self._lock.notify()
+        self.flush()
+
+    def __len__(self):
+        return self._pending
+
+    def stats(self):
+        return {'pending': self._pending, 'added': self.added,
+                'coalesced': self.coalesced, 'sent': self.sent,
+                'batches': self.batches, 'failed': len(self.failed)}
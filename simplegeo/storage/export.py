@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Reading a whole storage layer out.
+
+iter_layer() walks a layer tile by tile with get_nearby(), following
+each tile's next_cursor until it runs out, and export_ndjson() writes
+what it finds to a file, one record per line:
+
+    export_ndjson(client.storage, 'com.example.layer', open('layer.ndjson', 'wb'))
+
+Each tile only yields the records whose coordinates fall inside it,
+so a record which turns up in the searches of several tiles is only
+written once, without having to remember every id seen. Only one page
+per tile being fetched is held in memory at a time, and a record is
+only checked against the ids of the page before.
+
+The server doesn't search further than MAX_RADIUS kilometers, and
+leaves whatever is further out of the results without saying so, so
+a tile which would need a bigger radius is split into four, over and
+over, until its quarters fit.
+"""
+
+import simplegeo.json as json
+from simplegeo.concurrency import imap
+from simplegeo.util import (split_bbox, distance, _assert_valid_lat,
+                            _assert_valid_lon)
+
+WORLD = (-90, -180, 90, 180)
+# How many records to ask get_nearby() for at a time.
+DEFAULT_PAGE_SIZE = 100
+# The biggest radius, in kilometers, to ask get_nearby() for.
+MAX_RADIUS = 100.0
+
+
+def _radius(sw_lat, sw_lon, ne_lat, ne_lon):
+    """Return the center of a box and the radius, in kilometers, of a
+    circle around it which covers the whole box."""
+    lat = (sw_lat + ne_lat) / 2.0
+    lon = (sw_lon + ne_lon) / 2.0
+    corners = [(sw_lat, sw_lon), (sw_lat, ne_lon), (ne_lat, sw_lon), (ne_lat, ne_lon)]
+    # A little extra, so that records right on a corner aren't missed.
+    return lat, lon, max(distance(lat, lon, *corner) for corner in corners) * 1.01 + 0.01
+
+def _tiles(bbox, rows, cols, max_radius):
+    """Yield the tiles of bbox split into rows x cols, with any tile
+    which can't be searched within max_radius split further."""
+    for tile in split_bbox(*bbox, rows=rows, cols=cols):
+        if _radius(*tile)[2] <= max_radius:
+            yield tile
+        else:
+            for quarter in _tiles(tile, 2, 2, max_radius):
+                yield quarter
+
+def _owner(tile, bbox):
+    """Return a test for whether a point belongs to tile: its south
+    and west edges are inside it, its north and east edges only on the
+    edge of bbox."""
+    sw_lat, sw_lon, ne_lat, ne_lon = tile
+    top = ne_lat == bbox[2]
+    right = ne_lon == bbox[3]
+    def owns(lat, lon):
+        return (sw_lat <= lat and (lat < ne_lat or top and lat == ne_lat) and
+                sw_lon <= lon and (lon < ne_lon or right and lon == ne_lon))
+    return owns
+
+def _tile_records(client, layer, tile, bbox, page_size, kwargs):
+    owns = _owner(tile, bbox)
+    lat, lon, radius = _radius(*tile)
+    # The ids of the page before, in case the pages overlap.
+    seen = set()
+    cursor = None
+    while True:
+        args = dict(kwargs, radius=radius, limit=page_size)
+        if cursor:
+            args['cursor'] = cursor
+        # This generator is started in a worker thread and finished in
+        # the caller's, so get the client for whichever it's in now.
+        response = client._thread_client().get_nearby(layer, lat, lon, **args)
+        features = response.get('features') or []
+        page = []
+        for feature in features:
+            feature_lon, feature_lat = feature['geometry']['coordinates'][:2]
+            if feature.get('id') not in seen and owns(float(feature_lat), float(feature_lon)):
+                page.append(feature)
+        seen = set(feature.get('id') for feature in features)
+        yield page
+        next_cursor = response.get('next_cursor')
+        if not features or not next_cursor or next_cursor == cursor:
+            return
+        cursor = next_cursor
+
+def iter_layer(client, layer, bbox=WORLD, rows=4, cols=8, concurrency=4,
+               page_size=DEFAULT_PAGE_SIZE, max_radius=MAX_RADIUS, **kwargs):
+    """
+    Yield every record (as the dict get_nearby() returns it) in layer
+    whose coordinates are inside bbox, a (sw_lat, sw_lon, ne_lat,
+    ne_lon) tuple, using the StorageClient client. bbox is split into
+    rows x cols tiles, and those into quarters until each can be
+    searched within max_radius kilometers; concurrency tiles are
+    fetched at a time. kwargs are passed on to get_nearby().
+    """
+    for lat in bbox[0::2]:
+        _assert_valid_lat(lat)
+    for lon in bbox[1::2]:
+        _assert_valid_lon(lon)
+    if max_radius <= 0.1:
+        raise ValueError("max_radius must be more than 0.1 kilometers, not %r" % (max_radius,))
+    bbox = tuple(float(x) for x in bbox)
+
+    def first_page(tile):
+        pages = _tile_records(client, layer, tile, bbox, page_size, kwargs)
+        return next(pages), pages
+
+    # The first page of each tile is fetched concurrently; the rest
+    # are fetched as the tile's records are taken.
+    for page, pages in imap(first_page, _tiles(bbox, rows, cols, max_radius),
+                            concurrency):
+        for record in page:
+            yield record
+        for page in pages:
+            for record in page:
+                yield record
+
+def export_ndjson(client, layer, fp, **kwargs):
+    """Write every record in layer to the file fp, one JSON document
+    per line, and return how many there were. kwargs are passed on to
+    iter_layer()."""
+    n = 0
+    for record in iter_layer(client, layer, **kwargs):
+        fp.write(json.dumps(record))
+        fp.write('\n')
+        n += 1
+    return n
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Loading records into a storage layer from big files.
+
+The readers turn a file into a stream of Records without reading all
+of it at once, and load() pushes a stream of Records into a layer with
+StorageClient.add_records(), a slice at a time, so memory use stays
+flat however long the stream is:
+
+    fp = open('records.ndjson')
+    load(client.storage, 'com.example.layer', read_ndjson(fp, 'com.example.layer'),
+         checkpoint='records.checkpoint')
+
+If the load is interrupted, running the same call again skips the
+records which were already sent.
+"""
+
+import os
+import csv
+import time
+from decimal import Decimal
+
+import simplegeo.json as json
+from simplegeo.models import Record
+from simplegeo.util import (VALIDATE_STRICT, check_validation_policy,
+                            _assert_valid_lat, _assert_valid_lon)
+
+# How many records load() hands to add_records() at a time. Each
+# slice is finished before the next is started.
+DEFAULT_SLICE = 10000
+# The longest a feature in a GeoJSON FeatureCollection may be.
+MAX_FEATURE_BYTES = 16 * 1024 * 1024
+_READ_SIZE = 64 * 1024
+
+
+def _record(data, layer, validation):
+    data = dict(data, properties=dict(data.get('properties') or {}, layer=layer))
+    return Record.from_dict(data, validation=validation)
+
+def read_ndjson(fp, layer, validation=VALIDATE_STRICT, numeric=json.DECIMAL):
+    """Yield a Record for each GeoJSON Feature, one per line, in the
+    file fp. Blank lines are skipped."""
+    check_validation_policy(validation)
+    for line in fp:
+        if line.strip():
+            yield _record(json.loads(line, numeric=numeric), layer, validation)
+
+def read_csv(fp, layer, id_column='id', lat_column='lat', lon_column='lon',
+             created_column='created', validation=VALIDATE_STRICT, **kwargs):
+    """
+    Yield a Record for each row of the CSV file fp, which has a header
+    row naming its columns. The other columns become properties of the
+    records, as strings. kwargs are passed on to csv.DictReader.
+    """
+    check_validation_policy(validation)
+    for row in csv.DictReader(fp, **kwargs):
+        id = row.pop(id_column)
+        if not id:
+            raise ValueError("Row %s has no %s." % (row, id_column))
+        lat = Decimal(row.pop(lat_column))
+        lon = Decimal(row.pop(lon_column))
+        if validation == VALIDATE_STRICT:
+            _assert_valid_lat(lat)
+            _assert_valid_lon(lon)
+        created = row.pop(created_column, None)
+        yield Record(layer, id, lat, lon,
+                     created=created and int(created) or None, **row)
+
+def read_geojson(fp, layer, validation=VALIDATE_STRICT, numeric=json.DECIMAL):
+    """
+    Yield a Record for each Feature in the GeoJSON FeatureCollection
+    in the file fp, reading it a piece at a time. The collection's
+    other members are skipped over, and nothing after its "features"
+    is read.
+    """
+    check_validation_policy(validation)
+    reader = json.StreamReader(fp, _READ_SIZE, MAX_FEATURE_BYTES, numeric)
+    reader.expect('{')
+    if reader.peek() == '}':
+        raise ValueError("No \"features\" in the FeatureCollection.")
+    while True:
+        key = reader.read()
+        reader.expect(':')
+        if key == 'features':
+            break
+        reader.skip()
+        if reader.expect(',}') == '}':
+            raise ValueError("No \"features\" in the FeatureCollection.")
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield _record(reader.read(), layer, validation)
+        if reader.expect(',]') == ']':
+            return
+
+def open_records(path, layer, **kwargs):
+    """Return a reader for the records in the file at path, chosen by
+    its extension: .ndjson or .jsonl, .csv, or .json or .geojson."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.ndjson', '.jsonl'):
+        return read_ndjson(open(path, 'rb'), layer, **kwargs)
+    if ext == '.csv':
+        return read_csv(open(path, 'rb'), layer, **kwargs)
+    if ext in ('.json', '.geojson'):
+        return read_geojson(open(path, 'rb'), layer, **kwargs)
+    raise ValueError("Don't know how to read records from %s" % (path,))
+
+
+def _read_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return {'offset': 0, 'failed_ids': []}
+    fp = open(path, 'rb')
+    try:
+        return json.load(fp)
+    finally:
+        fp.close()
+
+def _write_checkpoint(path, state):
+    tmp = path + '.tmp'
+    fp = open(tmp, 'wb')
+    try:
+        json.dump(state, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    finally:
+        fp.close()
+    os.rename(tmp, path)
+
+def load(client, layer, records, slice_size=DEFAULT_SLICE, checkpoint=None,
+         progress=None, clock=time.time, **kwargs):
+    """
+    Add records, any iterable of Records, to layer with the
+    StorageClient client's add_records(), slice_size records at a
+    time; kwargs (max_records, max_bytes, concurrency) are passed on
+    to it. records is only read as fast as add_records() can send
+    them.
+
+    If checkpoint is the path of a file, the number of records sent
+    and the ids of any which failed are written to it after every
+    slice, and a load started with an existing checkpoint skips the
+    records it has already sent. progress, if given, is called after
+    every slice with the same dict as is returned at the end: the
+    number of 'records' sent and 'failed', the 'failed_ids', the
+    'seconds' taken and the 'rate' in records per second.
+    """
+    state = _read_checkpoint(checkpoint)
+    records = iter(records)
+    for i in xrange(state['offset']):
+        if next(records, None) is None:
+            break
+
+    started = clock()
+    stats = {'records': 0, 'failed': 0, 'failed_ids': state['failed_ids'],
+             'seconds': 0.0, 'rate': 0.0}
+    while True:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= slice_size:
+                break
+        if not batch:
+            break
+        summary = client.add_records(layer, batch, raise_on_error=False, **kwargs)
+        stats['records'] += summary['records']
+        stats['failed'] += len(summary['failed_ids'])
+        stats['failed_ids'].extend(summary['failed_ids'])
+        stats['seconds'] = clock() - started
+        stats['rate'] = stats['seconds'] and stats['records'] / stats['seconds'] or 0.0
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, {'offset': state['offset'] + stats['records'],
+                                          'failed_ids': stats['failed_ids']})
+        if progress is not None:
+            progress(stats)
+    return stats
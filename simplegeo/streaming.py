@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Request bodies which are sent a piece at a time.
+
+Client._request() takes, besides a string, any iterable of strings or
+a file-like object as the body of a request, or a function returning
+one. One which comes to less than STREAM_THRESHOLD bytes is joined up
+and sent as a string with a Content-Length, as before. A bigger one is
+sent with chunked transfer encoding as it is read, so that it never
+has to be held in memory whole.
+
+httplib2 sends a request again if the connection drops while it is
+being sent, or turns out to have gone stale. The Http here starts a
+streamed body over for each attempt, by calling the function again
+or seeking back in the file. An iterable can't be started over, so a
+request with one fails instead of sending it again.
+"""
+
+import itertools
+
+import httplib2
+
+# Bodies of at least this many bytes are streamed.
+STREAM_THRESHOLD = 64 * 1024
+# How much is read from a file-like body, and sent in a chunk, at a
+# time.
+BLOCK_SIZE = 16 * 1024
+
+
+class ChunkedBody(object):
+
+    """
+    A file-like object which httplib can send as a request body,
+    reading the pieces of the body (strings) from an iterable and
+    handing them on in chunked transfer encoding. It has no len(), so
+    that httplib doesn't send a Content-Length.
+
+    restart, if given, is a function returning the pieces again, for
+    restart() to start the body over with.
+    """
+
+    def __init__(self, pieces, restart=None):
+        self._pieces = iter(pieces)
+        self._restart = restart
+        self._leftover = ''
+        self._started = False
+        self._done = False
+        self._finished = False
+        self._closed = False
+
+    def restart(self):
+        """Start the body over, if any of it has been read. Raise
+        ValueError if it can't be."""
+        if not self._started:
+            return
+        if self._restart is None:
+            raise ValueError("A streamed body made from an iterable can't be sent again")
+        self.__init__(self._restart(), self._restart)
+
+    def read(self, size=-1):
+        """Return the next chunk, holding up to size bytes of the body
+        (all the rest of it if size is negative). After the last, empty
+        chunk comes '', once, to mark the end of the body; reading on
+        past that raises ValueError until the body is restart()ed."""
+        if self._closed:
+            raise ValueError('The whole body has been read; restart() it to read it again')
+        self._started = True
+        buf = [self._leftover]
+        n = len(self._leftover)
+        while not self._done and (size < 0 or n < size):
+            piece = next(self._pieces, None)
+            if piece is None:
+                self._done = True
+                break
+            if isinstance(piece, unicode):
+                piece = piece.encode('utf-8')
+            buf.append(piece)
+            n += len(piece)
+        data = ''.join(buf)
+        if size >= 0 and len(data) > size:
+            data, self._leftover = data[:size], data[size:]
+        else:
+            self._leftover = ''
+        if data:
+            return '%x\r\n%s\r\n' % (len(data), data)
+        if not self._finished:
+            self._finished = True
+            return '0\r\n\r\n'
+        self._closed = True
+        return ''
+
+
+class _RestartingConnection(object):
+
+    """Not used directly. A connection which restarts body before each
+    request it sends, and is otherwise conn."""
+
+    def __init__(self, conn, body):
+        self._conn = conn
+        self._body = body
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def request(self, *args, **kwargs):
+        self._body.restart()
+        return self._conn.request(*args, **kwargs)
+
+
+class Http(httplib2.Http):
+
+    """An httplib2.Http which starts a ChunkedBody over each time it
+    sends the request again."""
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+        if isinstance(body, ChunkedBody):
+            conn = _RestartingConnection(conn, body)
+        return httplib2.Http._conn_request(self, conn, request_uri, method, body, headers)
+
+
+def _pieces(data):
+    """Not used directly. Return an iterator over the pieces of data,
+    an iterable of strings or a file-like object."""
+    if hasattr(data, 'read'):
+        return iter(lambda: data.read(BLOCK_SIZE), '')
+    return iter(data)
+
+
+def request_body(data, threshold=STREAM_THRESHOLD):
+    """
+    Return data as a body for Http.request(): None and strings as they
+    are, and an iterable of strings or a file-like object (or a
+    function returning one) joined up into a string if it comes to
+    less than threshold bytes, or as a ChunkedBody if it doesn't. Only
+    the first threshold bytes or so are read here. The ChunkedBody can
+    be restarted if data is a function or a file which can seek.
+    """
+    if data is None or isinstance(data, basestring):
+        return data
+    restart = None
+    if callable(data):
+        factory = data
+        restart = lambda: _pieces(factory())
+        data = factory()
+    elif hasattr(data, 'read') and hasattr(data, 'seek') and hasattr(data, 'tell'):
+        offset = data.tell()
+        def restart():
+            data.seek(offset)
+            return _pieces(data)
+    pieces = _pieces(data)
+    head = []
+    size = 0
+    for piece in pieces:
+        head.append(piece)
+        size += len(piece)
+        if size >= threshold:
+            return ChunkedBody(itertools.chain(head, pieces), restart)
+    return ''.join(head)
@@ -0,0 +1,116 @@
+import time
+import httplib
+import unittest
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.models import Record
+from simplegeo.storage.buffer import WriteBuffer
+from simplegeo.test.test_cache import FakeClock
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+TESTING_LAYER = 'com.simplegeo.test'
+
+
+def _record(id, name='first', layer=TESTING_LAYER):
+    return Record(layer, id, D('37.8016'), D('-122.4783'), created=1300000000, name=name)
+
+
+class WriteBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        self.sent = []
+        def request(url, method, body=None, headers=None):
+            features = json.loads(body)['features']
+            self.sent.append((url.split('/')[-1], [(f['id'], f['properties']['name']) for f in features]))
+            if any(f['id'] == 'bad' for f in features):
+                return ({'status': '500', 'content-type': 'application/json'}, '')
+            return ({'status': '202', 'content-type': 'application/json'}, '')
+        self.client.storage.http = mock.Mock()
+        self.client.storage.http.request.side_effect = request
+
+    def test_coalesce(self):
+        storage = self.client.storage
+        storage.write_buffer = WriteBuffer(storage, max_records=3, max_age=None, flush_on_exit=False)
+        storage.add_record(_record('1'))
+        storage.add_record(_record('2'))
+        storage.add_record(_record('1', 'second'))
+        storage.add_record(_record('1', layer='com.simplegeo.other'))
+        self.failUnlessEqual(self.sent, [])
+        self.failUnlessEqual(len(storage.write_buffer), 3)
+        storage.add_record(_record('3'))
+        self.failUnlessEqual(self.sent, [('com.simplegeo.test.json',
+                                          [('1', 'second'), ('2', 'first'), ('3', 'first')])])
+        self.failUnlessEqual(storage.write_buffer.flush(), 1)
+        self.failUnlessEqual(self.sent[-1], ('com.simplegeo.other.json', [('1', 'first')]))
+        self.failUnlessEqual(storage.write_buffer.stats(),
+                             {'pending': 0, 'added': 5, 'coalesced': 1, 'sent': 4,
+                              'batches': 2, 'failed': 0})
+
+    def test_failures_and_backpressure(self):
+        buf = WriteBuffer(self.client.storage, max_records=10, max_pending=2, max_age=None,
+                          flush_on_exit=False)
+        buf.add(_record('bad'))
+        buf.add(_record('ok', layer='com.simplegeo.other'))
+        self.failUnlessEqual(len(self.sent), 2)
+        self.failUnlessEqual(buf.failed.keys(), [(TESTING_LAYER, 'bad')])
+        buf.close()
+        self.assertRaises(ValueError, buf.add, _record('1'))
+
+    def test_unexpected_error(self):
+        request = self.client.storage.http.request.side_effect
+        def flaky(url, method, body=None, headers=None):
+            if 'broken' in body:
+                raise httplib.BadStatusLine('')
+            return request(url, method, body, headers)
+        self.client.storage.http.request.side_effect = flaky
+        buf = WriteBuffer(self.client.storage, max_age=0.05, flush_on_exit=False)
+        buf.add(_record('1', 'broken'))
+        buf.add(_record('2', layer='com.simplegeo.other'))
+        for i in range(100):
+            if buf.failed and self.sent:
+                break
+            time.sleep(0.01)
+        self.failUnlessEqual(buf.failed.keys(), [(TESTING_LAYER, '1')])
+        self.failUnlessEqual(self.sent, [('com.simplegeo.other.json', [('2', 'first')])])
+
+        # The buffer's thread is still flushing.
+        buf.add(_record('3'))
+        for i in range(100):
+            if len(self.sent) > 1:
+                break
+            time.sleep(0.01)
+        self.failUnlessEqual(self.sent[-1], ('com.simplegeo.test.json', [('3', 'first')]))
+        buf.close()
+
+    def test_max_age(self):
+        clock = FakeClock()
+        buf = WriteBuffer(self.client.storage, max_age=60, clock=clock, flush_on_exit=False)
+        buf.add(_record('1'))
+        clock.now += 30
+        buf.add(_record('2', layer='com.simplegeo.other'))
+        self.failUnlessEqual(buf.flush_expired(), 0)
+        clock.now += 30
+        self.failUnlessEqual(buf.flush_expired(), 1)
+        self.failUnlessEqual(self.sent, [('com.simplegeo.test.json', [('1', 'first')])])
+        buf.close()
+        self.failUnlessEqual(len(self.sent), 2)
+
+    def test_thread(self):
+        buf = WriteBuffer(self.client.storage, max_age=0.05, flush_on_exit=False)
+        buf.add(_record('1'))
+        for i in range(100):
+            if self.sent:
+                break
+            time.sleep(0.01)
+        self.failUnlessEqual(self.sent, [('com.simplegeo.test.json', [('1', 'first')])])
+        buf.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import threading
 import unittest
 from decimal import Decimal as D
 
@@ -6,7 +7,7 @@ import mock
 
 from simplegeo import Client
 from simplegeo.models import Feature
-from simplegeo.util import APIError, DecodeError, is_valid_lat, is_valid_lon, is_valid_ip, to_unicode
+from simplegeo.util import APIError, DecodeError, is_valid_lat, is_valid_lon, is_valid_ip, ip_network, to_unicode, VALIDATE_STRICT, VALIDATE_TRUSTED, json_decode, split_bbox, merge_features
 
 MY_OAUTH_KEY = 'MY_OAUTH_KEY'
 MY_OAUTH_SECRET = 'MY_SECRET_KEY'
@@ -65,6 +66,21 @@ class LatLonValidationTest(unittest.TestCase):
         self.failIf(is_valid_lat(-90.0002))
         self.failIf(is_valid_lat(D('-90.0002')))
 
+class BBoxTest(unittest.TestCase):
+    def test_split_bbox(self):
+        self.failUnlessEqual(split_bbox(D('10'), D('20'), D('12'), D('26'), rows=2, cols=3),
+                             [(D('10'), D('20'), D('11'), D('22')), (D('10'), D('22'), D('11'), D('24')), (D('10'), D('24'), D('11'), D('26')),
+                              (D('11'), D('20'), D('12'), D('22')), (D('11'), D('22'), D('12'), D('24')), (D('11'), D('24'), D('12'), D('26'))])
+        self.failUnlessEqual(split_bbox(0.0, 0.0, 0.3, 0.3, rows=3, cols=1)[-1][1:], (0.0, 0.3, 0.3))
+        self.failUnlessEqual(split_bbox(37, -123, 38, -122),
+                             [(37, -123, 37.5, -122.5), (37, -122.5, 37.5, -122),
+                              (37.5, -123, 38, -122.5), (37.5, -122.5, 38, -122)])
+        self.assertRaises(ValueError, split_bbox, 0, 0, 1, 1, rows=0)
+
+    def test_merge_features(self):
+        merged = merge_features([[{'id': 'a'}, {'id': 'b'}], [{'id': 'b', 'x': 1}, {'handle': 'c'}, {'name': 'no id'}], [{'handle': 'c'}, {'name': 'no id'}]])
+        self.failUnlessEqual(merged, [{'id': 'a'}, {'id': 'b'}, {'handle': 'c'}, {'name': 'no id'}, {'name': 'no id'}])
+
 class DecodeErrorTest(unittest.TestCase):
     def test_repr(self):
         body = 'this is not json'
@@ -78,6 +94,28 @@ class DecodeErrorTest(unittest.TestCase):
         self.failUnless("Could not decode JSON" in e.msg, repr(e.msg))
         self.failUnless('JSONDecodeError' in repr(e), repr(e))
 
+class NumericModeTest(unittest.TestCase):
+    def test_json_decode(self):
+        self.failUnlessEqual(type(json_decode('[1.5]')[0]), D)
+        self.failUnlessEqual(type(json_decode('[1.5]', numeric=json.FLOAT)[0]), float)
+        self.failUnlessEqual(type(json_decode('[1]', numeric=json.FLOAT)[0]), int)
+        self.assertRaises(ValueError, json_decode, '[1.5]', numeric='binary')
+
+    def test_client(self):
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        self.failUnlessEqual(client.numeric, json.DECIMAL)
+        self.assertRaises(ValueError, Client, MY_OAUTH_KEY, MY_OAUTH_SECRET, numeric='binary')
+
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, numeric=json.FLOAT)
+        for subclient in (client.context, client.places, client.places12, client.storage):
+            self.failUnlessEqual(subclient.numeric, json.FLOAT)
+
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json'}, EXAMPLE_POINT_BODY)
+        client.http = mockhttp
+        res = client.get_feature("SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970")
+        self.failUnlessEqual(type(res.coordinates[0]), float)
+
 class ClientTest(unittest.TestCase):
     def setUp(self):
         self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, host=API_HOST, port=API_PORT)
@@ -87,10 +125,56 @@ class ClientTest(unittest.TestCase):
     def test_is_valid_ip(self):
         self.failUnless(is_valid_ip('192.0.32.10'))
         self.failIf(is_valid_ip('i am not an ip address at all'))
+        for ip in ['0.0.0.0', '2001:db8::1', 'FE80::1', '1:2:3:4:5:6:7::', '::ffff:1.2.3.4', 3232235777]:
+            self.failUnless(is_valid_ip(ip), ip)
+        for ip in ['01.2.3.4', '256.1.1.1', '1.2.3.4\n', '1.2.3', '1::2::3', '12345::', '1:2:3:4:5:6:7:8:9', '', None]:
+            self.failIf(is_valid_ip(ip), ip)
+
+    def test_ip_network(self):
+        self.failUnlessEqual(ip_network('10.1.2.3', 24), ip_network('10.1.2.250', 24))
+        self.failUnlessEqual(ip_network('10.1.2.3', 24), (4, 0x0a0102, 24))
+        self.failIfEqual(ip_network('10.1.2.3'), ip_network('10.1.2.4'))
+        self.failUnlessEqual(ip_network('2001:db8:1:2::5', v6_prefix=48), ip_network('2001:0db8:0001:ffff::', v6_prefix=48))
+        self.failUnlessEqual(ip_network('::1'), ip_network('0:0:0:0:0:0:0:1'))
+        self.failUnlessEqual(ip_network('::ffff:1.2.3.4'), (6, 0xffff01020304, 128))
+        self.failUnlessRaises(ValueError, ip_network, 'not an ip')
 
     def test_wrong_endpoint(self):
         self.assertRaises(Exception, self.client._endpoint, 'wrongwrong')
 
+    def test_thread_client(self):
+        self.failUnless(self.client._thread_client() is self.client)
+        clients = []
+        def work():
+            clients.append(self.client._thread_client())
+            clients.append(self.client._thread_client())
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        self.failUnless(clients[0] is clients[1])
+        self.failIf(clients[0] is self.client)
+        self.failIf(clients[0].http is self.client.http)
+        self.failUnlessEqual(clients[0].endpoints, self.client.endpoints)
+
+    def test_validation_policy(self):
+        self.failUnlessEqual(self.client.validation, VALIDATE_STRICT)
+        self.assertRaises(ValueError, Client, MY_OAUTH_KEY, MY_OAUTH_SECRET, validation='sometimes')
+
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, validation=VALIDATE_TRUSTED)
+        for subclient in (client.context, client.places, client.places12, client.storage):
+            self.failUnlessEqual(subclient.validation, VALIDATE_TRUSTED)
+
+    def test_get_feature_trusted(self):
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, validation=VALIDATE_TRUSTED)
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json'}, EXAMPLE_POINT_BODY)
+        client.http = mockhttp
+
+        with mock.patch('simplegeo.models.deep_validate_lat_lon') as validate:
+            res = client.get_feature("SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970")
+        self.failIf(validate.called)
+        self.failUnless(isinstance(res, Feature), (repr(res), type(res)))
+
     def test_missing_argument(self):
         self.assertRaises(Exception, self.client._endpoint, 'feature')
 
@@ -4,7 +4,10 @@ from decimal import Decimal as D
 
 import mock
 
+import simplegeo.json as json
 from simplegeo import Client
+from simplegeo.cache import ContextCache, IPCache
+from simplegeo.test.test_cache import FakeClock
 from simplegeo.models import Feature
 from simplegeo.util import APIError, DecodeError
 
@@ -69,6 +72,75 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][2]['body'], '')
         self.assertEqual(mockhttp.method_calls[0][2]['headers']['Authorization'], 'OAuth realm="http://api.simplegeo.com", oauth_body_hash="2jmj7l5rSw0yVb%2FvlWAYkK%2FYBwk%3D", oauth_nonce="5", oauth_timestamp="6", oauth_consumer_key="MY_OAUTH_KEY", oauth_signature_method="HMAC-SHA1", oauth_version="1.0", oauth_signature="aCYUTCHSeVlAQiu0CmG2tF71I74%3D"')
 
+    def test_get_context_cache(self):
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, EXAMPLE_BODY)
+        self.client.context.http = mockhttp
+        clock = FakeClock()
+        cache = self.client.context.context_cache = ContextCache(precision=3, ttl=3600, section_ttls={'weather': 60}, clock=clock)
+
+        res = self.client.context.get_context(D('37.80161'), D('-122.47831'))
+        self.assertEqual(res, json.loads(EXAMPLE_BODY))
+        res = self.client.context.get_context(D('37.80158'), D('-122.47829'))
+        self.assertEqual(res, json.loads(EXAMPLE_BODY))
+        self.assertEqual(mockhttp.request.call_count, 1)
+
+        # A different filter or a point on another block is a miss.
+        self.client.context.get_context(D('37.80161'), D('-122.47831'), filter='features')
+        self.client.context.get_context(D('37.80261'), D('-122.47831'))
+        self.assertEqual(mockhttp.request.call_count, 3)
+
+        # Once the weather is stale, only the weather is fetched again.
+        clock.now += 61
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, '{"weather": {"temperature": "60F"}}')
+        res = self.client.context.get_context(D('37.80161'), D('-122.47831'))
+        self.assertEqual(mockhttp.request.call_count, 4)
+        self.assertEqual(mockhttp.method_calls[-1][1][0], 'http://api.simplegeo.com:80/%s/context/%s,%s.json?filter=weather' % (API_VERSION, D('37.80161'), D('-122.47831')))
+        self.assertEqual(res['weather'], {'temperature': '60F'})
+        self.assertEqual(res['features'], json.loads(EXAMPLE_BODY)['features'])
+        self.client.context.get_context(D('37.80161'), D('-122.47831'))
+        self.assertEqual(mockhttp.request.call_count, 4)
+        self.assertEqual(cache.stats()['stale'], 1)
+
+    def test_get_context_many(self):
+        def request(url, method, body=None, headers=None):
+            point = url.split('/')[-1].split('.json')[0]
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps({'query': point}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.context.http = mockhttp
+
+        points = [(D('37.8016'), D('-122.4783')), (D('40.0'), D('-105.0')),
+                  (D('37.8016'), D('-122.4783')), (D('37.80161'), D('-122.47831'))]
+        res = self.client.context.get_context_many(points, filter='features', concurrency=2)
+        self.assertEqual([r['query'] for r in res], ['37.8016,-122.4783', '40.0,-105.0', '37.8016,-122.4783', '37.80161,-122.47831'])
+        self.assertEqual(mockhttp.request.call_count, 3)
+        self.failUnless(all('filter=features' in call[0][0] for call in mockhttp.request.call_args_list))
+
+        res = self.client.context.get_context_many(points, precision=3)
+        self.assertEqual([r['query'] for r in res], ['37.8016,-122.4783', '40.0,-105.0', '37.8016,-122.4783', '37.8016,-122.4783'])
+        self.assertEqual(mockhttp.request.call_count, 5)
+
+        self.failUnlessRaises(ValueError, self.client.context.get_context_many, [(91, 0)])
+        self.assertEqual(self.client.context.get_context_many([]), [])
+
+        def request(url, method, body=None, headers=None):
+            point = url.split('/')[-1].split('.json')[0]
+            if point == '40.0,-105.0':
+                return ({'status': '503', 'content-type': 'application/json'}, '')
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps({'query': point}))
+        mockhttp.request.side_effect = request
+        res = self.client.context.get_context_many(points, raise_on_error=False)
+        self.assertEqual([r['query'] for r in res if isinstance(r, dict)], ['37.8016,-122.4783', '37.8016,-122.4783', '37.80161,-122.47831'])
+        self.failUnless(isinstance(res[1], APIError))
+        try:
+            self.client.context.get_context_many(points)
+        except APIError, e:
+            self.assertEqual(e.code, 503)
+            self.assertEqual(e.results[0]['query'], '37.8016,-122.4783')
+        else:
+            self.fail('get_context_many() should have raised')
+
     def test_get_context_by_address(self):
         mockhttp = mock.Mock()
         mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, EXAMPLE_BODY)
@@ -92,6 +164,23 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/context/37.69903420794415,-122.4810791015625,37.80001858607365,-122.40554809570312.json' % (API_VERSION))
         self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
 
+    def test_get_context_from_bbox_tiled(self):
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, EXAMPLE_BODY)
+        self.client.context.http = mockhttp
+
+        res = self.client.context.get_context_from_bbox_tiled(
+            D('37.6'), D('-122.5'), D('37.8'), D('-122.3'), rows=2, cols=3, features__category='Neighborhood')
+        self.assertEqual(mockhttp.request.call_count, 6)
+        urls = sorted(call[0][0] for call in mockhttp.request.call_args_list)
+        self.failUnless('http://api.simplegeo.com:80/%s/context/37.6,-122.5,37.7,-122.4333333333333333333333333.json?features__category=Neighborhood' % (API_VERSION,) in urls, urls)
+        # Every tile returns the same features, so they're deduped.
+        self.assertEqual(res['features'], json.loads(EXAMPLE_BODY)['features'])
+
+        res = self.client.context.get_context_from_bbox_tiled(
+            D('37.6'), D('-122.5'), D('37.8'), D('-122.3'), rows=1, cols=1, tile_limit=2, max_depth=1)
+        self.assertEqual(mockhttp.request.call_count, 6 + 1 + 4)
+
     def test_get_context_by_my_ip(self):
         mockhttp = mock.Mock()
         mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, EXAMPLE_BODY)
@@ -113,6 +202,39 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/context/%s.json' % (API_VERSION, ipaddr))
         self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
 
+    def test_get_context_by_ip_cache(self):
+        def request(url, method, body=None, headers=None):
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps({'query': url.split('/')[-1]}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.context.http = mockhttp
+
+        ips = ['66.249.66.1', '66.249.66.7', '66.249.67.1', '2001:db8:1::1', '2001:db8:1:2::1', '66.249.66.1']
+        res = list(self.client.context.get_context_by_ip_many(ips, concurrency=2))
+        self.assertEqual(mockhttp.request.call_count, 5)
+        self.failUnless(res[0] is res[5])
+
+        cache = self.client.context.ip_cache = IPCache(v4_prefix=24, v6_prefix=48)
+        res = list(self.client.context.get_context_by_ip_many(ips, concurrency=2))
+        self.assertEqual([r['query'] for r in res], ['66.249.66.1.json', '66.249.66.1.json', '66.249.67.1.json',
+                                                     '2001:db8:1::1.json', '2001:db8:1::1.json', '66.249.66.1.json'])
+        self.assertEqual(mockhttp.request.call_count, 8)
+        self.failUnless(self.client.context.get_context_by_ip('66.249.66.99') is res[0])
+        self.client.context.get_context_by_ip('66.249.66.99', filter='weather')
+        self.assertEqual(mockhttp.request.call_count, 9)
+        self.assertEqual(cache.stats()['entries'], 4)
+
+        def request(url, method, body=None, headers=None):
+            if '66.249.70.1' in url:
+                return ({'status': '503', 'content-type': 'application/json'}, '')
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps({'query': url.split('/')[-1]}))
+        mockhttp.request.side_effect = request
+        res = list(self.client.context.get_context_by_ip_many(['66.249.66.1', 'not an ip', '-', '66.249.70.1', '66.249.71.1']))
+        self.failUnless(res[0] is self.client.context.get_context_by_ip('66.249.66.1'))
+        self.assertEqual([type(r) for r in res[1:4]], [ValueError, ValueError, APIError])
+        self.assertEqual(res[4]['query'], '66.249.71.1.json')
+        self.failUnlessRaises(ValueError, self.client.context.get_context_by_ip, '40.1,127.999')
+
     def test_get_context_by_ip_invalid(self):
         mockhttp = mock.Mock()
         mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, EXAMPLE_BODY)
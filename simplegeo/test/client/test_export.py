@@ -0,0 +1,80 @@
+import unittest
+import urlparse
+from StringIO import StringIO
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.storage.export import iter_layer, export_ndjson, _tiles, _radius, WORLD, MAX_RADIUS
+from simplegeo.util import distance
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+TESTING_LAYER = 'com.simplegeo.test'
+
+# A record every tenth of a degree over a one degree square.
+RECORDS = [{'type': 'Feature', 'id': '%d,%d' % (i, j), 'created': 1300000000,
+            'geometry': {'type': 'Point', 'coordinates': [D(j) / 10, D(i) / 10]},
+            'properties': {}}
+           for i in range(11) for j in range(11)]
+
+
+def _request(url, method, body=None, headers=None):
+    parts = urlparse.urlparse(url)
+    lat, lon = map(float, parts.path.split('/')[-1][:-len('.json')].split(','))
+    query = dict(urlparse.parse_qsl(parts.query))
+    radius, limit = float(query['radius']), int(query['limit'])
+    start = int(query.get('cursor', 0))
+    nearby = [r for r in RECORDS
+              if distance(lat, lon, r['geometry']['coordinates'][1], r['geometry']['coordinates'][0]) <= radius]
+    page = nearby[start:start + limit]
+    response = {'type': 'FeatureCollection', 'features': page}
+    if start + limit < len(nearby):
+        response['next_cursor'] = str(start + limit)
+    return ({'status': '200', 'content-type': 'application/json'}, json.dumps(response))
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        self.mockhttp = mock.Mock()
+        self.mockhttp.request.side_effect = _request
+        self.client.storage.http = self.mockhttp
+
+    def test_iter_layer(self):
+        records = list(iter_layer(self.client.storage, TESTING_LAYER, bbox=(0, 0, 1, 1),
+                                  rows=3, cols=2, page_size=7, concurrency=3))
+        self.failUnlessEqual(sorted(r['id'] for r in records), sorted(r['id'] for r in RECORDS))
+        self.failUnless(self.mockhttp.request.call_count > 6)
+        self.failUnless(all('limit=7' in call[0][0] for call in self.mockhttp.request.call_args_list))
+
+        records = list(iter_layer(self.client.storage, TESTING_LAYER, bbox=(0, 0, D('0.45'), D('0.45')),
+                                  rows=1, cols=1, concurrency=1))
+        self.failUnlessEqual(len(records), 25)
+        self.assertRaises(ValueError, list, iter_layer(self.client.storage, TESTING_LAYER, bbox=(0, 0, 91, 1)))
+
+    def test_iter_layer_max_radius(self):
+        records = list(iter_layer(self.client.storage, TESTING_LAYER, bbox=(0, 0, 1, 1),
+                                  rows=1, cols=1, max_radius=20))
+        self.failUnlessEqual(sorted(r['id'] for r in records), sorted(r['id'] for r in RECORDS))
+        radii = [float(urlparse.parse_qs(urlparse.urlparse(call[0][0]).query)['radius'][0])
+                 for call in self.mockhttp.request.call_args_list]
+        self.failUnlessEqual(len(radii), 16)
+        self.failUnless(max(radii) <= 20)
+
+        tiles = list(_tiles(WORLD, 4, 8, MAX_RADIUS * 20))
+        self.failUnless(len(tiles) > 32)
+        self.failUnless(all(_radius(*tile)[2] <= MAX_RADIUS * 20 for tile in tiles))
+        self.assertRaises(ValueError, list, iter_layer(self.client.storage, TESTING_LAYER, max_radius=0))
+
+    def test_export_ndjson(self):
+        fp = StringIO()
+        n = export_ndjson(self.client.storage, TESTING_LAYER, fp, bbox=(0, 0, 1, 1), rows=2, cols=2)
+        self.failUnlessEqual(n, len(RECORDS))
+        lines = fp.getvalue().splitlines()
+        self.failUnlessEqual(len(lines), len(RECORDS))
+        self.failUnlessEqual(sorted(json.loads(line) for line in lines),
+                             sorted(json.loads(json.dumps(r)) for r in RECORDS))
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.storage import loader
+from simplegeo.storage.loader import read_ndjson, read_csv, read_geojson, load
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+TESTING_LAYER = 'com.simplegeo.test'
+
+
+def _feature(i):
+    return {'type': 'Feature', 'id': str(i), 'created': 1300000000 + i,
+            'geometry': {'type': 'Point', 'coordinates': [D('-122.4783'), D('37.8016')]},
+            'properties': {'name': 'record %d' % (i,), 'layer': 'elsewhere'}}
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        self.mockhttp = mock.Mock()
+        self.mockhttp.request.return_value = ({'status': '202', 'content-type': 'application/json'}, '')
+        self.client.storage.http = self.mockhttp
+
+    def _check(self, records, n):
+        records = list(records)
+        self.failUnlessEqual([r.id for r in records], [str(i) for i in range(n)])
+        self.failUnlessEqual(records[1].layer, TESTING_LAYER)
+        self.failUnlessEqual(records[1].lat, D('37.8016'))
+        self.failUnlessEqual(records[1].name, 'record 1')
+
+    def test_read_ndjson(self):
+        fp = StringIO('\n'.join(json.dumps(_feature(i)) for i in range(3)) + '\n\n')
+        self._check(read_ndjson(fp, TESTING_LAYER), 3)
+
+    def test_read_csv(self):
+        fp = StringIO('id,lat,lon,name\n0,37.8016,-122.4783,record 0\n1,37.8016,-122.4783,record 1\n')
+        self._check(read_csv(fp, TESTING_LAYER), 2)
+        fp = StringIO('id,lat,lon\n0,91,0\n')
+        self.assertRaises(ValueError, list, read_csv(fp, TESTING_LAYER))
+
+    def test_read_geojson(self):
+        collection = {'type': 'FeatureCollection', 'features': [_feature(i) for i in range(50)]}
+        body = json.dumps(collection)
+        with mock.patch.object(loader, '_READ_SIZE', 100):
+            self._check(read_geojson(StringIO(body), TESTING_LAYER), 50)
+            self._check(read_geojson(StringIO(json.dumps(collection, indent=2)), TESTING_LAYER), 50)
+            self.failUnlessEqual(list(read_geojson(StringIO('{"features": []}'), TESTING_LAYER)), [])
+            self.assertRaises(ValueError, list, read_geojson(StringIO('{"type": "Feature"}'), TESTING_LAYER))
+            records = read_geojson(StringIO(body[:-200]), TESTING_LAYER)
+            self.assertRaises(ValueError, list, records)
+
+            # Members before "features" are skipped over, even ones
+            # with "features" inside them.
+            body = ('{"type": "FeatureCollection", "crs": {"note": "no \\"features\\": [] here", '
+                    '"features": {"x": [[1], "]"]}}, ' + body[1:])
+            self._check(read_geojson(StringIO(body), TESTING_LAYER), 50)
+
+    def test_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            checkpoint = os.path.join(tmpdir, 'checkpoint')
+            records = read_ndjson(StringIO('\n'.join(json.dumps(_feature(i)) for i in range(25))),
+                                  TESTING_LAYER)
+            progress = []
+            def interrupt(stats):
+                progress.append(stats['records'])
+                if stats['records'] >= 20:
+                    raise KeyboardInterrupt()
+            self.assertRaises(KeyboardInterrupt, load, self.client.storage, TESTING_LAYER,
+                              records, slice_size=10, max_records=4, checkpoint=checkpoint,
+                              progress=interrupt)
+            self.failUnlessEqual(progress, [10, 20])
+            self.failUnlessEqual(self.mockhttp.request.call_count, 6)
+
+            records = read_ndjson(StringIO('\n'.join(json.dumps(_feature(i)) for i in range(25))),
+                                  TESTING_LAYER)
+            stats = load(self.client.storage, TESTING_LAYER, records, slice_size=10,
+                         checkpoint=checkpoint)
+            self.failUnlessEqual(stats['records'], 5)
+            self.failUnlessEqual(stats['failed_ids'], [])
+            body = json.loads(self.mockhttp.request.call_args[1]['body'])
+            self.failUnlessEqual([f['id'] for f in body['features']], ['20', '21', '22', '23', '24'])
+            self.failUnlessEqual(json.load(open(checkpoint)), {'offset': 25, 'failed_ids': []})
+        finally:
+            shutil.rmtree(tmpdir)
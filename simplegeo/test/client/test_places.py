@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import os
+import shutil
+import tempfile
 import unittest
 import urllib
 from decimal import Decimal as D
@@ -8,6 +11,7 @@ import simplegeo.json as json
 import mock
 
 from simplegeo import Client
+from simplegeo.journal import Journal
 from simplegeo.models import Feature
 from simplegeo.util import APIError, DecodeError
 
@@ -652,5 +656,75 @@ class PlacesTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
 
 
+    def test_add_features(self):
+        attempts = {}
+        def request(url, method, body=None, headers=None):
+            record_id = json.loads(body)['properties']['record_id']
+            attempts[record_id] = attempts.get(record_id, 0) + 1
+            if record_id == 'bad':
+                return ({'status': '400', 'content-type': 'application/json'}, '')
+            if record_id == 'flaky' and attempts[record_id] < 3 or record_id == 'down':
+                return ({'status': '503', 'content-type': 'application/json'}, '')
+            return ({'status': '202', 'content-type': 'application/json'},
+                    json.dumps({'id': 'SG_%s_37.8016_-122.4783' % (record_id * 22)[:22]}))
+        self.client.places.http = mock.Mock()
+        self.client.places.http.request.side_effect = request
+
+        record_ids = ['a', 'flaky', 'bad', 'down', 'b']
+        features = [Feature((D('37.8016'), D('-122.4783')), properties={'record_id': record_id})
+                    for record_id in record_ids]
+        features.append(Feature((D('37.8016'), D('-122.4783')), simplegeohandle='SG_%s_37.8016_-122.4783' % ('x' * 22,)))
+        slept = []
+        res = self.client.places.add_features(features, concurrency=3, sleep=slept.append)
+        self.failUnlessEqual(res['features'], 6)
+        self.failUnlessEqual(res['failed'], 3)
+        self.failUnlessEqual(res['handles'], {'a': 'SG_%s_37.8016_-122.4783' % ('a' * 22,),
+                                              'flaky': 'SG_%s_37.8016_-122.4783' % (('flaky' * 22)[:22],),
+                                              'b': 'SG_%s_37.8016_-122.4783' % ('b' * 22,)})
+        self.failUnlessEqual([r['record_id'] for r in res['results']], record_ids + [None])
+        self.failUnlessEqual([r['attempts'] for r in res['results']], [1, 3, 1, 3, 1, 1])
+        self.failUnlessEqual([r['error'] and type(r['error']) for r in res['results']],
+                             [None, None, APIError, APIError, None, ValueError])
+        self.failUnlessEqual(sorted(slept), [1.0, 1.0, 2.0, 2.0])
+
+    def test_add_features_journal(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            journal = Journal(os.path.join(tmpdir, 'writes.journal'))
+            client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, host=API_HOST, port=API_PORT, journal=journal)
+            attempts = []
+            def request(url, method, body=None, headers=None):
+                record_id = json.loads(body)['properties']['record_id']
+                attempts.append(record_id)
+                if record_id == 'bad':
+                    return ({'status': '400', 'content-type': 'application/json'}, '')
+                if record_id == 'boom':
+                    raise RuntimeError('boom')
+                if record_id == 'down' or attempts.count(record_id) < 3:
+                    return ({'status': '503', 'content-type': 'application/json'}, '')
+                return ({'status': '202', 'content-type': 'application/json'},
+                        json.dumps({'id': 'SG_%s_37.8016_-122.4783' % ('a' * 22,)}))
+            client.places.http = mock.Mock()
+            client.places.http.request.side_effect = request
+
+            features = [Feature((D('37.8016'), D('-122.4783')), properties={'record_id': record_id})
+                        for record_id in ('a', 'bad', 'down', 'boom')]
+            res = client.places.add_features(features, concurrency=1, sleep=lambda seconds: None)
+            self.failUnlessEqual([r['attempts'] for r in res['results']], [3, 1, 3, 1])
+            self.failUnlessEqual([r['error'] and type(r['error']) for r in res['results']],
+                                 [None, APIError, APIError, RuntimeError])
+            # One entry per feature, not one per attempt. The one which
+            # went through is done, the one the server turned down is
+            # set aside, and the others are left to be replayed.
+            self.failUnlessEqual([args['feature']['properties']['record_id']
+                                  for seq, op, args in journal.pending()], ['down', 'boom'])
+            rejected = [json.loads(line) for line in open(journal.rejected_path)]
+            self.failUnlessEqual([entry['code'] for entry in rejected], [400])
+            entries = [json.loads(line) for line in open(journal.path)]
+            self.failUnlessEqual(sorted(entry.get('op') for entry in entries), [None, None] + ['add_feature'] * 4)
+            journal.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
 if __name__ == '__main__':
     unittest.main()
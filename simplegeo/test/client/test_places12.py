@@ -0,0 +1,341 @@
+import pickle
+import threading
+import unittest
+import urlparse
+from StringIO import StringIO
+from decimal import Decimal as D
+
+import simplegeo.json as json
+import mock
+
+from simplegeo import Client
+from simplegeo.cache import GeohashCache, IPCache
+from simplegeo.places.places_12 import Response
+from simplegeo.util import DecodeError
+from simplegeo.test.client.test_client import EXAMPLE_BODY, EXAMPLE_POINT_BODY
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+
+API_HOST = 'api.simplegeo.com'
+API_PORT = 80
+
+EXAMPLE_SEARCH_BODY = json.dumps({
+        'type': 'FeatureCollection',
+        'features': [json.loads(EXAMPLE_POINT_BODY), json.loads(EXAMPLE_BODY)]})
+
+class ResponseTest(unittest.TestCase):
+
+    def test_numeric(self):
+        res = Response(EXAMPLE_POINT_BODY, {}, numeric=json.FLOAT)
+        self.failUnlessEqual(type(res['geometry']['coordinates'][0]), float)
+        res = Response(EXAMPLE_POINT_BODY, {})
+        self.failUnlessEqual(type(res['geometry']['coordinates'][0]), D)
+
+    @mock.patch('simplegeo.places.places_12.json_decode')
+    def test_lazy(self, json_decode):
+        json_decode.return_value = {'type': 'Feature'}
+        headers = {'status': '200'}
+        res = Response(EXAMPLE_POINT_BODY, headers, lazy=True)
+        self.failUnlessEqual(res.body, EXAMPLE_POINT_BODY)
+        self.failUnlessEqual(res.headers, headers)
+        self.failIf(json_decode.called)
+
+        self.failUnlessEqual(res['type'], 'Feature')
+        self.failUnlessEqual(len(res), 1)
+        self.failUnlessEqual(dict(res), {'type': 'Feature'})
+        self.failUnlessEqual(json_decode.call_count, 1)
+
+    @mock.patch('simplegeo.places.places_12.json_decode')
+    def test_lazy_decode_once(self, json_decode):
+        res = Response(EXAMPLE_POINT_BODY, {}, lazy=True)
+        def decode(body, numeric):
+            # Other threads can't see it as decoded until it is.
+            self.failIf(res.decoded)
+            if json_decode.call_count == 1:
+                raise MemoryError()
+            return {'type': 'Feature'}
+        json_decode.side_effect = decode
+        self.assertRaises(MemoryError, res.decode)
+        self.failIf(res.decoded)
+        threads = [threading.Thread(target=res.decode) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.failUnlessEqual(res, {'type': 'Feature'})
+        self.failUnlessEqual(json_decode.call_count, 2)
+
+    def test_eager(self):
+        res = Response(EXAMPLE_POINT_BODY, {})
+        self.failUnless(res.decoded)
+        self.failUnlessEqual(dict(res), json.loads(EXAMPLE_POINT_BODY))
+        self.failUnlessEqual(json.loads(json.dumps(res)), json.loads(EXAMPLE_POINT_BODY))
+        self.failUnlessEqual(dict(**res), json.loads(EXAMPLE_POINT_BODY))
+
+    def test_pickle(self):
+        for res in (Response(EXAMPLE_POINT_BODY, {'status': '200'}),
+                    Response(EXAMPLE_POINT_BODY, {'status': '200'}, lazy=True),
+                    Response.from_dict(json.loads(EXAMPLE_POINT_BODY), {'status': '200'})):
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                copy = pickle.loads(pickle.dumps(res, protocol))
+                self.failUnlessEqual(dict(copy), json.loads(EXAMPLE_POINT_BODY))
+                self.failUnlessEqual(copy.headers, {'status': '200'})
+                self.failUnlessEqual(json.loads(copy.body), json.loads(EXAMPLE_POINT_BODY))
+        copy = pickle.loads(pickle.dumps(Response('this is not json', {}), pickle.HIGHEST_PROTOCOL))
+        self.failUnlessEqual(copy, {})
+        self.failUnless(isinstance(copy.decode_error, DecodeError))
+
+    def test_mapping(self):
+        for access in (len, lambda r: r.keys(), lambda r: r == json.loads(EXAMPLE_POINT_BODY),
+                       lambda r: 'geometry' in r, lambda r: list(r), lambda r: r.get('id')):
+            res = Response(EXAMPLE_POINT_BODY, {}, lazy=True)
+            self.failUnless(access(res))
+            self.failUnless(res.decoded)
+
+    def test_decode_error(self):
+        res = Response('this is not json', {})
+        self.failUnlessEqual(res, {})
+        self.failUnless(isinstance(res.decode_error, DecodeError))
+        self.failUnlessEqual(Response(EXAMPLE_POINT_BODY, {}).decode().decode_error, None)
+
+    @mock.patch('simplegeo.places.places_12.json_decode')
+    def test_select(self, json_decode):
+        res = Response(EXAMPLE_SEARCH_BODY, {}, lazy=True)
+        ids = ['SG_6sRJczWZHdzNj4qSeRzpzz_40.005274_-105.048054@1291669259',
+               'SG_4b10i9vCyPnKAYiYBLKZN7']
+        self.failUnlessEqual(res.select('features[*].id'), ids)
+        self.failUnlessEqual(res.select(['features', '0', 'properties', 'tags']), ['sandwich'])
+        self.failUnlessEqual(res.select('features.*.properties.phone'), ['+1 303 664 9448'])
+        self.assertRaises(KeyError, res.select, 'features.2')
+        self.failIf(json_decode.called)
+        self.failIf(res.decoded)
+
+        self.assertRaises(DecodeError, Response('{"features": [', {}, lazy=True).select, 'features')
+
+    def test_select_decoded(self):
+        res = Response(EXAMPLE_SEARCH_BODY, {}).decode()
+        undecoded = Response(EXAMPLE_SEARCH_BODY, {}, lazy=True)
+        for path in ('features[*].id', 'features.1.geometry.type',
+                     'features.*.properties.classifiers.*.category', 'type'):
+            self.failUnlessEqual(res.select(path), undecoded.select(path))
+        self.assertRaises(KeyError, res.select, 'features.2')
+        self.assertRaises(KeyError, res.select, 'type.0')
+
+
+class Places12Test(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, host=API_HOST, port=API_PORT)
+
+    def test_search(self):
+        mockhttp = mock.Mock()
+        headers = {'status': '200', 'content-type': 'application/json'}
+        mockhttp.request.return_value = (headers, EXAMPLE_SEARCH_BODY)
+        self.client.places12.http = mockhttp
+
+        res = self.client.places12.search(D('37.8016'), D('-122.4783'), radius=2, limit=10)
+        self.failUnlessEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/1.2/places/37.8016,-122.4783.json?limit=10&radius=2')
+        self.failUnless(isinstance(res, Response))
+        self.failUnlessEqual(res.headers, headers)
+        self.failUnlessEqual(res.body, EXAMPLE_SEARCH_BODY)
+        self.failUnlessEqual(len(res['features']), 2)
+        self.failUnless(res.decoded)
+
+        self.client.places12.lazy_responses = True
+        res = self.client.places12.search(D('37.8016'), D('-122.4783'))
+        self.failIf(res.decoded)
+        self.failUnlessEqual(len(res['features']), 2)
+
+    def _mock_pages(self, total, overlap=0):
+        """Serve total features, page by page, with each page also
+        repeating the last overlap features of the page before."""
+        requested = []
+        def request(url, method, body=None, headers=None):
+            query = dict(urlparse.parse_qsl(urlparse.urlparse(url).query))
+            start = int(query.get('start', 0))
+            limit = int(query['limit'])
+            requested.append(start)
+            ids = range(max(start - overlap, 0), min(start + limit, total))
+            features = [{'type': 'Feature', 'id': 'SG_%d' % i} for i in ids]
+            return ({'status': '200'}, json.dumps({'type': 'FeatureCollection', 'features': features}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.places12.http = mockhttp
+        return requested
+
+    def test_iter_search(self):
+        requested = self._mock_pages(23, overlap=2)
+        features = list(self.client.places12.iter_search(D('37.8016'), D('-122.4783'), page_size=10))
+        self.failUnlessEqual([f['id'] for f in features], ['SG_%d' % i for i in range(23)])
+        self.failUnlessEqual(requested, [0, 10, 20])
+
+    def test_iter_search_max_results(self):
+        requested = self._mock_pages(100)
+        features = list(self.client.places12.iter_search_text('coffee', page_size=10, max_results=15))
+        self.failUnlessEqual([f['id'] for f in features], ['SG_%d' % i for i in range(15)])
+        self.failUnlessEqual(requested, [0, 10])
+
+    def test_iter_search_prefetches(self):
+        requested = self._mock_pages(100)
+        prefetched = threading.Event()
+        mockrequest = self.client.places12.http.request.side_effect
+        def request(url, *args, **kwargs):
+            result = mockrequest(url, *args, **kwargs)
+            if len(requested) == 2:
+                prefetched.set()
+            return result
+        self.client.places12.http.request.side_effect = request
+
+        features = self.client.places12.iter_search_bbox(D('37.7'), D('-122.5'), D('37.8'), D('-122.4'), page_size=10)
+        features.next()
+        self.failUnless(prefetched.wait(5))
+        features.close()
+
+    def test_iter_search_stops_without_progress(self):
+        mockhttp = mock.Mock()
+        page = [{'type': 'Feature', 'id': 'SG_%d' % i} for i in range(10)]
+        mockhttp.request.return_value = ({'status': '200'}, json.dumps({'features': page}))
+        self.client.places12.http = mockhttp
+
+        features = list(self.client.places12.iter_search_by_ip('192.0.32.10', page_size=10))
+        self.failUnlessEqual(len(features), 10)
+        self.failUnlessEqual(mockhttp.request.call_count, 2)
+
+    def test_iter_search_bad_page_size(self):
+        features = self.client.places12.iter_search_by_address('41 Decatur St', page_size=0)
+        self.assertRaises(ValueError, list, features)
+
+    def _mock_bbox_search(self, places):
+        """Serve search_bbox() and search() from places, a list of
+        (lat, lon, id)."""
+        requested = []
+        def request(url, method, body=None, headers=None):
+            parsed = urlparse.urlparse(url)
+            query = dict(urlparse.parse_qsl(parsed.query))
+            args = [D(x) for x in parsed.path.split('/')[-1][:-len('.json')].split(',')]
+            requested.append(args)
+            if len(args) == 2:
+                args = [args[0] - 1, args[1] - 1, args[0] + 1, args[1] + 1]
+            sw_lat, sw_lon, ne_lat, ne_lon = args
+            features = [{'type': 'Feature', 'id': id, 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}}
+                        for (lat, lon, id) in places
+                        if sw_lat <= lat <= ne_lat and sw_lon <= lon <= ne_lon]
+            return ({'status': '200'}, json.dumps({'type': 'FeatureCollection', 'features': features[:min(int(query.get('limit', 25)), 100)]}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.places12.http = mockhttp
+        return requested
+
+    def test_search_cache(self):
+        places = [(D('37.7700') + D('0.001') * i, D('-122.4200'), 'SG_%d' % i) for i in range(10)]
+        requested = self._mock_bbox_search(places)
+        cache = self.client.places12.search_cache = GeohashCache(precision=6, cell_limit=50)
+
+        res = self.client.places12.search(D('37.7750'), D('-122.4200'), radius=D('0.3'), limit=3)
+        # 37.7750 is SG_5; the nearest after it are SG_4 and SG_6.
+        self.failUnlessEqual([f['id'] for f in res['features']], ['SG_5', 'SG_4', 'SG_6'])
+        cells = len(requested)
+        self.failUnless(cells > 0)
+        self.failUnless(all(len(args) == 4 for args in requested))
+
+        res = self.client.places12.search(D('37.7751'), D('-122.4201'), radius=D('0.3'))
+        self.failUnlessEqual(len(requested), cells)
+        self.failUnlessEqual(sorted(f['id'] for f in res['features']), ['SG_%d' % i for i in range(3, 8)])
+        self.failUnless(cache.hits >= cells)
+        self.failUnless(json.loads(res.body)['features'])
+        # Changing a result doesn't change the cache.
+        res['features'][0]['id'] = 'changed'
+        res = self.client.places12.search(D('37.7751'), D('-122.4201'), radius=D('0.3'))
+        self.failUnlessEqual(sorted(f['id'] for f in res['features']), ['SG_%d' % i for i in range(3, 8)])
+
+        # Searches without a radius, or too big for the cache, go to the network.
+        self.client.places12.search(D('37.7751'), D('-122.4201'))
+        self.client.places12.search(D('37.7751'), D('-122.4201'), radius=50)
+        self.failUnlessEqual([len(args) for args in requested[cells:]], [2, 2])
+
+    def test_search_cache_dense_cell(self):
+        places = [(D('37.7750'), D('-122.4200'), 'SG_%d' % i) for i in range(10)]
+        requested = self._mock_bbox_search(places)
+        self.client.places12.search_cache = GeohashCache(precision=6, cell_limit=5)
+
+        res = self.client.places12.search(D('37.7750'), D('-122.4200'), radius=D('0.1'), limit=8)
+        self.failUnlessEqual(len(res['features']), 8)
+        self.failUnlessEqual(len(requested[-1]), 2)
+
+        # A cell_limit above what the server returns for one request.
+        places = [(D('37.7750'), D('-122.4200'), 'SG_%d' % i) for i in range(150)]
+        requested = self._mock_bbox_search(places)
+        self.client.places12.search_cache = GeohashCache(precision=6, cell_limit=500)
+        self.client.places12.search(D('37.7750'), D('-122.4200'), radius=D('0.1'), limit=8)
+        self.failUnlessEqual(len(requested[-1]), 2)
+
+    def test_search_by_ip_cache(self):
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json'}, EXAMPLE_SEARCH_BODY)
+        self.client.places12.http = mockhttp
+        cache = self.client.places12.ip_cache = IPCache(v4_prefix=24)
+
+        res = self.client.places12.search_by_ip('66.249.66.1', radius=2, query='coffee')
+        self.failUnless(self.client.places12.search_by_ip('66.249.66.200', radius=2, query='coffee') is res)
+        self.failIf(self.client.places12.search_by_ip('66.249.66.200', radius=5, query='coffee') is res)
+        self.assertEqual(mockhttp.request.call_count, 2)
+        self.assertEqual(cache.hits, 1)
+
+        many = list(self.client.places12.search_by_ip_many(['66.249.66.3', '10.0.0.1', 'unknown', '10.0.0.2'], radius=2, query='coffee'))
+        self.failUnless(many[0] is res)
+        self.failUnless(isinstance(many[2], ValueError))
+        self.failUnless(many[1] is many[3])
+        self.assertEqual(mockhttp.request.call_count, 3)
+        self.failUnlessRaises(ValueError, self.client.places12.search_by_ip, '66.249.66', radius=2)
+
+    def test_search_by_ip_cache_dump_load(self):
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json'}, EXAMPLE_SEARCH_BODY)
+        self.client.places12.http = mockhttp
+        self.client.places12.lazy_responses = True
+        cache = self.client.places12.ip_cache = IPCache()
+        res = self.client.places12.search_by_ip('66.249.66.1', query='coffee')
+
+        fp = StringIO()
+        cache.dump(fp)
+        fp.seek(0)
+        loaded = self.client.places12.ip_cache = IPCache()
+        self.failUnlessEqual(loaded.load(fp), 1)
+        copy = self.client.places12.search_by_ip('66.249.66.2', query='coffee')
+        self.failUnlessEqual(mockhttp.request.call_count, 1)
+        self.failUnless(isinstance(copy, Response))
+        self.failUnlessEqual(copy, res)
+        self.failUnlessEqual(copy.body, EXAMPLE_SEARCH_BODY)
+
+    def test_search_bbox_tiled(self):
+        # 40 places on a diagonal across the box, plus one on the edge
+        # between tiles which every tile touching it will return.
+        places = [(D('37.70') + D('0.0025') * i, D('-122.50') + D('0.0025') * i, 'SG_%d' % i) for i in range(40)]
+        places.append((D('37.75'), D('-122.45'), 'SG_edge'))
+        requested = []
+        def request(url, method, body=None, headers=None):
+            path = urlparse.urlparse(url).path
+            limit = int(dict(urlparse.parse_qsl(urlparse.urlparse(url).query))['limit'])
+            sw_lat, sw_lon, ne_lat, ne_lon = [D(x) for x in path.split('/')[-1][:-len('.json')].split(',')]
+            requested.append((sw_lat, sw_lon, ne_lat, ne_lon))
+            features = [{'type': 'Feature', 'id': id, 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}}
+                        for (lat, lon, id) in places
+                        if sw_lat <= lat <= ne_lat and sw_lon <= lon <= ne_lon]
+            return ({'status': '200'}, json.dumps({'type': 'FeatureCollection', 'features': features[:limit]}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.places12.http = mockhttp
+
+        res = self.client.places12.search_bbox_tiled(D('37.70'), D('-122.50'), D('37.80'), D('-122.40'), limit=10, concurrency=3)
+        ids = sorted(f['id'] for f in res['features'])
+        self.failUnlessEqual(ids, sorted(id for (lat, lon, id) in places))
+        # The tiles on the diagonal are full at both levels, so they're
+        # split twice.
+        self.failUnlessEqual(len(requested), 4 + 2 * 4 + 4 * 4)
+
+        self.assertRaises(ValueError, self.client.places12.search_bbox_tiled, D('91'), D('-122.50'), D('37.80'), D('-122.40'))
+
+
+if __name__ == '__main__':
+    unittest.main()
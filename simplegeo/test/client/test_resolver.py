@@ -0,0 +1,94 @@
+import unittest
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.context.resolver import LocalContext, GridIndex, point_in_polygons
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+
+HANDLE = 'SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970'
+
+# A square from 0,0 to 10,10 with a hole from 4,4 to 6,6.
+DONUT = {'type': 'Polygon',
+         'coordinates': [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],
+                         [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]]]}
+# Two unit squares, at 1,1 and at 8,8.
+ISLANDS = {'type': 'MultiPolygon',
+           'coordinates': [[[[1, 1], [2, 1], [2, 2], [1, 2], [1, 1]]],
+                           [[[8, 8], [9, 8], [9, 9], [8, 9], [8, 8]]]]}
+# A triangle with its corners at 0,0, 10,0 and 0,10.
+TRIANGLE = {'type': 'Polygon',
+            'coordinates': [[[0, 0], [10, 0], [0, 10], [0, 0]]]}
+
+BBOX_BODY = json.dumps({'features': [
+    {'name': 'Donut', 'handle': 'donut', 'bounds': [0, 0, 10, 10], 'geometry': DONUT},
+    {'name': 'Islands', 'bounds': [1, 1, 9, 9], 'geometry': ISLANDS},
+    {'name': 'Triangle', 'handle': HANDLE, 'bounds': [0, 0, 10, 10]},
+    {'name': 'Unknown', 'handle': 'unknown', 'bounds': [5, 5, 20, 20]},
+]})
+FEATURE_BODY = json.dumps({'type': 'Feature', 'id': HANDLE,
+                           'geometry': TRIANGLE, 'properties': {}})
+
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        def request(url, method, body=None, headers=None):
+            if '/features/' in url:
+                return ({'status': '200', 'content-type': 'application/json'}, FEATURE_BODY)
+            return ({'status': '200', 'content-type': 'application/json'}, BBOX_BODY)
+        self.mockhttp = mock.Mock()
+        self.mockhttp.request.side_effect = request
+        self.client.context.http = self.mockhttp
+
+    def _names(self, features):
+        return sorted(f['name'] for f in features)
+
+    def test_point_in_polygons(self):
+        polygons = [[[(float(x), float(y)) for x, y in ring] for ring in DONUT['coordinates']]]
+        self.failUnless(point_in_polygons(1, 1, polygons))
+        self.failIf(point_in_polygons(5, 5, polygons))
+        self.failIf(point_in_polygons(11, 5, polygons))
+
+    def test_grid_index(self):
+        index = GridIndex((0, 0, 10, 10), size=4)
+        index.insert((1, 1, 2, 2), 'a')
+        index.insert((0, 0, 10, 10), 'b')
+        index.insert((20, 20, 30, 30), 'c')
+        self.failUnlessEqual(sorted(index.query(1.5, 1.5)), ['a', 'b'])
+        self.failUnlessEqual(index.query(5, 5), ['b'])
+
+    def test_local_context(self):
+        local = LocalContext.prefetch(self.client.context, D('0'), D('0'), D('10'), D('10'),
+                                      rows=1, cols=1, concurrency=2)
+        self.failUnlessEqual(self._names(local.resolved), ['Donut', 'Islands', 'Triangle'])
+        self.failUnlessEqual(self._names(local.unresolved), ['Unknown'])
+        # One bbox request and one get_feature for the triangle.
+        self.failUnlessEqual(self.mockhttp.request.call_count, 2)
+
+        res = local.get_context(D('1.5'), D('1.5'))
+        self.failUnlessEqual(self._names(res['features']), ['Donut', 'Islands', 'Triangle'])
+        self.failUnlessEqual(res['unresolved'], [])
+        self.failUnlessEqual(res['query'], {'latitude': D('1.5'), 'longitude': D('1.5')})
+
+        res = local.get_context(D('5.5'), D('5.5'))
+        self.failUnlessEqual(self._names(res['features']), [])
+        self.failUnlessEqual(self._names(res['unresolved']), ['Unknown'])
+
+        res = local.get_context(D('8.5'), D('8.5'))
+        self.failUnlessEqual(self._names(res['features']), ['Donut', 'Islands'])
+
+        self.assertRaises(ValueError, local.get_context, D('10.5'), D('5'))
+        self.assertRaises(ValueError, local.get_context, D('91'), D('5'))
+        self.failUnlessEqual(self.mockhttp.request.call_count, 2)
+
+    def test_local_context_without_geometry(self):
+        local = LocalContext.prefetch(self.client.context, 0, 0, 10, 10, rows=1, cols=1,
+                                      fetch_geometry=False)
+        self.failUnlessEqual(self._names(local.unresolved), ['Triangle', 'Unknown'])
+        self.failUnlessEqual(self.mockhttp.request.call_count, 1)
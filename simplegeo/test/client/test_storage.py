@@ -0,0 +1,195 @@
+import httplib
+import unittest
+import urlparse
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.cache import LayerCache
+from simplegeo.models import Record, Layer
+from simplegeo.streaming import ChunkedBody
+from simplegeo.test.test_streaming import unchunk
+from simplegeo.test.test_cache import FakeClock
+from simplegeo.util import APIError
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+TESTING_LAYER = 'com.simplegeo.test'
+
+API_HOST = 'api.simplegeo.com'
+API_PORT = 80
+
+
+def _records(n, start=0):
+    for i in range(start, start + n):
+        yield Record(TESTING_LAYER, str(i), D('37.8016'), D('-122.4783'),
+                     created=1300000000, name='record %d' % (i,))
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, host=API_HOST, port=API_PORT)
+        self.mockhttp = mock.Mock()
+        self.mockhttp.request.return_value = ({'status': '202', 'content-type': 'application/json'}, '')
+        self.client.storage.http = self.mockhttp
+
+    def test_add_records(self):
+        res = self.client.storage.add_records(TESTING_LAYER, list(_records(3)))
+        self.failUnlessEqual(res, {'records': 3, 'batches': [{'ids': ['0', '1', '2'], 'error': None}],
+                                   'failed_ids': []})
+        self.failUnlessEqual(self.mockhttp.request.call_count, 1)
+        url, method = self.mockhttp.request.call_args[0]
+        self.failUnlessEqual(url, 'http://api.simplegeo.com:80/0.1/records/%s.json' % (TESTING_LAYER,))
+        self.failUnlessEqual(method, 'POST')
+        body = json.loads(self.mockhttp.request.call_args[1]['body'])
+        self.failUnlessEqual(body['type'], 'FeatureCollection')
+        self.failUnlessEqual(body['features'], [r.to_dict() for r in _records(3)])
+
+    def test_add_records_batches(self):
+        res = self.client.storage.add_records(TESTING_LAYER, _records(25), max_records=10,
+                                              concurrency=3)
+        self.failUnlessEqual([len(b['ids']) for b in res['batches']], [10, 10, 5])
+        self.failUnlessEqual(sum((b['ids'] for b in res['batches']), []), [str(i) for i in range(25)])
+        self.failUnlessEqual(self.mockhttp.request.call_count, 3)
+
+        size = len(json.dumps(_records(1).next().to_dict()))
+        res = self.client.storage.add_records(TESTING_LAYER, _records(5), max_bytes=size * 2 + 4)
+        self.failUnlessEqual([len(b['ids']) for b in res['batches']], [2, 2, 1])
+        for call in self.mockhttp.request.call_args_list[3:]:
+            self.failUnless(len(call[1]['body']) <= size * 2 + 4 + 50)
+
+        res = self.client.storage.add_records(TESTING_LAYER, _records(2), max_bytes=10)
+        self.failUnlessEqual([len(b['ids']) for b in res['batches']], [1, 1])
+
+    def test_add_records_streamed(self):
+        res = self.client.storage.add_records(TESTING_LAYER, _records(1000), max_records=1000,
+                                              max_bytes=1024 * 1024)
+        self.failUnlessEqual(res['records'], 1000)
+        args = self.mockhttp.request.call_args[1]
+        self.failUnless(isinstance(args['body'], ChunkedBody))
+        self.failUnlessEqual(args['headers']['Transfer-Encoding'], 'chunked')
+        body = json.loads(unchunk(args['body']))
+        self.failUnlessEqual(body['features'], [r.to_dict() for r in _records(1000)])
+
+    def test_add_records_failures(self):
+        def request(url, method, body=None, headers=None):
+            if '"id": "1' in body:
+                return ({'status': '500', 'content-type': 'application/json'}, '{"message": "oops"}')
+            if '"id": "3' in body:
+                raise httplib.BadStatusLine('')
+            return ({'status': '202', 'content-type': 'application/json'}, '')
+        self.mockhttp.request.side_effect = request
+        res = self.client.storage.add_records(TESTING_LAYER, _records(4), max_records=1,
+                                              concurrency=2, raise_on_error=False)
+        self.failUnlessEqual(res['records'], 4)
+        self.failUnlessEqual(res['failed_ids'], ['1', '3'])
+        self.failUnless(isinstance(res['batches'][1]['error'], APIError))
+        self.failUnlessEqual(res['batches'][1]['error'].code, 500)
+        self.failUnless(isinstance(res['batches'][3]['error'], httplib.BadStatusLine))
+
+        # By default the failure is raised, once every batch is sent.
+        calls = self.mockhttp.request.call_count
+        try:
+            self.client.storage.add_records(TESTING_LAYER, _records(4), max_records=1)
+        except APIError, e:
+            self.failUnlessEqual(e.code, 500)
+            self.failUnlessEqual(e.summary['failed_ids'], ['1', '3'])
+        else:
+            self.fail("add_records() didn't raise")
+        self.failUnlessEqual(self.mockhttp.request.call_count, calls + 4)
+
+    def test_get_records(self):
+        def request(url, method, body=None, headers=None):
+            ids = url.split('/')[-1][:-len('.json')].split(',')
+            return ({'status': '200', 'content-type': 'application/json'},
+                    json.dumps({'type': 'FeatureCollection',
+                                'features': [r.to_dict() for id in ids if int(id) % 5
+                                             for r in _records(1, int(id))]}))
+        self.mockhttp.request.side_effect = request
+
+        ids = [str(i) for i in range(1, 11)]
+        res = self.client.storage.get_records(TESTING_LAYER, ids)
+        self.failUnlessEqual(self.mockhttp.request.call_count, 1)
+        self.failUnlessEqual(self.mockhttp.request.call_args[0][0],
+                             'http://api.simplegeo.com:80/0.1/records/%s/%s.json' % (TESTING_LAYER, ','.join(ids)))
+        self.failUnlessEqual([r['id'] for r in res], ['1', '2', '3', '4', '6', '7', '8', '9'])
+        self.failUnlessEqual(res.missing, ['5', '10'])
+
+        ids = [str(i) for i in range(1000, 0, -1)] + ['7']
+        res = self.client.storage.get_records(TESTING_LAYER, ids, concurrency=3)
+        urls = [call[0][0] for call in self.mockhttp.request.call_args_list[1:]]
+        self.failUnless(len(urls) > 1)
+        self.failUnless(all(len(url) <= 2000 for url in urls))
+        self.failUnlessEqual([r['id'] for r in res], [id for id in ids[:-1] if int(id) % 5])
+        self.failUnlessEqual(len(res.missing), 200)
+
+        res = self.client.storage.get_records(TESTING_LAYER, ['1', '2', '3'], max_url_bytes=1)
+        self.failUnlessEqual(len(res), 3)
+        self.failUnlessEqual(self.mockhttp.request.call_count, len(urls) + 4)
+
+    def test_iter_pages(self):
+        def request(url, method, body=None, headers=None):
+            url = urlparse.urlparse(url)
+            start = int(dict(urlparse.parse_qsl(url.query)).get('cursor', 0))
+            key = url.path.endswith('history.json') and 'geometries' or \
+                  url.path.endswith('/layers.json') and 'layers' or 'features'
+            page = {key: [{'n': i} for i in range(start, min(start + 3, 10))]}
+            if start + 3 < 10:
+                page['next_cursor'] = str(start + 3)
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps(page))
+        self.mockhttp.request.side_effect = request
+
+        storage = self.client.storage
+        for prefetch in (True, False):
+            self.failUnlessEqual([p['n'] for p in storage.iter_history(TESTING_LAYER, '1', prefetch=prefetch)],
+                                 range(10))
+        self.failUnlessEqual([p['n'] for p in storage.iter_nearby(TESTING_LAYER, 37, -122, limit=3)],
+                             range(10))
+        self.failUnlessEqual([p['n'] for p in storage.iter_layers(cursor='6')], range(6, 10))
+
+        pages = storage.iter_layers(prefetch=False)
+        self.failUnlessEqual(next(pages), {'n': 0})
+        self.failUnlessEqual(self.mockhttp.request.call_count, 15)
+
+    def test_layer_cache(self):
+        layers = {'a': {'name': 'a', 'title': 'A'}, 'b': {'name': 'b', 'title': 'B'}}
+        def request(url, method, body=None, headers=None):
+            path = urlparse.urlparse(url).path
+            if path.endswith('/layers.json'):
+                content = {'layers': layers.values()}
+            elif method == 'GET':
+                content = layers[path.split('/')[-1][:-len('.json')]]
+            else:
+                content = {'status': 'OK'}
+            return ({'status': '200', 'content-type': 'application/json'}, json.dumps(content))
+        self.mockhttp.request.side_effect = request
+        storage = self.client.storage
+        clock = FakeClock()
+        storage.layer_cache = LayerCache(ttl=60, clock=clock)
+
+        self.failUnlessEqual(storage.get_layer('a'), layers['a'])
+        self.failUnlessEqual(storage.get_layer('a'), layers['a'])
+        self.failUnlessEqual(self.mockhttp.request.call_count, 1)
+        self.failUnlessEqual(len(storage.get_layers()['layers']), 2)
+        storage.get_layers()
+        storage.get_layer('b')
+        self.failUnlessEqual(self.mockhttp.request.call_count, 2)
+
+        layers['b']['title'] = 'New B'
+        storage.update_layer(Layer('b', title='New B'))
+        self.failUnlessEqual(storage.get_layer('b')['title'], 'New B')
+        storage.get_layers()
+        storage.get_layer('a')
+        self.failUnlessEqual(self.mockhttp.request.call_count, 5)
+
+        del layers['a']
+        storage.delete_layer('a')
+        self.failUnlessEqual(len(storage.get_layers()['layers']), 1)
+        clock.now += 61
+        storage.get_layer('b')
+        self.failUnlessEqual(self.mockhttp.request.call_count, 8)
+        self.failUnlessEqual(storage.layer_cache.stats(),
+                             {'entries': 2, 'hits': 4, 'misses': 6, 'evictions': 0, 'invalidations': 2})
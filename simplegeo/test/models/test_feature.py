@@ -1,7 +1,8 @@
 import unittest
 import re
+import mock
 from simplegeo.models import Feature
-from simplegeo.util import deep_swap
+from simplegeo.util import deep_swap, VALIDATE_STRICT, VALIDATE_TRUSTED, VALIDATE_OFF
 from decimal import Decimal as D
 
 class FeatureTest(unittest.TestCase):
@@ -227,6 +228,39 @@ class FeatureTest(unittest.TestCase):
         self.failUnlessEqual(dic.get('id'), None)
         self.failUnlessEqual(dic.get('properties', {}).get('record_id'), None)
 
+    def test_validation_policies(self):
+        self.failUnlessRaises(ValueError, Feature, (D('11.0'), D('10.0')), validation='sometimes')
+
+        # trusted skips the range checks and the handle regex...
+        record = Feature((D('91.0'), D('10.1')), simplegeohandle='not a handle', validation=VALIDATE_TRUSTED)
+        self.failUnlessEqual(record.coordinates[0], D('91.0'))
+        self.failUnlessEqual(record.id, 'not a handle')
+        # ...but not the cheap type checks.
+        self.failUnlessRaises(TypeError, Feature, (D('11.0'), D('10.0')), properties={'record_id': 7}, validation=VALIDATE_TRUSTED)
+        self.failUnlessRaises(ValueError, Feature, (), validation=VALIDATE_TRUSTED)
+
+        record = Feature((D('11.0'), D('10.0')), properties={'record_id': 7}, validation=VALIDATE_OFF)
+        self.failUnlessEqual(record.properties['record_id'], 7)
+
+    def test_from_dict_validates_once(self):
+        record_dict = {
+            'geometry': {'type': 'Point', 'coordinates': [D('10.0'), D('11.0')]},
+            'type': 'Feature',
+            'id': 'SG_abcdefghijklmnopqrstuv',
+            'properties': {'record_id': 'my_id'}
+            }
+
+        with mock.patch('simplegeo.models.deep_validate_lat_lon') as validate:
+            Feature.from_dict(record_dict)
+            self.failUnlessEqual(validate.call_count, 1)
+            Feature.from_dict(record_dict, validation=VALIDATE_TRUSTED)
+            self.failUnlessEqual(validate.call_count, 1)
+
+        record_dict['id'] = 'not a handle'
+        self.failUnlessRaises(TypeError, Feature.from_dict, record_dict, validation=VALIDATE_STRICT)
+        record = Feature.from_dict(record_dict, validation=VALIDATE_TRUSTED)
+        self.failUnlessEqual(record.id, 'not a handle')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,10 @@
+import copy
+import pickle
 import unittest
+from decimal import Decimal as D
+import simplegeo.json as json
 from simplegeo import Record
+from simplegeo.util import VALIDATE_STRICT, VALIDATE_TRUSTED
 
 class RecordTest(unittest.TestCase):
 
@@ -27,6 +32,59 @@ class RecordTest(unittest.TestCase):
         self.assertEquals(record.key, 'value')
         self.assertEquals(record.type, 'object')
 
+    def test_record_from_dict_validation(self):
+        record_dict = {'geometry': {'type': 'Point', 'coordinates': [10.0, 91.0]},
+                       'id': 'my_id',
+                       'type': 'Feature',
+                       'properties': {'layer': 'my_layer'}}
+
+        self.assertRaises(ValueError, Record.from_dict, record_dict, validation=VALIDATE_STRICT)
+        record = Record.from_dict(record_dict, validation=VALIDATE_TRUSTED)
+        self.assertEquals(record.lat, 91.0)
+        # Records from the server aren't checked unless asked.
+        self.assertEquals(Record.from_dict(record_dict).lat, 91.0)
+
+    def test_record_from_json_numeric(self):
+        jsonstr = '{"geometry": {"type": "Point", "coordinates": [10.5, 11.5]}, "id": "my_id", "type": "Feature", "properties": {"layer": "my_layer"}}'
+        self.assertEquals(type(Record.from_json(jsonstr).lat), D)
+        record = Record.from_json(jsonstr, numeric=json.FLOAT)
+        self.assertEquals(type(record.lat), float)
+        self.assertEquals(record.lon, 10.5)
+
+    def test_record_attributes(self):
+        record = Record('my_layer', 'my_id', 11.0, 10.0, created=10, key='value')
+        self.failIf(hasattr(record, '__dict__'))
+        self.assertEquals(record.key, 'value')
+        self.assertEquals(record.properties, {'key': 'value'})
+        record.other = 'thing'
+        self.assertEquals(record.properties, {'key': 'value', 'other': 'thing'})
+        record.lat = 12.0
+        self.assertEquals(record.lat, 12.0)
+        self.failIf('lat' in record.properties)
+        del record.key
+        self.failIf(hasattr(record, 'key'))
+        self.assertRaises(AttributeError, getattr, record, 'missing')
+        self.assertRaises(AttributeError, delattr, record, 'missing')
+        self.assertRaises(TypeError, Record, 'my_layer', 'my_id', 11.0, 10.0, properties={'a': 1})
+
+    def test_record_to_dict(self):
+        record = Record('my_layer', 'my_id', 11.0, 10.0, created=10, key='value')
+        self.assertEquals(record.to_dict(), {
+                'type': 'Feature', 'id': 'my_id', 'created': 10,
+                'geometry': {'type': 'Point', 'coordinates': [10.0, 11.0]},
+                'properties': {'layer': 'my_layer', 'key': 'value'}})
+        self.assertEquals(Record.from_dict(record.to_dict()).to_dict(), record.to_dict())
+
+    def test_record_copy(self):
+        record = Record('my_layer', 'my_id', 11.0, 10.0, created=10, key='value')
+        for other in (copy.copy(record), copy.deepcopy(record),
+                      pickle.loads(pickle.dumps(record)),
+                      pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))):
+            self.assertEquals(other.to_dict(), record.to_dict())
+        for other in (copy.copy(record), copy.deepcopy(record)):
+            other.key = 'changed'
+            self.assertEquals(record.key, 'value')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,179 @@
+import unittest
+from StringIO import StringIO
+
+from simplegeo import geohash
+from simplegeo.cache import Cache, GeohashCache, ContextCache, IPCache
+from simplegeo.util import distance, _OrderedDict
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+
+class CacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = Cache()
+        self.failUnlessEqual(cache.get('a'), None)
+        self.failUnlessEqual(cache.get('a', 'default'), 'default')
+        cache.set('a', 1)
+        self.failUnless('a' in cache)
+        self.failUnlessEqual(cache.get('a'), 1)
+        cache.delete('a')
+        self.failIf('a' in cache)
+        self.failUnlessEqual(cache.stats(), {'entries': 0, 'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = Cache(ttl=10, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=100)
+        clock.now += 10
+        self.failUnlessEqual(cache.get('a'), None)
+        self.failIf('a' in cache)
+        self.failUnlessEqual(cache.get('b'), 2)
+
+    def test_max_entries(self):
+        cache = Cache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.failUnlessEqual(sorted(k for k in 'abc' if k in cache), ['a', 'c'])
+        self.failUnlessEqual(cache.evictions, 1)
+
+    def test_max_entries_without_ordereddict(self):
+        # What Python 2.6, which has no collections.OrderedDict, uses.
+        cache = Cache(max_entries=2)
+        cache._entries = _OrderedDict()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.failUnlessEqual(cache._entries.keys(), ['a', 'c'])
+        cache.set('d', 4)
+        self.failUnlessEqual(cache._entries.items(), [('c', (None, 3)), ('d', (None, 4))])
+        self.failUnlessEqual(cache.evictions, 2)
+        cache.clear()
+        self.failUnlessEqual((len(cache), list(cache._entries)), (0, []))
+
+    def test_ordereddict(self):
+        d = _OrderedDict.fromkeys('banana')
+        self.failUnlessEqual(d.keys(), ['b', 'a', 'n'])
+        d['b'] = 1
+        d.update([('x', 2), ('a', 3)])
+        self.failUnlessEqual(d.items(), [('b', 1), ('a', 3), ('n', None), ('x', 2)])
+        self.failUnlessEqual(d.pop('a'), 3)
+        self.failUnlessEqual(d.pop('a', 'gone'), 'gone')
+        self.assertRaises(KeyError, d.pop, 'a')
+        self.failUnlessEqual(d.popitem(last=False), ('b', 1))
+        self.failUnlessEqual(d.popitem(), ('x', 2))
+        del d['n']
+        self.failUnlessEqual((d, d.values()), ({}, []))
+        self.assertRaises(KeyError, d.popitem)
+
+    def test_peek(self):
+        cache = Cache()
+        cache.set('a', 1, ttl=None)
+        self.failUnlessEqual(cache.peek('a'), 1)
+        self.failUnlessEqual(cache.peek('b', 2), 2)
+        self.failUnlessEqual(cache.stats()['hits'] + cache.stats()['misses'], 0)
+
+    def test_dump_load(self):
+        clock = FakeClock()
+        cache = Cache(ttl=10, clock=clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=100)
+        cache.set('c', 3, ttl=None)
+        clock.now += 5
+        cache.set('d', 4, ttl=1)
+        clock.now += 5
+        fp = StringIO()
+        cache.dump(fp)
+
+        clock.now += 50
+        other = Cache(max_entries=1, clock=clock)
+        self.failUnlessEqual(other.load(StringIO(fp.getvalue())), 2)
+        # 'b' kept its expiry time, and was then evicted by 'c'.
+        self.failUnlessEqual(other.get('c'), 3)
+        self.failUnlessEqual(other.evictions, 1)
+        other = Cache(clock=clock)
+        other.load(StringIO(fp.getvalue()))
+        clock.now += 50
+        self.failIf('b' in other)
+        self.failUnless('c' in other)
+
+
+class ContextCacheTest(unittest.TestCase):
+
+    def test_key(self):
+        cache = ContextCache(precision=3)
+        self.failUnlessEqual(cache.key(37.80161, -122.47831), cache.key(37.80158, -122.47829))
+        self.failIfEqual(cache.key(37.80161, -122.47831), cache.key(37.80161, -122.47831, 'weather'))
+        self.failUnlessEqual(cache.key(1, 2, None, {'b': 1, 'a': 2}), cache.key(1, 2, '', {'a': 2, 'b': 1}))
+
+    def test_sections(self):
+        clock = FakeClock()
+        cache = ContextCache(ttl=100, section_ttls={'weather': 10, 'query': None}, clock=clock)
+        key = cache.key(1, 2)
+        self.failUnlessEqual(cache.lookup(key), (None, None))
+        cache.store(key, {'weather': 'sunny', 'features': [], 'query': {}})
+        self.failUnlessEqual(cache.lookup(key), ({'weather': 'sunny', 'features': [], 'query': {}}, []))
+        clock.now += 10
+        self.failUnlessEqual(cache.lookup(key), ({'features': [], 'query': {}}, ['weather']))
+        cache.store(key, {'weather': 'rain'})
+        self.failUnlessEqual(cache.lookup(key)[0]['weather'], 'rain')
+        clock.now += 95
+        response, stale = cache.lookup(key)
+        self.failUnlessEqual((response, sorted(stale)), ({'query': {}}, ['features', 'weather']))
+
+
+class IPCacheTest(unittest.TestCase):
+
+    def test_key(self):
+        cache = IPCache(v4_prefix=24, v6_prefix=48)
+        self.failUnlessEqual(cache.key('66.249.66.1', 'context'), cache.key('66.249.66.200', 'context'))
+        self.failIfEqual(cache.key('66.249.66.1', 'context'), cache.key('66.249.67.1', 'context'))
+        self.failIfEqual(cache.key('66.249.66.1', 'context'), cache.key('66.249.66.1', 'search'))
+        self.failUnlessEqual(cache.key('2001:db8:1::1', 'search', 5), cache.key('2001:db8:1:ff::2', 'search', 5))
+        self.failIfEqual(cache.key('2001:db8:1::1', 'search'), cache.key('2001:db8:2::1', 'search'))
+        self.failUnlessRaises(ValueError, cache.key, '66.249.66', 'context')
+
+
+class GeohashTest(unittest.TestCase):
+
+    def test_encode(self):
+        self.failUnlessEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.failUnlessEqual(geohash.encode(57.64911, 10.40744, 3), 'u4p')
+
+    def test_bbox(self):
+        sw_lat, sw_lon, ne_lat, ne_lon = geohash.bbox('u4pruydqqvj')
+        self.failUnless(sw_lat <= 57.64911 <= ne_lat)
+        self.failUnless(sw_lon <= 10.40744 <= ne_lon)
+        self.failUnlessEqual(geohash.bbox(''), (-90.0, -180.0, 90.0, 180.0))
+        self.assertRaises(ValueError, geohash.bbox, 'abc')
+
+    def test_covering(self):
+        height, width = geohash.cell_size(5)
+        cells = geohash.covering(37.70, -122.50, 37.70 + 2 * height, -122.50 + 3 * width, 5)
+        self.failUnless(9 <= len(cells) <= 12, cells)
+        self.failUnlessEqual(len(set(cells)), len(cells))
+        self.failUnless(geohash.encode(37.75, -122.45, 5) in cells)
+
+    def test_cells(self):
+        cache = GeohashCache(precision=6, max_cells=16)
+        cells = cache.cells(37.775, -122.42, 0.3)
+        self.failUnless(geohash.encode(37.775, -122.42, 6) in cells)
+        self.failUnlessEqual(cache.cells(37.775, -122.42, 50), None)
+        self.failUnlessEqual(cache.cells(37.775, 179.999, 0.3), None)
+
+    def test_distance(self):
+        self.failUnlessAlmostEqual(distance(0, 0, 0, 1), 111.195, places=3)
+        self.failUnlessAlmostEqual(distance(37.7749, -122.4194, 40.7128, -74.0060), 4129, places=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
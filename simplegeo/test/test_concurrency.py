@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from simplegeo.concurrency import Pool, RateLimiter, imap, imap_distinct
+
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def test_pool(self):
+        pool = Pool(2)
+        tasks = [pool.submit(pow, 2, i) for i in range(5)]
+        self.failUnlessEqual([t.result() for t in tasks], [1, 2, 4, 8, 16])
+        self.assertRaises(ZeroDivisionError, pool.submit(lambda: 1 / 0).result)
+        pool.close()
+        self.assertRaises(ValueError, Pool, 0)
+
+    def test_imap_order(self):
+        def slow(i):
+            time.sleep((5 - i) * 0.01)
+            return i * i
+        self.failUnlessEqual(list(imap(slow, range(5), concurrency=3)), [0, 1, 4, 9, 16])
+        self.failUnlessEqual(list(imap(slow, range(5))), [0, 1, 4, 9, 16])
+
+    def test_imap_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        def work(i):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return i
+        self.failUnlessEqual(list(imap(work, iter(range(12)), concurrency=4)), range(12))
+        self.failUnless(1 < running[1] <= 4, running)
+
+    def test_imap_exception(self):
+        results = imap(lambda i: 1 / i, [1, 0, 2], concurrency=2)
+        self.failUnlessEqual(results.next(), 1)
+        self.assertRaises(ZeroDivisionError, results.next)
+
+    def test_imap_distinct(self):
+        calls = []
+        def work(i):
+            calls.append(i)
+            return [i]
+        results = list(imap_distinct(work, [3, 13, 4, 23, 3], key=lambda i: i % 10, concurrency=2))
+        self.failUnlessEqual(results, [[3], [3], [4], [3], [3]])
+        self.failUnless(results[0] is results[3])
+        self.failUnlessEqual(sorted(calls), [3, 4])
+        self.failUnlessEqual(list(imap_distinct(work, iter('abca'))), [['a'], ['b'], ['c'], ['a']])
+        self.failUnlessEqual(list(imap_distinct(work, [])), [])
+
+        # Lazy, like imap().
+        def forever():
+            i = 0
+            while True:
+                yield i
+                i += 1
+        results = imap_distinct(lambda i: i, forever(), key=lambda i: i // 3, concurrency=2)
+        self.failUnlessEqual([results.next() for i in range(7)], [0, 0, 0, 3, 3, 3, 6])
+
+    def test_rate_limiter(self):
+        now = [0.0]
+        waits = []
+        def sleep(seconds):
+            waits.append(seconds)
+        limiter = RateLimiter(2, burst=2, clock=lambda: now[0], sleep=sleep)
+        self.failUnlessEqual([limiter.acquire() for i in range(4)], [0, 0, 0.5, 1.0])
+        now[0] = 10.0
+        self.failUnlessEqual([limiter.acquire() for i in range(3)], [0, 0, 0.5])
+        self.failUnlessEqual(waits, [0.5, 1.0, 0.5])
+        self.assertRaises(ValueError, RateLimiter, 0)
+
+if __name__ == '__main__':
+    unittest.main()
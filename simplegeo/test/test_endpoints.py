@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+from decimal import Decimal as D
+
+from simplegeo import endpoints
+from simplegeo.endpoints import (Endpoint, Param, RADIUS, QUERY, ADDRESS, FILTER,
+                                 CONTEXT_ADDRESS)
+from simplegeo.util import is_valid_lat, is_valid_lon
+
+
+class EndpointTest(unittest.TestCase):
+
+    def test_build(self):
+        search = Endpoint('search', [endpoints.lat('lat'), endpoints.lon('lon')], [RADIUS, QUERY])
+        self.failUnlessEqual(search.build((D('37.8'), 190), (None, None)),
+                             ({'lat': D('37.8'), 'lon': 190}, {}))
+        self.failUnlessEqual(search.build((37.8, -122.4), (2, u'caf\xe9'), {'radius': 0, 'x': 'y'}),
+                             ({'lat': 37.8, 'lon': -122.4}, {'q': 'caf\xc3\xa9', 'x': 'y'}))
+        self.failUnlessEqual(search.build((0, 0), (0, ''), {}), ({'lat': 0, 'lon': 0}, {}))
+        self.assertRaises(ValueError, search.build, (D('90.000000000000000001'), 0), (None, None))
+        self.assertRaises(ValueError, search.build, (0, 0), ('2', None))
+        try:
+            search.build((0, 0), (None, 5))
+        except ValueError, e:
+            self.failUnlessEqual(str(e), "Query must be a string.")
+        else:
+            self.fail('Should have raised exception.')
+
+    def test_required(self):
+        places = Endpoint('search_by_address', [], [ADDRESS])
+        self.failUnlessEqual(places.build((), (u'1 Main St',)), ({}, {'address': '1 Main St'}))
+        self.assertRaises(ValueError, places.build, (), ('  ',))
+        self.assertRaises(ValueError, places.build, (), (None,))
+        context = Endpoint('context_by_address', [], [CONTEXT_ADDRESS, FILTER])
+        self.failUnlessEqual(context.build((), ('', 'weather')), ({}, {'filter': 'weather'}))
+        self.assertRaises(ValueError, context.build, (), (None, None))
+        unchecked = Endpoint('bbox', [Param('sw_lat')])
+        self.failUnlessEqual(unchecked.build(('x',)), ({'sw_lat': 'x'}, {}))
+
+    def test_between(self):
+        check_lat = endpoints.lat('lat').check
+        check_lon = endpoints.lon('lon').check
+        for value in [D('90'), D('90.0000000000000000001'), D('-90.0000000000000000001'),
+                      D('89.99'), D('1e400'), D('-Infinity'), 90, 91L, -10 ** 400, 360.0,
+                      360.5, True, float('inf'), 'x', None]:
+            self.failUnlessEqual(check_lat(value), is_valid_lat(value), value)
+            self.failUnlessEqual(check_lon(value), is_valid_lon(value), value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import unittest
+from decimal import Decimal as D
+
+import simplegeo.json as json
+from simplegeo import geojson
+from simplegeo.models import Feature, Record
+from simplegeo.util import VALIDATE_OFF
+
+RING = [(D('37.1'), D('-122.1')), (37.2, -122.1), (37, -122), (D('37.1'), D('-122.1'))]
+
+
+def _records():
+    yield Record('com.example.layer', 'plain', D('37.8016'), D('-122.4783'), created=1300000000)
+    yield Record('com.example.layer', u'❤ "quoted"\n', 37.8016, -122.4783, created=1300000000.5,
+                 name=u'Caf\xe9', tags=['a', 'b'], nested={'x': [1, D('2.50'), None, True]})
+    yield Record('com.example.layer', 42, 0, 0, created=None)
+    record = Record(u'com.example.unicode', u'id', D('-90'), D('180.000'), created=10L, empty='')
+    record.properties['layer'] = 'ignored'
+    yield record
+
+def _features():
+    yield Feature((D('37.8016'), D('-122.4783')))
+    yield Feature((37.8016, -122.4783), simplegeohandle='SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970',
+                  properties={'name': u'Caf\xe9 "❤"', 'record_id': 'r1', 'private': True,
+                              'a': 1, 'b': 2, 'c': {'d': 3, 'e': [{'f': 4, 'g': 5, 'h': 6}]}})
+    yield Feature([RING], geomtype='Polygon', properties={'classifiers': [{'type': 'Food'}]})
+    yield Feature([[RING], [RING]], geomtype='MultiPolygon', simplegeohandle='SG_x', validation=VALIDATE_OFF)
+
+
+class GeoJSONTest(unittest.TestCase):
+
+    def test_records(self):
+        for record in _records():
+            self.failUnlessEqual(record.to_json(), json.dumps(record.to_dict()))
+            self.failUnlessEqual(type(record.to_json()), str)
+
+    def test_features(self):
+        for feature in _features():
+            self.failUnlessEqual(feature.to_json(), json.dumps(feature.to_dict()))
+            self.failUnlessEqual(''.join(geojson.iter_feature(feature)), feature.to_json())
+
+    def test_feature_collection(self):
+        items = list(_records()) + list(_features())
+        self.failUnlessEqual(geojson.dumps_feature_collection(items),
+                             json.dumps({'type': 'FeatureCollection',
+                                         'features': [item.to_dict() for item in items]}))
+        self.failUnlessEqual(geojson.dumps_feature_collection([]),
+                             json.dumps({'type': 'FeatureCollection', 'features': []}))
+
+    def test_codecs(self):
+        try:
+            for codec in json.codecs():
+                json.use_codec(codec.name)
+                for item in list(_records()) + list(_features()):
+                    self.failUnlessEqual(item.to_json(), json.dumps(item.to_dict()))
+        finally:
+            json.use_codec()
+
+    def test_special_floats(self):
+        record = Record('com.example.layer', 'nan', float('nan'), float('inf'), created=1)
+        try:
+            expected = json.dumps(record.to_dict())
+        except ValueError:
+            self.assertRaises(ValueError, record.to_json)
+        else:
+            self.failUnlessEqual(record.to_json(), expected)
+
+    def test_bad_coordinates(self):
+        feature = Feature([[(1, 2, 3)]], geomtype='Polygon', validation=VALIDATE_OFF)
+        self.assertRaises(ValueError, feature.to_json)
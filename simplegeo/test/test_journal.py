@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal as D
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.journal import Journal
+from simplegeo.models import Feature, Record
+from simplegeo.util import APIError
+
+TESTING_LAYER = 'com.simplegeo.test'
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'writes.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append_ack(self):
+        journal = Journal(self.path, sync_every=2)
+        first = journal.append('delete_record', {'layer': TESTING_LAYER, 'id': '1'})
+        second = journal.append('delete_record', '{"layer": "%s", "id": "2"}' % (TESTING_LAYER,))
+        journal.ack(first)
+        journal.ack(first)
+        self.failUnlessEqual(journal.pending(),
+                             [(second, 'delete_record', {'layer': TESTING_LAYER, 'id': '2'})])
+        journal.close()
+
+        open(self.path, 'ab').write('{"seq": 3, "op": "delete_re')
+        journal = Journal(self.path)
+        self.failUnlessEqual(len(journal), 1)
+        self.failUnlessEqual(journal.append('delete_record', {}), 3)
+        journal.close()
+        # The cut off line is gone, and the entry after it survives.
+        self.failUnlessEqual([seq for seq, op, args in Journal(self.path).pending()], [2, 3])
+        self.failUnless(open(self.path).read().endswith('"args": {}}\n'))
+
+    def test_compact(self):
+        journal = Journal(self.path, compact_after=10)
+        seqs = [journal.append('delete_record', {'layer': TESTING_LAYER, 'id': str(i)})
+                for i in range(19)]
+        for seq in seqs[:9]:
+            journal.ack(seq)
+        lines = len(open(self.path).readlines())
+        self.failUnlessEqual(lines, 28)
+        journal.ack(seqs[9])
+        self.failUnlessEqual(len(open(self.path).readlines()), 9)
+        journal.close()
+        self.failUnlessEqual([seq for seq, op, args in Journal(self.path).pending()], seqs[10:])
+
+    def test_client(self):
+        journal = Journal(self.path)
+        client = Client('MY_OAUTH_KEY', 'MY_SECRET_KEY', journal=journal)
+        sent = []
+        def request(url, method, body=None, headers=None):
+            sent.append((method, url.split('/', 3)[-1], body))
+            if fail:
+                return ({'status': '500', 'content-type': 'application/json'}, '')
+            return ({'status': '202', 'content-type': 'application/json'},
+                    json.dumps({'id': 'SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970'}))
+        for subclient in (client.storage, client.places):
+            subclient.http = mock.Mock()
+            subclient.http.request.side_effect = request
+
+        fail = False
+        records = [Record(TESTING_LAYER, str(i), D('37.8016'), D('-122.4783'), created=1300000000)
+                   for i in range(3)]
+        client.storage.add_records(TESTING_LAYER, records)
+        client.storage.delete_record(TESTING_LAYER, '0')
+        self.failUnlessEqual(len(journal), 0)
+
+        fail = True
+        res = client.storage.add_records(TESTING_LAYER, records, max_records=2, raise_on_error=False)
+        self.failUnlessEqual(res['failed_ids'], ['0', '1', '2'])
+        self.assertRaises(APIError, client.places.add_feature, Feature((D('37.8016'), D('-122.4783'))))
+        self.assertRaises(APIError, client.storage.delete_record, TESTING_LAYER, '0')
+        self.failUnlessEqual([op for seq, op, args in journal.pending()],
+                             ['add_records', 'add_records', 'add_feature', 'delete_record'])
+        journal.close()
+
+        journal = Journal(self.path)
+        self.failUnlessEqual(journal.replay(client), {'replayed': 0, 'rejected': 0, 'failed': 4})
+        fail = False
+        del sent[:]
+        self.failUnlessEqual(journal.replay(client), {'replayed': 4, 'rejected': 0, 'failed': 0})
+        self.failUnlessEqual(len(journal), 0)
+        self.failUnlessEqual([(method, path) for method, path, body in sent],
+                             [('POST', '0.1/records/%s.json' % (TESTING_LAYER,))] * 2 +
+                             [('POST', '1.0/places'),
+                              ('DELETE', '0.1/records/%s/0.json' % (TESTING_LAYER,))])
+        self.failUnlessEqual(json.loads(sent[1][2])['features'], [records[2].to_dict()])
+        journal.close()
+
+    def test_replay_rejected(self):
+        journal = Journal(self.path)
+        client = Client('MY_OAUTH_KEY', 'MY_SECRET_KEY')
+        statuses = {'0': '404', '1': '503', '2': '429'}
+        def request(url, method, body=None, headers=None):
+            return ({'status': statuses[url.split('/')[-1][:-len('.json')]],
+                     'content-type': 'application/json'}, '')
+        client.storage.http = mock.Mock()
+        client.storage.http.request.side_effect = request
+        for i in range(3):
+            journal.append('delete_record', {'layer': TESTING_LAYER, 'id': str(i)})
+
+        self.failUnlessEqual(journal.replay(client), {'replayed': 0, 'rejected': 1, 'failed': 2})
+        self.failUnlessEqual([args['id'] for seq, op, args in journal.pending()], ['1', '2'])
+        rejected = [json.loads(line) for line in open(journal.rejected_path)]
+        self.failUnlessEqual([(r['code'], r['entry']['args']['id']) for r in rejected], [(404, '0')])
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from StringIO import StringIO
+from decimal import Decimal as D
+
+import simplegeo.json as json
+from simplegeo.models import Feature, Record, Layer
+from simplegeo.test.client.test_client import EXAMPLE_BODY, EXAMPLE_POINT_BODY
+
+
+PAYLOADS = [
+    Feature((D('37.8016'), D('-122.4783')), properties={'record_id': 'my_id', 'name': u"B❦b's H❤use of M❥nkeys"}).to_dict(),
+    Feature([[(11.0, 179.9), (12, -179.9), (11.0, 179.9)]], geomtype='Polygon').to_dict(),
+    Record('my_layer', 'my_id', D('37.7481624945'), D('-122.433287165'), created=10, type='object', tags=['a', 'b']).to_dict(),
+    Layer('my.layer', 'Title', 'Description', False, ['http://example.com']).to_dict(),
+    {'annotations': {'venue': {'owner': 'John Doe'}}, 'private': True},
+    {'type': 'FeatureCollection', 'features': []},
+]
+
+
+class CodecConformanceTest(unittest.TestCase):
+
+    """Every registered codec is required to agree with the default
+    one on the payloads this library actually sends and receives."""
+
+    def tearDown(self):
+        json.use_codec()
+
+    def _each_codec(self):
+        for codec in json.codecs():
+            json.use_codec(codec.name)
+            yield codec
+
+    def test_default_is_fastest(self):
+        self.failUnlessEqual(json.get_decoder(), json.codecs()[0])
+        self.failUnless(json.get_encoder().exact_decimal)
+
+    def test_use_codec(self):
+        self.assertRaises(ValueError, json.use_codec, 'no such codec')
+        name = json.codecs()[-1].name
+        json.use_codec(decoder=name)
+        self.failUnlessEqual(json.get_decoder().name, name)
+        self.failUnlessEqual(json.get_encoder(), json.get_codec('simplejson'))
+
+    def test_stdlib_codec_without_c_encoder(self):
+        # Python 2.6's json.encoder has no c_make_encoder.
+        import json as stdlib_json
+        c_make_encoder = stdlib_json.encoder.c_make_encoder
+        del stdlib_json.encoder.c_make_encoder
+        try:
+            codec = json._stdlib_codec()
+        finally:
+            stdlib_json.encoder.c_make_encoder = c_make_encoder
+        self.failIf(codec.accelerated)
+
+    def test_decode(self):
+        expected = {}
+        for numeric in json.NUMERIC_MODES:
+            expected[numeric] = [json.loads(body, numeric=numeric) for body in (EXAMPLE_BODY, EXAMPLE_POINT_BODY)]
+        for codec in self._each_codec():
+            for numeric in json.NUMERIC_MODES:
+                got = [json.loads(body, numeric=numeric) for body in (EXAMPLE_BODY, EXAMPLE_POINT_BODY)]
+                self.failUnlessEqual(got, expected[numeric], codec)
+                coordinate = got[1]['geometry']['coordinates'][0]
+                self.failUnlessEqual(type(coordinate), numeric == json.DECIMAL and D or float, codec)
+
+    def test_decode_error(self):
+        for codec in self._each_codec():
+            self.assertRaises(ValueError, json.loads, 'this is not json')
+
+    def test_encode(self):
+        expected = [json.dumps(payload) for payload in PAYLOADS]
+        for codec in self._each_codec():
+            self.failUnlessEqual([json.dumps(payload) for payload in PAYLOADS], expected, codec)
+
+    def test_round_trip(self):
+        for codec in self._each_codec():
+            for payload in PAYLOADS:
+                encoded = json.dumps(payload, sort_keys=True)
+                self.failUnlessEqual(json.dumps(json.loads(encoded), sort_keys=True), encoded, codec)
+
+
+class StreamReaderTest(unittest.TestCase):
+
+    def test_read(self):
+        values = [{'a': '[{"\\', 'b': [1, {'c': '}]'}]}, u'\u2766 \\"', 12.5, [], True, None]
+        doc = json.dumps(values)
+        for read_size in range(1, 8):
+            reader = json.StreamReader(StringIO(doc), read_size=read_size, numeric=json.FLOAT)
+            reader.expect('[')
+            got = []
+            while True:
+                got.append(reader.read())
+                if reader.expect(',]') == ']':
+                    break
+            self.failUnlessEqual(got, values)
+            self.failUnlessEqual(reader.peek(), '')
+
+    def test_skip(self):
+        fp = StringIO('[' + json.dumps({'x': ['"]' * 5000]}) + ', "after"]')
+        reader = json.StreamReader(fp, read_size=100, max_bytes=1000)
+        reader.expect('[')
+        reader.skip()
+        # Skipping doesn't hold the whole value at once.
+        self.failUnless(len(reader._buf) <= 1100)
+        reader.expect(',')
+        self.failUnlessEqual(reader.read(), 'after')
+
+    def test_errors(self):
+        reader = json.StreamReader(StringIO('{"a": [1, 2'), read_size=3)
+        reader.expect('{')
+        self.failUnlessRaises(ValueError, reader.expect, '[')
+        self.failUnlessEqual(reader.read(), 'a')
+        reader.expect(':')
+        self.failUnlessRaises(ValueError, reader.read)
+        reader = json.StreamReader(StringIO('[' + '1, ' * 100 + '1]'), read_size=10, max_bytes=20)
+        self.failUnlessRaises(ValueError, reader.read)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import socket
+import threading
+import unittest
+from StringIO import StringIO
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client
+from simplegeo.streaming import ChunkedBody, Http, request_body
+
+
+def unchunk(body):
+    """Return the body sent as a ChunkedBody, checking its framing."""
+    data = ''
+    wire = ''.join(iter(lambda: body.read(100), ''))
+    while True:
+        length, wire = wire.split('\r\n', 1)
+        length = int(length, 16)
+        if not length:
+            assert wire == '\r\n', repr(wire)
+            return data
+        data += wire[:length]
+        assert wire[length:length + 2] == '\r\n'
+        wire = wire[length + 2:]
+
+
+class StreamingTest(unittest.TestCase):
+
+    def test_chunked_body(self):
+        pieces = ['a' * 30, '', u'\xe9', 'b' * 250]
+        self.failUnlessEqual(unchunk(ChunkedBody(pieces)), ''.join(pieces).encode('utf-8'))
+        body = ChunkedBody([])
+        self.failUnlessEqual(body.read(), '0\r\n\r\n')
+        self.failUnlessEqual(body.read(), '')
+        self.failUnlessRaises(ValueError, body.read)
+        self.failUnlessEqual(ChunkedBody(['abc']).read(), '3\r\nabc\r\n')
+
+    def test_request_body(self):
+        self.failUnlessEqual(request_body(None), None)
+        self.failUnlessEqual(request_body('abc'), 'abc')
+        self.failUnlessEqual(request_body(iter(['a', 'b', 'c'])), 'abc')
+        self.failUnlessEqual(request_body(StringIO('abc')), 'abc')
+        body = request_body(('x' * 10 for i in range(10)), threshold=25)
+        self.failUnless(isinstance(body, ChunkedBody))
+        self.failUnlessEqual(unchunk(body), 'x' * 100)
+        body = request_body(StringIO('y' * 50000), threshold=100)
+        self.failUnlessEqual(unchunk(body), 'y' * 50000)
+
+    def test_read_twice(self):
+        body = request_body(lambda: ('x' * 10 for i in range(10)), threshold=25)
+        self.failUnlessEqual(unchunk(body), 'x' * 100)
+        self.failUnlessRaises(ValueError, body.read)
+        body.restart()
+        self.failUnlessEqual(unchunk(body), 'x' * 100)
+
+        f = StringIO('skip' + 'y' * 500)
+        f.read(4)
+        body = request_body(f, threshold=100)
+        body.read(10)
+        body.restart()
+        self.failUnlessEqual(unchunk(body), 'y' * 500)
+
+        body = request_body(('x' * 10 for i in range(10)), threshold=25)
+        body.restart()
+        self.failUnlessEqual(unchunk(body), 'x' * 100)
+        self.failUnlessRaises(ValueError, body.restart)
+
+    def test_retry(self):
+        # The server drops the first connection once it has read the
+        # request, as a stale keep-alive connection would, and httplib2
+        # sends the request again on a new one.
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(2)
+        server.settimeout(10)
+        bodies = []
+        def serve():
+            for answer in (False, True):
+                conn = server.accept()[0]
+                conn.settimeout(10)
+                data = ''
+                while not data.endswith('0\r\n\r\n'):
+                    piece = conn.recv(65536)
+                    if not piece:
+                        break
+                    data += piece
+                bodies.append(unchunk(StringIO(data.split('\r\n\r\n', 1)[1])))
+                if answer:
+                    conn.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+                conn.close()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/1.0/thing.json' % (server.getsockname()[1],)
+            big = 'z' * 100000
+            client = Client('MY_OAUTH_KEY', 'MY_SECRET_KEY', timeout=10)
+            self.failUnless(isinstance(client.http, Http))
+            client._request(url, 'POST', lambda: iter([big]))
+        finally:
+            thread.join()
+            server.close()
+        self.failUnlessEqual(bodies, [big, big])
+
+    def test_request(self):
+        client = Client('MY_OAUTH_KEY', 'MY_SECRET_KEY')
+        sent = []
+        def request(url, method, body=None, headers=None):
+            if isinstance(body, ChunkedBody):
+                body = unchunk(body)
+            sent.append((body, headers.get('Transfer-Encoding')))
+            return {'status': '200', 'content-type': 'application/json'}, '{}'
+        client.http = mock.Mock()
+        client.http.request.side_effect = request
+
+        client._request('http://api.simplegeo.com/1.0/thing.json', 'POST', ['{', '}'])
+        self.failUnlessEqual(sent[-1], ('{}', None))
+        big = {'x': 'y' * 100000}
+        client._request('http://api.simplegeo.com/1.0/thing.json', 'POST', StringIO(json.dumps(big)))
+        self.failUnlessEqual(sent[-1], (json.dumps(big), 'chunked'))
+
+        annotations = {'venue': {'owner': 'John Doe'}, 'big': {'note': 'z' * 100000}}
+        client.annotate('SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970', annotations, True)
+        self.failUnlessEqual(json.loads(sent[-1][0]), {'annotations': annotations, 'private': True})
+        self.failUnlessEqual(sent[-1][1], 'chunked')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urlparse
+
+import mock
+
+import simplegeo.json as json
+from simplegeo import Client, geohash
+from simplegeo.cache import ContextCache, GeohashCache
+from simplegeo.concurrency import RateLimiter
+from simplegeo.warm import warm, main, context_points, CONTEXT, PLACES
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+
+BBOX = (37.7, -122.5, 37.702, -122.498)
+
+
+def _request(url, method, body=None, headers=None):
+    path = urlparse.urlparse(url).path
+    if '/context/' in path:
+        return ({'status': '200', 'content-type': 'application/json'},
+                json.dumps({'features': [], 'weather': {}}))
+    if '/places/' in path:
+        # The cell with the south west corner of BBOX in it is full.
+        sw_lat, sw_lon, ne_lat, ne_lon = map(float, path.split('/')[-1][:-len('.json')].split(','))
+        count = (sw_lat <= BBOX[0] < ne_lat and sw_lon <= BBOX[1] < ne_lon) and 10 or 1
+        return ({'status': '200', 'content-type': 'application/json'},
+                json.dumps({'type': 'FeatureCollection', 'features': [
+                        {'id': 'SG_%s_%d' % (path, i), 'type': 'Feature',
+                         'geometry': {'type': 'Point', 'coordinates': [sw_lon, sw_lat]},
+                         'properties': {}} for i in range(count)]}))
+    return ({'status': '404'}, 'Not found')
+
+
+class WarmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET)
+        self.mockhttp = mock.Mock()
+        self.mockhttp.request.side_effect = _request
+        self.client.context.http = self.mockhttp
+        self.client.places12.http = self.mockhttp
+
+    def test_context_points(self):
+        points = list(context_points(37.7, -122.5, 37.702, -122.4985, 3))
+        self.failUnlessEqual(points[:3], [(37.7, -122.5), (37.7, -122.499), (37.701, -122.5)])
+        self.failUnlessEqual(len(points), 6)
+
+    def test_warm(self):
+        progress = []
+        self.client.places12.search_cache = GeohashCache(precision=7, cell_limit=10)
+        summaries = warm(self.client, BBOX, places_precision=7, concurrency=3,
+                         progress=lambda *args: progress.append(args))
+        self.failUnlessEqual(summaries[CONTEXT], {'total': 9, 'cached': 0, 'fetched': 9, 'failed': 0})
+        cells = geohash.covering(*BBOX, precision=7)
+        self.failUnlessEqual(summaries[PLACES]['total'], len(cells))
+        self.failUnlessEqual(summaries[PLACES]['dense'], 1)
+        self.failUnlessEqual(summaries[PLACES]['fetched'], len(cells) - 1)
+        self.failUnlessEqual(progress[-1], (PLACES, len(cells), len(cells)))
+        self.failUnlessEqual(len(progress), 9 + len(cells))
+        requests = self.mockhttp.request.call_count
+
+        # Every point is answered from the cache now.
+        self.client.context.get_context(37.7012, -122.4991)
+        self.failUnlessEqual(self.mockhttp.request.call_count, requests)
+
+        # A second sweep fetches only what couldn't be cached.
+        summaries = warm(self.client, BBOX)
+        self.failUnlessEqual(summaries[CONTEXT]['cached'], 9)
+        self.failUnlessEqual(summaries[PLACES]['cached'], len(cells) - 1)
+        self.failUnlessEqual(self.mockhttp.request.call_count, requests + 1)
+
+        self.assertRaises(ValueError, warm, self.client, BBOX, context_precision=4)
+        self.assertRaises(ValueError, warm, self.client, BBOX, endpoints=['storage'])
+
+    def test_warm_rate_limited(self):
+        waits = []
+        limiter = RateLimiter(100, clock=lambda: 0.0, sleep=waits.append)
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, rate_limiter=limiter)
+        client.context.http = self.mockhttp
+        warm(client, BBOX, endpoints=[CONTEXT])
+        self.failUnlessEqual(len(waits), 8)
+
+    def test_main(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'context.cache')
+            argv = ['--key', 'k', '--secret', 's', '--quiet',
+                    '--context-cache', path, '--'] + map(str, BBOX)
+            def client(*args, **kwargs):
+                client = Client(*args, **kwargs)
+                client.context.http = self.mockhttp
+                return client
+            with mock.patch('simplegeo.warm.Client', side_effect=client):
+                with mock.patch('sys.stderr'):
+                    self.failUnlessEqual(main(argv), 0)
+            self.failUnlessEqual(self.mockhttp.request.call_count, 9)
+
+            cache = ContextCache()
+            self.failUnlessEqual(cache.load(open(path, 'rb')), 9)
+            self.failUnless(cache.key(37.701, -122.499) in cache)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -1,16 +1,116 @@
+from __future__ import division
+
 import re
+import math
 import ipaddr
 import simplegeo.json as json
 from decimal import Decimal as D
 
-def json_decode(jsonstr):
+class _OrderedDict(dict):
+    """
+    As much of collections.OrderedDict, which Python 2.6 doesn't have,
+    as this library uses: the keys are kept in a doubly linked list,
+    in the order they were added.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self._links = {}
+        self._root = root = []
+        root[:] = [root, root, None]
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._links[key] = [last, root, key]
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        prev, next, key = self._links.pop(key)
+        prev[1] = next
+        next[0] = prev
+
+    def __iter__(self):
+        root = self._root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def update(self, other):
+        if hasattr(other, 'keys'):
+            other = ((key, other[key]) for key in other.keys())
+        for key, value in other:
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError('dictionary is empty')
+        if last:
+            key = self._root[0][2]
+        else:
+            key = self._root[1][2]
+        return key, self.pop(key)
+
+    def clear(self):
+        dict.clear(self)
+        self._links.clear()
+        root = self._root
+        root[:] = [root, root, None]
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6.
+    OrderedDict = _OrderedDict
+
+def json_decode(jsonstr, numeric=json.DECIMAL):
+    """
+    numeric is json.DECIMAL or json.FLOAT, and says what type
+    numbers in jsonstr are decoded to.
+    """
+    json.check_numeric_mode(numeric)
     try:
-        return json.loads(jsonstr)
+        return json.loads(jsonstr, numeric=numeric)
     except (ValueError, TypeError), le:
         raise DecodeError(jsonstr, le)
 
+# float comes first since that's the common case when decoding with
+# json.FLOAT, and isinstance() stops at the first match.
+_NUMERIC_TYPES = (float, int, long, D)
+
 def is_numeric(x):
-    return isinstance(x, (int, long, float, D))
+    return isinstance(x, _NUMERIC_TYPES)
 
 def swap(tupleab):
     return (tupleab[1], tupleab[0])
@@ -74,13 +174,147 @@ def deep_validate_lat_lon(struc, strict_lon_validation=False):
             deep_validate_lat_lon(sub, strict_lon_validation=strict_lon_validation)
     return True
 
-def is_valid_ip(ip):
+"""Validation policies.
+
+VALIDATE_STRICT checks everything, and is what you want for data you
+built yourself. VALIDATE_TRUSTED is meant for data that came straight
+from the API: it skips the range checks on coordinates and the regex
+match on simplegeohandles, which the server has already done, but
+keeps the cheap type checks. VALIDATE_OFF skips all checks.
+"""
+VALIDATE_STRICT = 'strict'
+VALIDATE_TRUSTED = 'trusted'
+VALIDATE_OFF = 'off'
+VALIDATION_POLICIES = (VALIDATE_STRICT, VALIDATE_TRUSTED, VALIDATE_OFF)
+
+def check_validation_policy(validation):
+    if validation not in VALIDATION_POLICIES:
+        raise ValueError("validation is required to be one of %s, not: %r" % (', '.join(VALIDATION_POLICIES), validation))
+    return validation
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def distance(lat1, lon1, lat2, lon2):
+    """Return the great-circle distance in kilometers between two
+    points, by the haversine formula."""
+    lat1, lon1, lat2, lon2 = [math.radians(float(x)) for x in (lat1, lon1, lat2, lon2)]
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def split_bbox(sw_lat, sw_lon, ne_lat, ne_lon, rows=2, cols=2):
+    """
+    Split a bounding box into a grid of rows x cols smaller ones,
+    returned as a list of (sw_lat, sw_lon, ne_lat, ne_lon) tuples
+    going from south-west to north-east. The outer edges are exactly
+    the ones passed in.
+    """
+    if rows < 1 or cols < 1:
+        raise ValueError("rows and cols must be at least 1, not %r, %r" % (rows, cols))
+    lats = [sw_lat + (ne_lat - sw_lat) * i / rows for i in range(rows)] + [ne_lat]
+    lons = [sw_lon + (ne_lon - sw_lon) * i / cols for i in range(cols)] + [ne_lon]
+    return [(lats[r], lons[c], lats[r + 1], lons[c + 1])
+            for r in range(rows) for c in range(cols)]
+
+def feature_key(feature):
+    """
+    Return what identifies a feature from a response: its id, or for
+    Context features, which don't have one, its handle or href.
+    """
+    return feature.get('id') or feature.get('handle') or feature.get('href')
+
+def merge_features(feature_lists):
+    """
+    Concatenate lists of features, leaving out any feature with the
+    same feature_key() as one which came before it.
+    """
+    seen = set()
+    merged = []
+    for features in feature_lists:
+        for feature in features:
+            feature_id = feature_key(feature)
+            if feature_id is not None:
+                if feature_id in seen:
+                    continue
+                seen.add(feature_id)
+            merged.append(feature)
+    return merged
+
+_OCTET = r'(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])'
+_IPV4_RE = re.compile(r'(?:%s\.){3}%s\Z' % (_OCTET, _OCTET))
+_IPV6_GROUP_RE = re.compile(r'[0-9a-fA-F]{1,4}\Z')
+
+def _ipv6_groups(ip):
+    """
+    Return the eight groups of hex digits of the IPv6 address ip, with
+    any '::' filled in with '0's, or None if ip isn't written as just
+    groups of hex digits with at most one '::'. Addresses written any
+    other way (with an IPv4 address at the end, say) are left to
+    ipaddr.
+    """
+    halves = ip.split('::')
+    if len(halves) > 2:
+        return None
+    groups = [half and half.split(':') or [] for half in halves]
+    for half in groups:
+        for group in half:
+            if not _IPV6_GROUP_RE.match(group):
+                return None
+    if len(groups) == 1:
+        return len(groups[0]) == 8 and groups[0] or None
+    missing = 8 - len(groups[0]) - len(groups[1])
+    if missing < 1:
+        return None
+    return groups[0] + ['0'] * missing + groups[1]
+
+def _parse_ip(ip):
+    """
+    Return (version, address as an integer) for the IP address ip, or
+    None if it isn't one. The usual ways of writing addresses are
+    parsed here; ipaddr gets the rest, and decides the same way it
+    always did.
+    """
+    if isinstance(ip, basestring):
+        if _IPV4_RE.match(ip):
+            a, b, c, d = ip.split('.')
+            return 4, int(a) << 24 | int(b) << 16 | int(c) << 8 | int(d)
+        if ':' in ip:
+            groups = _ipv6_groups(ip)
+            if groups is not None:
+                return 6, int(''.join(groups[i].zfill(4) for i in range(8)), 16)
+        elif '.' not in ip:
+            return None
     try:
-        ipaddr.IPAddress(ip)
+        address = ipaddr.IPAddress(ip)
     except ValueError:
-        return False
-    else:
+        return None
+    return address.version, int(address)
+
+def is_valid_ip(ip):
+    # Checked without making an ipaddr.IPAddress when it's written the
+    # usual way, which is the common case and a lot quicker.
+    if isinstance(ip, basestring) and (
+        _IPV4_RE.match(ip) or (':' in ip and _ipv6_groups(ip) is not None)):
         return True
+    return _parse_ip(ip) is not None
+
+def ip_network(ip, v4_prefix=32, v6_prefix=128):
+    """
+    Return (version, network, prefix) for the IP address ip, where
+    network is the first prefix bits of it as an integer, and prefix
+    is v4_prefix for an IPv4 address and v6_prefix for an IPv6
+    one. Addresses in the same network give the same tuple; with the
+    default prefixes, only the same address does, however it's
+    written.
+    """
+    parsed = _parse_ip(ip)
+    if parsed is None:
+        raise ValueError("Address %s is not a valid IP" % (ip,))
+    version, n = parsed
+    if version == 4:
+        return version, n >> (32 - v4_prefix), v4_prefix
+    return version, n >> (128 - v6_prefix), v6_prefix
 
 SIMPLEGEOHANDLE_RSTR=r"""SG_[A-Za-z0-9]{22}(?:_-?[0-9]{1,3}(?:\.[0-9]+)?_-?[0-9]{1,3}(?:\.[0-9]+)?)?(?:@-?[0-9]+)?$"""
 SIMPLEGEOHANDLE_R= re.compile(SIMPLEGEOHANDLE_RSTR)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""Filling caches ahead of time.
+
+warm() sweeps a region, asking for every context point and every
+places cell in it, so that the client's caches can answer for the
+whole region afterwards. Caches can be written out with their dump()
+method and read back in by other processes with load().
+
+It can be run from the command line too:
+
+    python -m simplegeo.warm --context-cache context.cache \\
+        --places-cache places.cache --rate 10 -- 37.7 -122.5 37.8 -122.4
+
+(the -- keeps negative coordinates from being taken for options),
+which resumes from (and rewrites) the cache files if they exist.
+"""
+
+import os
+import sys
+import math
+import optparse
+
+from simplegeo import Client, geohash
+from simplegeo.cache import ContextCache, GeohashCache
+from simplegeo.concurrency import RateLimiter, imap
+from simplegeo.util import APIError, _assert_valid_lat, _assert_valid_lon
+
+CONTEXT = 'context'
+PLACES = 'places'
+ENDPOINTS = (CONTEXT, PLACES)
+
+
+def _grid(sw_lat, sw_lon, ne_lat, ne_lon, precision):
+    scale = 10 ** precision
+    lats = range(int(math.ceil(float(sw_lat) * scale)),
+                 int(math.floor(float(ne_lat) * scale)) + 1)
+    lons = range(int(math.ceil(float(sw_lon) * scale)),
+                 int(math.floor(float(ne_lon) * scale)) + 1)
+    return scale, lats, lons
+
+def context_points(sw_lat, sw_lon, ne_lat, ne_lon, precision):
+    """Return the points in the box which a ContextCache with the
+    given precision rounds to, south west first, lazily."""
+    scale, lats, lons = _grid(sw_lat, sw_lon, ne_lat, ne_lon, precision)
+    return ((round(lat / float(scale), precision),
+             round(lon / float(scale), precision))
+            for lat in lats for lon in lons)
+
+
+def warm_context(client, bbox, filter=None, context_args=None,
+                 concurrency=4, progress=None):
+    """
+    Look up every point in bbox which client.context_cache rounds to,
+    skipping those already cached. Returns a summary dict.
+    """
+    cache = client.context_cache
+    scale, lats, lons = _grid(*bbox, precision=cache.precision)
+    summary = {'total': len(lats) * len(lons),
+               'cached': 0, 'fetched': 0, 'failed': 0}
+
+    def fetch(point):
+        if cache.key(point[0], point[1], filter, context_args) in cache:
+            return 'cached'
+        try:
+            client._thread_client().get_context(point[0], point[1], filter=filter,
+                                                context_args=context_args)
+        except APIError:
+            return 'failed'
+        return 'fetched'
+
+    points = context_points(*bbox, precision=cache.precision)
+    for done, outcome in enumerate(imap(fetch, points, concurrency)):
+        summary[outcome] += 1
+        if progress is not None:
+            progress(CONTEXT, done + 1, summary['total'])
+    return summary
+
+def warm_places(client, bbox, query=None, category=None, concurrency=4,
+                progress=None):
+    """
+    Fetch every geohash cell of client.search_cache which overlaps
+    bbox, skipping those already cached. Cells too full to be cached
+    are counted as dense. Returns a summary dict.
+    """
+    cache = client.search_cache
+    cells = geohash.covering(*bbox, precision=cache.precision)
+    summary = {'total': len(cells), 'cached': 0, 'fetched': 0,
+               'dense': 0, 'failed': 0}
+
+    def fetch(cell):
+        key = cache.key(cell, query, category)
+        if key in cache:
+            return 'cached'
+        try:
+            features = client._thread_client()._fetch_cell(cell, query, category)
+        except APIError:
+            return 'failed'
+        if features is None:
+            return 'dense'
+        cache.set(key, features)
+        return 'fetched'
+
+    for done, outcome in enumerate(imap(fetch, cells, concurrency)):
+        summary[outcome] += 1
+        if progress is not None:
+            progress(PLACES, done + 1, summary['total'])
+    return summary
+
+def _new_cache(cls, precision):
+    if precision is None:
+        return cls()
+    return cls(precision=precision)
+
+def warm(client, bbox, endpoints=ENDPOINTS, context_precision=None,
+         places_precision=None, filter=None, context_args=None,
+         query=None, category=None, concurrency=4, progress=None):
+    """
+    Warm the caches of client, a simplegeo.Client, for bbox, a
+    (sw_lat, sw_lon, ne_lat, ne_lon) tuple. endpoints says which of
+    CONTEXT and PLACES to warm. A subclient without a cache is given
+    one, with the given precision if there is one; a precision which
+    doesn't match an existing cache's is an error, since that cache
+    would never use what was fetched.
+
+    Requests go out concurrency at a time, through the client's
+    rate_limiter if it has one. progress, if given, is called as
+    progress(endpoint, done, total) after each point or cell. Returns
+    a dict of summaries, by endpoint, of how many points or cells were
+    already cached, fetched, or failed.
+    """
+    sw_lat, sw_lon, ne_lat, ne_lon = bbox
+    _assert_valid_lat(sw_lat)
+    _assert_valid_lat(ne_lat)
+    _assert_valid_lon(sw_lon)
+    _assert_valid_lon(ne_lon)
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            raise ValueError("endpoints are required to be among %s, not: %r" % (', '.join(ENDPOINTS), endpoint))
+
+    summaries = {}
+    if CONTEXT in endpoints:
+        context = client.context
+        if context.context_cache is None:
+            context.context_cache = _new_cache(ContextCache, context_precision)
+        elif context_precision not in (None, context.context_cache.precision):
+            raise ValueError("context_precision %r doesn't match the context cache's precision %r" % (context_precision, context.context_cache.precision))
+        summaries[CONTEXT] = warm_context(context, bbox, filter=filter,
+                                          context_args=context_args,
+                                          concurrency=concurrency,
+                                          progress=progress)
+    if PLACES in endpoints:
+        places = client.places12
+        if places.search_cache is None:
+            places.search_cache = _new_cache(GeohashCache, places_precision)
+        elif places_precision not in (None, places.search_cache.precision):
+            raise ValueError("places_precision %r doesn't match the search cache's precision %r" % (places_precision, places.search_cache.precision))
+        summaries[PLACES] = warm_places(places, bbox, query=query,
+                                        category=category,
+                                        concurrency=concurrency,
+                                        progress=progress)
+    return summaries
+
+
+def _load(cache, path):
+    if os.path.exists(path):
+        fp = open(path, 'rb')
+        try:
+            cache.load(fp)
+        finally:
+            fp.close()
+    return cache
+
+def _save(cache, path):
+    # Write to the side and rename, so that a worker never reads a
+    # half written file.
+    tmp = path + '.tmp'
+    fp = open(tmp, 'wb')
+    try:
+        cache.dump(fp)
+    finally:
+        fp.close()
+    os.rename(tmp, path)
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage="%prog [options] -- SW_LAT SW_LON NE_LAT NE_LON")
+    parser.add_option('--key', default=os.environ.get('SIMPLEGEO_KEY'),
+                      help="OAuth key (default $SIMPLEGEO_KEY)")
+    parser.add_option('--secret', default=os.environ.get('SIMPLEGEO_SECRET'),
+                      help="OAuth secret (default $SIMPLEGEO_SECRET)")
+    parser.add_option('--context-cache', metavar='FILE',
+                      help="warm context lookups, keeping them in FILE")
+    parser.add_option('--context-precision', type='int',
+                      help="decimal places context points are rounded to (default 3)")
+    parser.add_option('--filter', help="context filter")
+    parser.add_option('--places-cache', metavar='FILE',
+                      help="warm places searches, keeping them in FILE")
+    parser.add_option('--places-precision', type='int',
+                      help="geohash length of places cells (default 6)")
+    parser.add_option('--query', help="places query")
+    parser.add_option('--category', help="places category")
+    parser.add_option('--concurrency', type='int', default=4,
+                      help="requests in flight at once (default 4)")
+    parser.add_option('--rate', type='float',
+                      help="requests per second (default unlimited)")
+    parser.add_option('--quiet', action='store_true',
+                      help="don't report progress")
+    options, args = parser.parse_args(argv)
+    if len(args) != 4:
+        parser.error("a bounding box is required")
+    if not (options.key and options.secret):
+        parser.error("--key and --secret are required")
+    if not (options.context_cache or options.places_cache):
+        parser.error("at least one of --context-cache and --places-cache is required")
+    try:
+        bbox = tuple(float(arg) for arg in args)
+    except ValueError:
+        parser.error("the bounding box is required to be four numbers")
+
+    rate_limiter = options.rate and RateLimiter(options.rate, burst=options.concurrency) or None
+    client = Client(options.key, options.secret, rate_limiter=rate_limiter)
+    endpoints = []
+    if options.context_cache:
+        endpoints.append(CONTEXT)
+        client.context.context_cache = _load(
+            _new_cache(ContextCache, options.context_precision),
+            options.context_cache)
+    if options.places_cache:
+        endpoints.append(PLACES)
+        client.places12.search_cache = _load(
+            _new_cache(GeohashCache, options.places_precision),
+            options.places_cache)
+
+    def progress(endpoint, done, total):
+        if not options.quiet and (done == total or done % 100 == 0):
+            sys.stderr.write("%s: %d/%d\n" % (endpoint, done, total))
+
+    try:
+        summaries = warm(client, bbox, endpoints=endpoints,
+                         filter=options.filter, query=options.query,
+                         category=options.category,
+                         concurrency=options.concurrency, progress=progress)
+    finally:
+        # Whatever was fetched before an interruption is kept.
+        if options.context_cache:
+            _save(client.context.context_cache, options.context_cache)
+        if options.places_cache:
+            _save(client.places12.search_cache, options.places_cache)
+    for endpoint in endpoints:
+        sys.stderr.write("%s: %s\n" % (endpoint, ', '.join(
+                    '%s %d' % item for item in sorted(summaries[endpoint].items()))))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())